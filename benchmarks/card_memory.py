@@ -0,0 +1,62 @@
+# Memory of a deck's cards as plain dicts, as __slots__ objects and as
+# CardColumns, measured with tracemalloc:
+#   python benchmarks/card_memory.py [COUNT ...]
+import os
+import random
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flashcards.cards import CardColumns, FlashCard
+
+WORDS = ['maison', 'été', 'château', 'forêt', 'cœur', 'élève', 'fenêtre', 'garçon',
+         'hôpital', 'œuvre', 'rivière', 'voiture', 'soleil', 'journée', 'école']
+
+
+def make_rows(count, seed=0):
+    # French-style questions and 24-character answers
+    rng = random.Random(seed)
+    rows = []
+    for i in range(count):
+        question = f"Que veut dire « {' '.join(rng.choices(WORDS, k=3))} » ? ({i})"
+        answer = ''.join(rng.choices('abcdefghijklmnopqrstuvwxyz ', k=24))
+        rows.append((question, answer))
+    return rows
+
+
+def as_dicts(rows):
+    return [{'question': q, 'answer': a, 'due': 0.0, 'interval': 0.0, 'ease': 2.5, 'reps': 0}
+            for q, a in rows]
+
+
+def as_slots(rows):
+    return [FlashCard(q, a) for q, a in rows]
+
+
+def as_columns(rows):
+    return CardColumns.from_rows((q, a, 0.0, 0.0, 2.5, 0) for q, a in rows)
+
+
+def measure(build, rows):
+    # Bytes still allocated once build returns; it gets fresh copies of the
+    # strings, so representations that keep them pay for them
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build([(q.encode('utf-8').decode('utf-8'), a.encode('utf-8').decode('utf-8')) for q, a in rows])
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del result
+    return size
+
+
+def main(counts):
+    print(f"{'cards':>8}  {'dict objects':>12}  {'__slots__':>10}  {'CardColumns':>11}")
+    for count in counts:
+        rows = make_rows(count)
+        sizes = [measure(build, rows) / 1e6 for build in (as_dicts, as_slots, as_columns)]
+        print(f"{count:>8}  {sizes[0]:>9.2f} MB  {sizes[1]:>7.2f} MB  {sizes[2]:>8.2f} MB")
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or [1000, 10000, 100000])
@@ -0,0 +1,72 @@
+# Snapshot size, time to open a library and time to read one deck's cards,
+# for the JSON and binary storages, with the cards spread over ten decks:
+#   python benchmarks/snapshot_load.py [COUNT ...]
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from card_memory import make_rows
+from flashcards import BinaryStorage, FlashCardManager, JsonStorage
+from flashcards.cards import new_id
+
+DECKS = 10
+
+
+def json_storage(path):
+    return JsonStorage(os.path.join(path, 'f.json'), os.path.join(path, 'f.journal'),
+                       os.path.join(path, 'f.index.json'))
+
+
+def binary_storage(path):
+    return BinaryStorage(os.path.join(path, 'f.bin'), os.path.join(path, 'f.bin.journal'),
+                         os.path.join(path, 'f.json'), os.path.join(path, 'f.journal'))
+
+
+def build(make_storage, path, rows):
+    manager = FlashCardManager(make_storage(path))
+    for i in range(1, DECKS):
+        manager.add_deck(f'Deck {i}')
+    size = len(rows) // DECKS
+    for i in range(DECKS):
+        chunk = [list(row) for row in rows[i * size:(i + 1) * size]]
+        manager.commit({'op': 'add_cards', 'deck': i, 'cards': chunk, 'ids': [new_id() for _ in chunk]})
+    manager.save_decks()
+    manager.storage.close()
+    return os.path.getsize(manager.storage.data_file)
+
+
+def measure(make_storage, path):
+    # Best of three, each from a fresh storage
+    best_open = best_deck = float('inf')
+    for _ in range(3):
+        start = time.perf_counter()
+        manager = FlashCardManager(make_storage(path))
+        opened = time.perf_counter()
+        manager.deck_cards(DECKS - 1)
+        loaded = time.perf_counter()
+        manager.storage.close()
+        best_open = min(best_open, opened - start)
+        best_deck = min(best_deck, loaded - opened)
+    return best_open, best_deck
+
+
+def main(counts):
+    print(f"{'cards':>8}  {'storage':<7}  {'size':>9}  {'open':>9}  {'one deck':>9}")
+    for count in counts:
+        rows = make_rows(count)
+        for label, make_storage in (('json', json_storage), ('binary', binary_storage)):
+            path = tempfile.mkdtemp()
+            try:
+                size = build(make_storage, path, rows)
+                opened, loaded = measure(make_storage, path)
+            finally:
+                shutil.rmtree(path)
+            print(f"{count:>8}  {label:<7}  {size / 1e6:>6.2f} MB  {opened * 1e3:>6.1f} ms  {loaded * 1e3:>6.1f} ms")
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or [10000, 100000, 500000])
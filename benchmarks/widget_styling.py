@@ -0,0 +1,161 @@
+# Cost of building the styled widgets of main.py, without a window: Kivy
+# is replaced by counting stubs, so the timings cover only the Python side
+# of each widget and the counts show the canvas instructions and theme
+# lookups it makes.
+#   python benchmarks/widget_styling.py [COUNT]
+import os
+import sys
+import time
+import types
+from collections import Counter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+calls = Counter()
+
+
+class Instruction:
+    def __init__(self, *args, **kwargs):
+        calls[type(self).__name__] += 1
+        for name, value in kwargs.items():
+            setattr(self, name, value)
+
+
+class Color(Instruction):
+    pass
+
+
+class Rectangle(Instruction):
+    pass
+
+
+class RoundedRectangle(Instruction):
+    pass
+
+
+class CanvasGroup:
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        return False
+
+
+class Canvas:
+    def __init__(self):
+        self.before = CanvasGroup()
+        self.after = CanvasGroup()
+
+
+class Widget:
+    def __init__(self, **kwargs):
+        self.pos = (0, 0)
+        self.size = (100, 100)
+        self.children = []
+        self.canvas = Canvas()
+        for name, value in kwargs.items():
+            setattr(self, name, value)
+    
+    def bind(self, **kwargs):
+        calls['bind'] += len(kwargs)
+    
+    def add_widget(self, widget):
+        self.children.append(widget)
+    
+    def clear_widgets(self):
+        self.children = []
+    
+    def setter(self, name):
+        return lambda instance, value: setattr(self, name, value)
+
+
+class RecycleDataViewBehavior:
+    def refresh_view_attrs(self, rv, index, data):
+        pass
+
+
+class Clock:
+    @staticmethod
+    def schedule_once(callback, timeout=0):
+        pass
+    
+    @staticmethod
+    def create_trigger(callback, timeout=0):
+        return lambda *args: None
+
+
+class Window:
+    width = 800
+    size = (800, 600)
+    
+    @staticmethod
+    def bind(**kwargs):
+        pass
+
+
+def dp(value):
+    calls['dp'] += 1
+    return float(value)
+
+
+def get_color_from_hex(text):
+    calls['get_color_from_hex'] += 1
+    return [int(text[i:i + 2], 16) / 255 for i in (1, 3, 5)] + [1.0]
+
+
+def widget_class(name):
+    return type(name, (Widget,), {})
+
+
+def install_stubs():
+    modules = {
+        'kivy': {},
+        'kivy.app': {'App': widget_class('App')},
+        'kivy.uix': {},
+        'kivy.uix.screenmanager': {'ScreenManager': widget_class('ScreenManager'), 'Screen': widget_class('Screen'),
+                                   'SlideTransition': widget_class('SlideTransition')},
+        'kivy.uix.boxlayout': {'BoxLayout': widget_class('BoxLayout')},
+        'kivy.uix.button': {'Button': widget_class('Button')},
+        'kivy.uix.label': {'Label': widget_class('Label')},
+        'kivy.uix.textinput': {'TextInput': widget_class('TextInput')},
+        'kivy.uix.checkbox': {'CheckBox': widget_class('CheckBox')},
+        'kivy.uix.scrollview': {'ScrollView': widget_class('ScrollView')},
+        'kivy.uix.popup': {'Popup': widget_class('Popup')},
+        'kivy.uix.image': {'Image': widget_class('Image')},
+        'kivy.uix.filechooser': {'FileChooserListView': widget_class('FileChooserListView')},
+        'kivy.clock': {'Clock': Clock},
+        'kivy.uix.recycleview': {'RecycleView': widget_class('RecycleView')},
+        'kivy.uix.recycleview.views': {'RecycleDataViewBehavior': RecycleDataViewBehavior},
+        'kivy.uix.recycleboxlayout': {'RecycleBoxLayout': widget_class('RecycleBoxLayout')},
+        'kivy.core': {},
+        'kivy.core.window': {'Window': Window},
+        'kivy.core.text': {'Label': widget_class('CoreLabel')},
+        'kivy.graphics': {'Color': Color, 'Rectangle': Rectangle, 'RoundedRectangle': RoundedRectangle},
+        'kivy.metrics': {'dp': dp},
+        'kivy.utils': {'get_color_from_hex': get_color_from_hex},
+    }
+    for name, attributes in modules.items():
+        module = types.ModuleType(name)
+        module.__dict__.update(attributes)
+        sys.modules[name] = module
+
+
+def main(count):
+    install_stubs()
+    import main as app
+    
+    print(f"{'widget':<16} {'us/widget':>9}  per widget")
+    for cls in (app.PrimaryButton, app.StyledLabel, app.StyledTextInput, app.CardWidget, app.DeckWidget):
+        # Theme tables were resolved at import; count only what building costs
+        calls.clear()
+        start = time.perf_counter()
+        for _ in range(count):
+            cls()
+        elapsed = (time.perf_counter() - start) / count * 1e6
+        per_widget = ', '.join(f'{name} {calls[name] / count:g}' for name in sorted(calls))
+        print(f"{cls.__name__:<16} {elapsed:>9.1f}  {per_widget or '-'}")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
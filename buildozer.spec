@@ -19,6 +19,9 @@ source.include_exts = py,png,jpg,kv,atlas,json,ttf
 
 source.include_patterns = images/
 
+# (list) Source directories to exclude (let empty to not exclude anything)
+source.exclude_dirs = benchmarks, tests
+
 
 # (str) Application versioning (method 1)
 version = 0.1
@@ -30,6 +33,7 @@ requirements = python3,
     materialyoucolor,
     materialshapes,
     pillow,
+    sqlite3,
     exceptiongroup,
     asyncgui,
     asynckivy,
@@ -0,0 +1,19 @@
+# Data layer of the flashcard app: cards, storage, scheduling, search and
+# import/export. Nothing here imports Kivy, so it can run headless; search
+# and import/export modules are loaded on first use to keep import cheap.
+from .cards import CardColumns, FlashCard
+from .manager import FlashCardManager
+from .scheduler import StudySession, sm2_review
+from .storage import BinaryStorage, JsonStorage, SqliteStorage, WriteBehindStorage
+
+__all__ = [
+    'BinaryStorage',
+    'CardColumns',
+    'FlashCard',
+    'FlashCardManager',
+    'JsonStorage',
+    'SqliteStorage',
+    'StudySession',
+    'WriteBehindStorage',
+    'sm2_review',
+]
@@ -0,0 +1,187 @@
+import argparse
+import os
+import sys
+
+from .manager import FlashCardManager
+from .storage import BinaryStorage, JsonStorage, SqliteStorage
+
+
+def add_library_arguments(parser):
+    parser.add_argument('--data-file', default='flashcards.json')
+    parser.add_argument('--sqlite', metavar='DB_FILE', help='use a SQLite library instead')
+    parser.add_argument('--binary', metavar='BIN_FILE', help='use a binary snapshot library instead')
+
+
+def library_files(args):
+    # Files any of which holds a library, backups and files migrated on
+    # first open included
+    if args.sqlite:
+        return [args.sqlite, args.data_file]
+    if args.binary:
+        return [args.binary, args.binary + '.journal', args.binary + '.1', args.data_file]
+    stem = os.path.splitext(args.data_file)[0]
+    return [args.data_file, stem + '.journal', args.data_file + '.1']
+
+
+def open_existing_library(args):
+    # For commands that only read: None if there is no library, instead of
+    # a new one with a default deck
+    if not any(os.path.exists(path) for path in library_files(args)):
+        print(f"No library found at {args.sqlite or args.binary or args.data_file}", file=sys.stderr)
+        return None
+    return open_library(args)
+
+
+def open_library(args):
+    if args.sqlite:
+        return SqliteStorage(args.sqlite, legacy_file=args.data_file)
+    if args.binary:
+        return BinaryStorage(args.binary, args.binary + '.journal', legacy_file=args.data_file)
+    stem = os.path.splitext(args.data_file)[0]
+    return JsonStorage(args.data_file, stem + '.journal', stem + '.index.json')
+
+
+def export_main(argv):
+    # Headless backup: python -m flashcards export OUTPUT [options]
+    parser = argparse.ArgumentParser(prog='python -m flashcards export', description='Export flashcards as CSV or JSON Lines.')
+    parser.add_argument('output')
+    parser.add_argument('--format', choices=['csv', 'jsonl'], default='csv')
+    parser.add_argument('--deck', action='append', help='deck name to export (repeatable, default: all)')
+    parser.add_argument('--gzip', action='store_true', default=None)
+    add_library_arguments(parser)
+    args = parser.parse_args(argv)
+    
+    storage = open_existing_library(args)
+    if storage is None:
+        return 1
+    manager = FlashCardManager(storage, read_only=True)
+    deck_indices = None
+    if args.deck:
+        deck_indices = [i for i, deck in enumerate(manager.decks) if deck['name'] in args.deck]
+    count = manager.export_decks(args.output, args.format, deck_indices, args.gzip)
+    storage.close()
+    print(f"Exported {count} cards to {args.output}")
+    return 0
+
+
+def pack_main(argv):
+    # Builds a read-only deck file for FlashCardManager.mount_deck
+    from .binary import write_deck_file
+    from .cards import CardColumns
+    from .importer import read_card_rows
+    
+    parser = argparse.ArgumentParser(prog='python -m flashcards pack', description='Pack a CSV, TSV or Anki text file into a deck file for mounting.')
+    parser.add_argument('input')
+    parser.add_argument('output')
+    parser.add_argument('--name', help='deck name (default: input file name)')
+    args = parser.parse_args(argv)
+    
+    name = args.name or os.path.splitext(os.path.basename(args.input))[0]
+    cards = CardColumns.from_rows(row + (0.0, 0.0, 2.5, 0) for row in read_card_rows(args.input) if row is not None)
+    write_deck_file(args.output, name, cards)
+    print(f"Packed {len(cards)} cards into {args.output}")
+
+
+def serve_main(argv):
+    # Reference sync server, e.g. for a home network or for testing
+    from .sync import SyncServer, http_server
+    
+    parser = argparse.ArgumentParser(prog='python -m flashcards serve', description='Run a sync server.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--data', default='flashcards-server.jsonl', help='file keeping the synced changes')
+    args = parser.parse_args(argv)
+    
+    server = http_server(SyncServer(args.data), args.host, args.port)
+    print(f"Serving sync on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+
+
+def sync_main(argv):
+    from .sync import HttpTransport, SyncClient
+    
+    parser = argparse.ArgumentParser(prog='python -m flashcards sync', description='Sync a library with a sync server.')
+    parser.add_argument('url')
+    add_library_arguments(parser)
+    args = parser.parse_args(argv)
+    
+    storage = open_library(args)
+    manager = FlashCardManager(storage)
+    stem = os.path.splitext(args.sqlite or args.binary or args.data_file)[0]
+    client = SyncClient(manager, HttpTransport(args.url), stem + '.sync.json', stem + '.sync.log')
+    try:
+        pulled, pushed = client.sync()
+    finally:
+        storage.close()
+    print(f"Pulled {pulled} changes, pushed {pushed}")
+
+
+def stats_main(argv):
+    from .analytics import RETENTION_BOUNDS, ReviewStats, due_forecast
+    
+    parser = argparse.ArgumentParser(prog='python -m flashcards stats', description='Print review statistics.')
+    parser.add_argument('--reviews', default='flashcards.reviews', help='review log file')
+    parser.add_argument('--days', type=int, default=14, help='days of due forecast')
+    add_library_arguments(parser)
+    args = parser.parse_args(argv)
+    
+    storage = open_existing_library(args)
+    if storage is None:
+        return 1
+    manager = FlashCardManager(storage, read_only=True)
+    summary = ReviewStats(args.reviews).summary
+    streak, longest = summary.streaks()
+    print(f"Reviews: {summary.reviews}, today: {summary.today()}")
+    print(f"Streak: {streak} days, longest: {longest} days")
+    if summary.mean_response_time() is not None:
+        print(f"Mean response time: {summary.mean_response_time():.1f} s")
+    
+    print("Retention by scheduled interval:")
+    labels = [f"<= {bound} d" for bound in RETENTION_BOUNDS] + [f"> {RETENTION_BOUNDS[-1]} d"]
+    for label, (reviews, recalled) in zip(labels, summary.retention):
+        if reviews:
+            print(f"  {label:>8}: {recalled / reviews:6.1%} of {reviews}")
+    
+    print("Accuracy by deck:")
+    for deck_id, (reviews, recalled) in summary.decks.items():
+        deck = manager.decks_by_id.get(deck_id)
+        name = deck['name'] if deck else f"(deleted deck {deck_id})"
+        print(f"  {name}: {recalled / reviews:.1%} of {reviews}")
+    
+    print("Due forecast:")
+    try:
+        forecast = due_forecast(manager, args.days)
+    finally:
+        storage.close()
+    for day, count in enumerate(forecast):
+        print(f"  +{day} d: {count}")
+    return 0
+
+
+def main(argv):
+    if argv[:1] == ['export']:
+        return export_main(argv[1:])
+    elif argv[:1] == ['pack']:
+        pack_main(argv[1:])
+    elif argv[:1] == ['serve']:
+        serve_main(argv[1:])
+    elif argv[:1] == ['sync']:
+        sync_main(argv[1:])
+    elif argv[:1] == ['stats']:
+        return stats_main(argv[1:])
+    else:
+        print('usage: python -m flashcards export OUTPUT [options]')
+        print('       python -m flashcards pack INPUT OUTPUT [--name NAME]')
+        print('       python -m flashcards serve [--host HOST] [--port PORT] [--data FILE]')
+        print('       python -m flashcards sync URL [options]')
+        print('       python -m flashcards stats [--reviews FILE] [options]')
+        return 2
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
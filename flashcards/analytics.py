@@ -0,0 +1,259 @@
+import bisect
+import json
+import os
+import time
+from collections import Counter
+from itertools import islice
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from .reviewlog import CHUNK_HEADER, ROW_SIZE, ReviewLog
+
+
+DAY = 86400
+# Upper bounds, in days, of the scheduled intervals grouped by the
+# retention curve; longer intervals share one last bucket
+RETENTION_BOUNDS = (1, 3, 7, 14, 30, 90, 180, 365)
+# SM-2 qualities counted as recalled
+PASSING_GRADE = 3
+
+
+def local_offset(now=None):
+    # Days are counted in local time, with the offset in force now
+    return time.localtime(now).tm_gmtoff
+
+
+def day_number(timestamp, offset):
+    return int((timestamp + offset) // DAY)
+
+
+def column_view(values, start=0):
+    # Zero-copy numpy view of a log column; the view must not outlive the
+    # call, or the array could no longer grow
+    return numpy.frombuffer(values, dtype=values.typecode)[start:]
+
+
+def retention_curve(columns, start=0):
+    # [reviews, recalled] per interval bucket, for reviews of cards that
+    # had been scheduled (new and relearning cards have interval 0)
+    buckets = len(RETENTION_BOUNDS) + 1
+    if numpy is not None:
+        interval = column_view(columns['interval'], start)
+        grade = column_view(columns['grade'], start)
+        scheduled = interval > 0
+        bucket = numpy.searchsorted(RETENTION_BOUNDS, interval[scheduled])
+        reviews = numpy.bincount(bucket, minlength=buckets)
+        recalled = numpy.bincount(bucket, weights=grade[scheduled] >= PASSING_GRADE, minlength=buckets)
+        return [[int(count), int(passed)] for count, passed in zip(reviews, recalled)]
+    
+    curve = [[0, 0] for _ in range(buckets)]
+    for interval, grade in zip(islice(columns['interval'], start, None), islice(columns['grade'], start, None)):
+        if interval > 0:
+            counts = curve[bisect.bisect_left(RETENTION_BOUNDS, interval)]
+            counts[0] += 1
+            counts[1] += grade >= PASSING_GRADE
+    return curve
+
+
+def deck_accuracy(columns, start=0):
+    # {deck id: [reviews, recalled]}
+    if numpy is not None:
+        grade = column_view(columns['grade'], start)
+        decks, inverse = numpy.unique(column_view(columns['deck'], start), return_inverse=True)
+        reviews = numpy.bincount(inverse, minlength=len(decks))
+        recalled = numpy.bincount(inverse, weights=grade >= PASSING_GRADE, minlength=len(decks))
+        return {int(deck): [int(count), int(passed)] for deck, count, passed in zip(decks, reviews, recalled)}
+    
+    accuracy = {}
+    for deck, grade in zip(islice(columns['deck'], start, None), islice(columns['grade'], start, None)):
+        counts = accuracy.setdefault(deck, [0, 0])
+        counts[0] += 1
+        counts[1] += grade >= PASSING_GRADE
+    return accuracy
+
+
+def daily_reviews(columns, start=0, offset=0):
+    # {local day number: reviews}
+    if numpy is not None:
+        days = numpy.floor_divide(column_view(columns['time'], start) + offset, DAY).astype(numpy.int64)
+        days, counts = numpy.unique(days, return_counts=True)
+        return dict(zip(days.tolist(), counts.tolist()))
+    return dict(Counter(day_number(timestamp, offset) for timestamp in islice(columns['time'], start, None)))
+
+
+def response_times(columns, start=0):
+    # Total seconds taken to answer, and how many reviews were timed
+    if numpy is not None:
+        response = column_view(columns['response'], start)
+        timed = response[response > 0]
+        return float(timed.sum(dtype=numpy.float64)), len(timed)
+    timed = [response for response in islice(columns['response'], start, None) if response > 0]
+    return sum(timed), len(timed)
+
+
+def streaks(days, today):
+    # Current and longest runs of consecutive days with reviews; the
+    # current run survives a today without reviews yet
+    current = longest = run = 0
+    previous = None
+    for day in sorted(days):
+        run = run + 1 if previous == day - 1 else 1
+        longest = max(longest, run)
+        previous = day
+    if previous is not None and previous >= today - 1:
+        current = run
+    return current, longest
+
+
+def due_forecast(manager, days=30, now=None):
+    # Cards falling due on each of the next days, overdue and new cards
+    # counted today
+    now = time.time() if now is None else now
+    offset = local_offset(now)
+    midnight = day_number(now, offset) * DAY - offset
+    forecast = [0] * days
+    for index in range(len(manager.decks)):
+        due = manager.deck_cards(index).columns['due']
+        if numpy is not None:
+            values = numpy.fromiter(due, dtype=float, count=len(due))
+            day = numpy.maximum(numpy.floor_divide(values - midnight, DAY), 0).astype(numpy.int64)
+            counts = numpy.bincount(day[day < days], minlength=days)
+            forecast = [total + int(count) for total, count in zip(forecast, counts)]
+            continue
+        for value in due:
+            day = max(int((value - midnight) // DAY), 0)
+            if day < days:
+                forecast[day] += 1
+    return forecast
+
+
+class ReviewSummary:
+    # Aggregates of the log, kept up to date one review at a time; rows and
+    # size say how much of the log they cover
+    def __init__(self):
+        self.rows = 0
+        self.size = 0
+        self.retention = [[0, 0] for _ in range(len(RETENTION_BOUNDS) + 1)]
+        self.decks = {}
+        self.days = {}
+        self.response_time = 0.0
+        self.timed = 0
+    
+    @classmethod
+    def from_json(cls, data):
+        summary = cls()
+        summary.rows = data['rows']
+        summary.size = data['size']
+        summary.retention = data['retention']
+        summary.decks = {int(deck): counts for deck, counts in data['decks'].items()}
+        summary.days = {int(day): count for day, count in data['days'].items()}
+        summary.response_time = data['response_time']
+        summary.timed = data['timed']
+        return summary
+    
+    def to_json(self):
+        return {'rows': self.rows, 'size': self.size, 'retention': self.retention,
+                'decks': {str(deck): counts for deck, counts in self.decks.items()},
+                'days': {str(day): count for day, count in self.days.items()},
+                'response_time': self.response_time, 'timed': self.timed}
+    
+    def add(self, deck_id, timestamp, interval, grade, response):
+        recalled = grade >= PASSING_GRADE
+        if interval > 0:
+            counts = self.retention[bisect.bisect_left(RETENTION_BOUNDS, interval)]
+            counts[0] += 1
+            counts[1] += recalled
+        counts = self.decks.setdefault(deck_id, [0, 0])
+        counts[0] += 1
+        counts[1] += recalled
+        day = day_number(timestamp, local_offset())
+        self.days[day] = self.days.get(day, 0) + 1
+        if response > 0:
+            self.response_time += response
+            self.timed += 1
+        self.rows += 1
+    
+    def fold(self, columns, start):
+        # Adds the log rows from start on, aggregated a column at a time
+        for counts, added in zip(self.retention, retention_curve(columns, start)):
+            counts[0] += added[0]
+            counts[1] += added[1]
+        for deck, added in deck_accuracy(columns, start).items():
+            counts = self.decks.setdefault(deck, [0, 0])
+            counts[0] += added[0]
+            counts[1] += added[1]
+        for day, count in daily_reviews(columns, start, local_offset()).items():
+            self.days[day] = self.days.get(day, 0) + count
+        total, timed = response_times(columns, start)
+        self.response_time += total
+        self.timed += timed
+        self.rows = len(columns['card'])
+    
+    @property
+    def reviews(self):
+        return sum(counts[0] for counts in self.decks.values())
+    
+    @property
+    def recalled(self):
+        return sum(counts[1] for counts in self.decks.values())
+    
+    def today(self, now=None):
+        now = time.time() if now is None else now
+        return self.days.get(day_number(now, local_offset(now)), 0)
+    
+    def streaks(self, now=None):
+        now = time.time() if now is None else now
+        return streaks(self.days, day_number(now, local_offset(now)))
+    
+    def accuracy(self, deck_id=None):
+        # Share of reviews recalled, None before any review
+        reviews, recalled = self.decks.get(deck_id, [0, 0]) if deck_id is not None else (self.reviews, self.recalled)
+        return recalled / reviews if reviews else None
+    
+    def mean_response_time(self):
+        return self.response_time / self.timed if self.timed else None
+
+
+class ReviewStats:
+    # The review log and its summary: record() appends to both, so reading
+    # statistics never scans the log. The summary is saved beside the log
+    # and catches up on open with any rows it has not seen
+    def __init__(self, path='flashcards.reviews'):
+        self.log = ReviewLog(path)
+        self.summary_file = path + '.summary.json'
+        self.summary = self.load_summary()
+    
+    def load_summary(self):
+        summary = ReviewSummary()
+        if os.path.exists(self.summary_file):
+            try:
+                with open(self.summary_file, 'r', encoding='utf-8') as f:
+                    summary = ReviewSummary.from_json(json.load(f))
+            except (ValueError, KeyError) as e:
+                print(f"Rebuilding review summary: {e}")
+        if summary.size == self.log.size():
+            return summary
+        
+        columns = self.log.columns
+        if summary.rows > len(columns['card']):
+            # The log lost rows the summary counted (a torn append)
+            summary = ReviewSummary()
+        summary.fold(columns, summary.rows)
+        summary.size = self.log.size()
+        self.save(summary)
+        return summary
+    
+    def save(self, summary=None):
+        summary = summary or self.summary
+        with open(self.summary_file + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(summary.to_json(), f)
+        os.replace(self.summary_file + '.tmp', self.summary_file)
+    
+    def record(self, card_id, deck_id, timestamp, interval, grade, response=None):
+        response = response or 0.0
+        self.log.append(card_id, deck_id, timestamp, interval, grade, response)
+        self.summary.add(deck_id, timestamp, interval, grade, response)
+        self.summary.size += CHUNK_HEADER.size + ROW_SIZE
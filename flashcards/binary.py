@@ -0,0 +1,272 @@
+import json
+import math
+import struct
+import sys
+import zlib
+from array import array
+
+from .cards import CardColumns, TextColumn, new_id
+
+
+# Versioned binary snapshot:
+#   magic, version
+#   one block per deck: card count, question and answer byte lengths,
+#     due/interval/ease/reps arrays, card ids, then the question and
+#     answer texts
+#   deck directory: offset, length, count, next_due, name, mount, id and
+#     block crc32 of each deck (version 2 added the mount, version 3 the
+#     card and deck ids, version 4 the block crc32)
+#   footer: directory offset, deck count, current deck, journal seq, crc32
+# Everything is little-endian. Since version 4 the final crc32 covers the
+# header, directory and footer, and each block is checked against its own
+# crc32 when it is decoded, so opening a file reads only its directory;
+# before, it covered every byte before it.
+# A mounted deck's block holds its overlay as JSON instead of cards
+MAGIC = b'FLCARDS\0'
+VERSION = 4
+HEADER = struct.Struct('<8sI')
+DIRECTORY_ENTRY = struct.Struct('<QQIIdIQI')
+DIRECTORY_ENTRY_V3 = struct.Struct('<QQIIdIQ')
+DIRECTORY_ENTRY_V2 = struct.Struct('<QQIIdI')
+DIRECTORY_ENTRY_V1 = struct.Struct('<QQIId')
+FOOTER = struct.Struct('<QIqQ')
+CHECKSUM = struct.Struct('<I')
+COUNT = struct.Struct('<I')
+
+REVIEW_TYPES = (('due', 'd'), ('interval', 'd'), ('ease', 'd'), ('reps', 'I'))
+ID_TYPE = 'Q'
+
+
+def little_endian(values):
+    if sys.byteorder == 'big':
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values
+
+
+def encode_header():
+    return HEADER.pack(MAGIC, VERSION)
+
+
+def encode_deck(cards):
+    questions = cards.columns['question']
+    answers = cards.columns['answer']
+    for column in (questions, answers):
+        if not column.is_packed():
+            column.compact()
+    parts = [COUNT.pack(len(cards)), little_endian(questions.lengths).tobytes(),
+             little_endian(answers.lengths).tobytes()]
+    for name, typecode in REVIEW_TYPES:
+        parts.append(little_endian(cards.columns[name]).tobytes())
+    parts.append(little_endian(cards.columns['id']).tobytes())
+    parts.append(questions.buffer)
+    parts.append(answers.buffer)
+    return b''.join(parts)
+
+
+def read_array(typecode, data, offset, count):
+    values = array(typecode)
+    end = offset + count * values.itemsize
+    values.frombytes(data[offset:end])
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values, end
+
+
+def map_deck(data, version=VERSION):
+    # Like decode_deck, but leaves the texts and, on little-endian hosts,
+    # the review values and ids in data; returns the question and answer
+    # lengths, the review and id columns and the question and answer
+    # blobs. Blocks from before version 3 have no ids: the id column is
+    # then None
+    count, = COUNT.unpack_from(data, 0)
+    offset = COUNT.size
+    question_lengths, offset = read_array('I', data, offset, count)
+    answer_lengths, offset = read_array('I', data, offset, count)
+    review = {}
+    types = REVIEW_TYPES + ((('id', ID_TYPE),) if version >= 3 else ())
+    for name, typecode in types:
+        if sys.byteorder == 'little':
+            end = offset + count * array(typecode).itemsize
+            review[name] = data[offset:end].cast(typecode)
+            offset = end
+        else:
+            review[name], offset = read_array(typecode, data, offset, count)
+    review.setdefault('id', None)
+    question_end = offset + sum(question_lengths)
+    answer_end = question_end + sum(answer_lengths)
+    if answer_end != len(data):
+        raise ValueError('deck block length mismatch')
+    return (question_lengths, answer_lengths, review,
+            data[offset:question_end], data[question_end:answer_end])
+
+
+def decode_deck(data, version=VERSION):
+    # data is any buffer holding one deck block, e.g. an mmap slice; cards
+    # of blocks from before version 3 get new ids
+    count, = COUNT.unpack_from(data, 0)
+    offset = COUNT.size
+    question_lengths, offset = read_array('I', data, offset, count)
+    answer_lengths, offset = read_array('I', data, offset, count)
+    cards = CardColumns()
+    for name, typecode in REVIEW_TYPES:
+        cards.columns[name], offset = read_array(typecode, data, offset, count)
+    if version >= 3:
+        cards.columns['id'], offset = read_array(ID_TYPE, data, offset, count)
+    else:
+        cards.columns['id'] = array(ID_TYPE, (new_id() for _ in range(count)))
+    end = offset + sum(question_lengths)
+    cards.columns['question'] = TextColumn.from_packed(data[offset:end], question_lengths)
+    offset, end = end, end + sum(answer_lengths)
+    cards.columns['answer'] = TextColumn.from_packed(data[offset:end], answer_lengths)
+    if end != len(data):
+        raise ValueError('deck block length mismatch')
+    return cards
+
+
+def encode_directory(entries, current_deck_index, journal_seq, directory_offset):
+    parts = []
+    for entry in entries:
+        name = entry['name'].encode('utf-8')
+        mount = json.dumps(entry['mount'], ensure_ascii=False).encode('utf-8') if entry.get('mount') else b''
+        next_due = math.nan if entry['next_due'] is None else entry['next_due']
+        parts.append(DIRECTORY_ENTRY.pack(entry['offset'], entry['length'], entry['count'],
+                                          len(name), next_due, len(mount), entry['id'], entry['crc']))
+        parts.append(name)
+        parts.append(mount)
+    parts.append(FOOTER.pack(directory_offset, len(entries), current_deck_index, journal_seq))
+    return b''.join(parts)
+
+
+def directory_checksum(header, directory):
+    # crc32 of a version 4 file: its header, then directory and footer
+    return zlib.crc32(directory, zlib.crc32(header))
+
+
+def decode_directory(data, verify=True):
+    # Checks the framing and checksum, then returns the deck entries plus
+    # the current deck index, journal seq and format version; entries from
+    # before version 3 have no 'id', from before version 4 no 'crc'
+    if len(data) < HEADER.size + FOOTER.size + CHECKSUM.size:
+        raise ValueError('snapshot too short')
+    magic, version = HEADER.unpack_from(data, 0)
+    if magic != MAGIC:
+        raise ValueError('not a flashcards snapshot')
+    if not 1 <= version <= VERSION:
+        raise ValueError(f'unsupported snapshot version {version}')
+    end = len(data) - CHECKSUM.size
+    checksum, = CHECKSUM.unpack_from(data, end)
+    directory_offset, deck_count, current_deck_index, journal_seq = FOOTER.unpack_from(data, end - FOOTER.size)
+    if not HEADER.size <= directory_offset <= end - FOOTER.size:
+        raise ValueError('snapshot directory out of range')
+    if verify:
+        if version >= 4:
+            crc = directory_checksum(data[:HEADER.size], data[directory_offset:end])
+        else:
+            crc = zlib.crc32(data[:end])
+        if crc != checksum:
+            raise ValueError('snapshot checksum mismatch')
+    
+    entries = decode_entries(data, directory_offset, deck_count, version)
+    return entries, current_deck_index, journal_seq, version
+
+
+def decode_entries(data, offset, deck_count, version):
+    entries = []
+    for _ in range(deck_count):
+        deck_id = crc = None
+        if version == 1:
+            deck_offset, length, count, name_length, next_due = DIRECTORY_ENTRY_V1.unpack_from(data, offset)
+            offset += DIRECTORY_ENTRY_V1.size
+            mount_length = 0
+        elif version == 2:
+            deck_offset, length, count, name_length, next_due, mount_length = DIRECTORY_ENTRY_V2.unpack_from(data, offset)
+            offset += DIRECTORY_ENTRY_V2.size
+        elif version == 3:
+            deck_offset, length, count, name_length, next_due, mount_length, deck_id = DIRECTORY_ENTRY_V3.unpack_from(data, offset)
+            offset += DIRECTORY_ENTRY_V3.size
+        else:
+            deck_offset, length, count, name_length, next_due, mount_length, deck_id, crc = DIRECTORY_ENTRY.unpack_from(data, offset)
+            offset += DIRECTORY_ENTRY.size
+        name = bytes(data[offset:offset + name_length]).decode('utf-8')
+        offset += name_length
+        entry = {
+            'name': name,
+            'count': count,
+            'next_due': None if math.isnan(next_due) else next_due,
+            'offset': deck_offset,
+            'length': length
+        }
+        if deck_id is not None:
+            entry['id'] = deck_id
+        if crc is not None:
+            entry['crc'] = crc
+        if mount_length:
+            entry['mount'] = json.loads(bytes(data[offset:offset + mount_length]).decode('utf-8'))
+            offset += mount_length
+        entries.append(entry)
+    return entries
+
+
+def stream_checksum(f, offset, length):
+    # crc32 of a byte range read in chunks, or None if the file is shorter
+    f.seek(offset)
+    crc = 0
+    while length:
+        chunk = f.read(min(length, 1 << 20))
+        if not chunk:
+            return None
+        crc = zlib.crc32(chunk, crc)
+        length -= len(chunk)
+    return crc
+
+
+def file_checksum_ok(path):
+    # Streams the file instead of mapping it, so checking a large read-only
+    # deck does not pull all of it into the process
+    with open(path, 'rb') as f:
+        f.seek(0, 2)
+        end = f.tell() - CHECKSUM.size
+        if end < HEADER.size + FOOTER.size:
+            return False
+        f.seek(0)
+        header = f.read(HEADER.size)
+        magic, version = HEADER.unpack(header)
+        f.seek(end)
+        checksum, = CHECKSUM.unpack(f.read(CHECKSUM.size))
+        if version < 4:
+            return stream_checksum(f, 0, end) == checksum
+        
+        # The directory, then every block against the crc32 it lists
+        f.seek(end - FOOTER.size)
+        directory_offset, deck_count = FOOTER.unpack(f.read(FOOTER.size))[:2]
+        if not HEADER.size <= directory_offset <= end - FOOTER.size:
+            return False
+        f.seek(directory_offset)
+        directory = f.read(end - directory_offset)
+        if directory_checksum(header, directory) != checksum:
+            return False
+        try:
+            entries = decode_entries(directory, 0, deck_count, version)
+        except (ValueError, struct.error):
+            return False
+        return all(stream_checksum(f, entry['offset'], entry['length']) == entry['crc'] for entry in entries)
+
+
+def write_deck_file(path, name, cards):
+    # A one-deck snapshot, e.g. a reference deck to ship and mount
+    block = encode_deck(cards)
+    entry = {
+        'id': new_id(),
+        'name': name,
+        'count': len(cards),
+        'next_due': min(cards.columns['due'], default=None),
+        'offset': HEADER.size,
+        'length': len(block),
+        'crc': zlib.crc32(block)
+    }
+    header = encode_header()
+    directory = encode_directory([entry], 0, 0, len(header) + len(block))
+    with open(path, 'wb') as f:
+        f.write(header + block + directory)
+        f.write(CHECKSUM.pack(directory_checksum(header, directory)))
@@ -0,0 +1,297 @@
+import bisect
+import random
+from array import array
+from itertools import accumulate
+
+
+# Review state fields, in the order CardColumns stores them
+REVIEW_FIELDS = ('due', 'interval', 'ease', 'reps')
+CARD_FIELDS = ('question', 'answer') + REVIEW_FIELDS + ('id',)
+
+id_source = random.Random()
+
+
+def new_id():
+    # Random 63-bit ids for cards and decks: they never change once given
+    # out, and libraries on other devices can pick their own without
+    # clashing
+    return id_source.getrandbits(63)
+
+
+class FlashCard:
+    __slots__ = CARD_FIELDS
+    
+    def __init__(self, question, answer, due=0.0, interval=0.0, ease=2.5, reps=0, id=None):
+        self.question = question
+        self.answer = answer
+        # SM-2 state: due timestamp, interval in days, ease factor, streak
+        self.due = due
+        self.interval = interval
+        self.ease = ease
+        self.reps = reps
+        self.id = new_id() if id is None else id
+
+
+def card_row(item):
+    # JSON card dict to a CardColumns row; review keys are only present
+    # once a card has been graded, and cards saved before ids existed
+    # get one in CardColumns.extend
+    row = (item['question'], item['answer'], item.get('due', 0.0),
+           item.get('interval', 0.0), item.get('ease', 2.5), item.get('reps', 0))
+    return row + (item['id'],) if 'id' in item else row
+
+
+def card_item(card):
+    item = {'question': card.question, 'answer': card.answer}
+    if card.reps or card.due:
+        for name in REVIEW_FIELDS:
+            item[name] = getattr(card, name)
+    item['id'] = card.id
+    return item
+
+
+class TextColumn:
+    # Strings packed as UTF-8 in one buffer, addressed by start and length
+    def __init__(self):
+        self.buffer = bytearray()
+        self.starts = array('Q')
+        self.lengths = array('I')
+        self.garbage = 0
+    
+    def __len__(self):
+        return len(self.starts)
+    
+    def __getitem__(self, index):
+        start = self.starts[index]
+        return self.buffer[start:start + self.lengths[index]].decode('utf-8')
+    
+    def __setitem__(self, index, text):
+        # The old bytes stay in the buffer until the next compaction
+        data = text.encode('utf-8')
+        self.garbage += self.lengths[index]
+        self.starts[index] = len(self.buffer)
+        self.lengths[index] = len(data)
+        self.buffer += data
+        self.compact_if_needed()
+    
+    def append(self, text):
+        data = text.encode('utf-8')
+        self.starts.append(len(self.buffer))
+        self.lengths.append(len(data))
+        self.buffer += data
+    
+    def insert(self, index, text):
+        data = text.encode('utf-8')
+        self.starts.insert(index, len(self.buffer))
+        self.lengths.insert(index, len(data))
+        self.buffer += data
+    
+    def pop(self, index):
+        text = self[index]
+        self.garbage += self.lengths.pop(index)
+        self.starts.pop(index)
+        self.compact_if_needed()
+        return text
+    
+    def select(self, indexes):
+        # Keeps the strings at indexes, in that order, in one pass
+        self.starts = array('Q', map(self.starts.__getitem__, indexes))
+        self.lengths = array('I', map(self.lengths.__getitem__, indexes))
+        self.garbage = len(self.buffer) - sum(self.lengths)
+        self.compact_if_needed()
+    
+    @classmethod
+    def from_packed(cls, buffer, lengths):
+        # Strings already back to back in index order, as snapshots hold them
+        column = cls()
+        column.buffer = bytearray(buffer)
+        column.lengths = lengths
+        column.starts = array('Q', accumulate(lengths, initial=0))
+        column.starts.pop()
+        return column
+    
+    def is_packed(self):
+        # True when the buffer holds exactly the strings in index order
+        if len(self.buffer) != sum(self.lengths):
+            return False
+        starts = array('Q', accumulate(self.lengths, initial=0))
+        starts.pop()
+        return starts == self.starts
+    
+    def copy(self):
+        column = TextColumn()
+        column.buffer = bytearray(self.buffer)
+        column.starts = array('Q', self.starts)
+        column.lengths = array('I', self.lengths)
+        column.garbage = self.garbage
+        return column
+    
+    def compact_if_needed(self):
+        if self.garbage < 4096 or self.garbage * 2 < len(self.buffer):
+            return
+        self.compact()
+    
+    def compact(self):
+        buffer = bytearray()
+        for i in range(len(self.starts)):
+            start = self.starts[i]
+            self.starts[i] = len(buffer)
+            buffer += self.buffer[start:start + self.lengths[i]]
+        self.buffer = buffer
+        self.garbage = 0
+
+
+def column_property(name):
+    def get(ref):
+        return ref.store.columns[name][ref.index]
+    
+    def set(ref, value):
+        ref.store.columns[name][ref.index] = value
+    
+    return property(get, set)
+
+
+class CardRef:
+    # Lightweight view of one row of a CardColumns store; like a list index,
+    # it points at another card once cards before it are removed
+    __slots__ = ('store', 'index')
+    
+    question = column_property('question')
+    answer = column_property('answer')
+    due = column_property('due')
+    interval = column_property('interval')
+    ease = column_property('ease')
+    reps = column_property('reps')
+    id = column_property('id')
+    
+    def __init__(self, store, index):
+        self.store = store
+        self.index = index
+
+
+class CardPositions:
+    # Card id -> position map of a deck that follows deletions without a
+    # rebuild: positions are stored as they were when the map was built,
+    # and a card's current position is its stored one less the removed
+    # cards stored before it
+    def __init__(self, ids):
+        self.stored = dict(zip(ids, range(len(ids))))
+        self.removed = []
+    
+    def __len__(self):
+        return len(self.stored)
+    
+    def get(self, card_id, default=None):
+        stored = self.stored.get(card_id)
+        if stored is None:
+            return default
+        return stored - bisect.bisect_left(self.removed, stored)
+    
+    def __getitem__(self, card_id):
+        stored = self.stored[card_id]
+        return stored - bisect.bisect_left(self.removed, stored)
+    
+    def __setitem__(self, card_id, position):
+        # Only for cards appended at the end of the deck
+        self.stored[card_id] = position + len(self.removed)
+    
+    def remove(self, card_id):
+        stored = self.stored.pop(card_id, None)
+        if stored is not None:
+            bisect.insort(self.removed, stored)
+
+
+class CardColumns:
+    # Columnar card list for a deck; indexing returns CardRef views so
+    # deck['cards'][i].question keeps working without one object per card
+    def __init__(self, cards=()):
+        self.columns = {
+            'question': TextColumn(),
+            'answer': TextColumn(),
+            'due': array('d'),
+            'interval': array('d'),
+            'ease': array('d'),
+            'reps': array('I'),
+            'id': array('Q')
+        }
+        for card in cards:
+            self.append(card)
+    
+    @classmethod
+    def from_rows(cls, rows):
+        store = cls()
+        store.extend(rows)
+        return store
+    
+    def extend(self, rows):
+        # Rows are tuples in CARD_FIELDS order; rows from before cards had
+        # ids lack the last field
+        columns = [self.columns[name] for name in CARD_FIELDS]
+        ids = self.columns['id']
+        for row in rows:
+            for column, value in zip(columns, row):
+                column.append(value)
+            if len(row) < len(columns):
+                ids.append(new_id())
+    
+    def __len__(self):
+        return len(self.columns['question'])
+    
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [CardRef(self, i) for i in range(len(self))[index]]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('card index out of range')
+        return CardRef(self, index)
+    
+    def __iter__(self):
+        for i in range(len(self)):
+            yield CardRef(self, i)
+    
+    def append(self, card):
+        for name in CARD_FIELDS:
+            self.columns[name].append(getattr(card, name))
+    
+    def insert(self, index, card):
+        for name in CARD_FIELDS:
+            self.columns[name].insert(index, getattr(card, name))
+    
+    def pop(self, index=-1):
+        return FlashCard(*(self.columns[name].pop(index) for name in CARD_FIELDS))
+    
+    def copy(self):
+        # An independent copy, e.g. for another thread to write out
+        store = CardColumns()
+        for name, column in self.columns.items():
+            store.columns[name] = column.copy() if isinstance(column, TextColumn) else column[:]
+        return store
+    
+    def rows(self, positions):
+        return [tuple(self.columns[name][i] for name in CARD_FIELDS) for i in positions]
+    
+    def select(self, indexes):
+        # Reorders or drops cards in one pass: card i becomes the card that
+        # was at indexes[i]
+        for name in REVIEW_FIELDS + ('id',):
+            column = self.columns[name]
+            column[:] = array(column.typecode, map(column.__getitem__, indexes))
+        self.columns['question'].select(indexes)
+        self.columns['answer'].select(indexes)
+    
+    def remove(self, positions):
+        # Drops the cards at positions, returned as rows in position order
+        drop = set(positions)
+        rows = self.rows(sorted(drop))
+        self.select([i for i in range(len(self)) if i not in drop])
+        return rows
+    
+    def insert_rows(self, items):
+        # items are (position, row) pairs, position being where the card
+        # ends up; all of them go in with one pass over the deck
+        start = len(self)
+        self.extend(row for position, row in items)
+        added = {position: start + k for k, (position, row) in enumerate(items)}
+        existing = iter(range(start))
+        self.select([added[i] if i in added else next(existing) for i in range(len(self))])
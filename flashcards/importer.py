@@ -0,0 +1,54 @@
+import csv
+import html
+import itertools
+import re
+
+
+# Anki text export '#separator:' values
+ANKI_SEPARATORS = {'tab': '\t', 'comma': ',', 'semicolon': ';', 'pipe': '|', 'space': ' '}
+
+
+def clean_html(text):
+    text = re.sub(r'<br\s*/?>|</div>', '\n', text, flags=re.IGNORECASE)
+    return html.unescape(re.sub(r'<[^>]+>', '', text))
+
+
+def read_card_rows(path):
+    # Streams (question, answer) pairs from a CSV, TSV or Anki text export;
+    # rows that are not usable yield None so they can be counted
+    delimiter = ',' if path.lower().endswith('.csv') else '\t'
+    with open(path, 'r', encoding='utf-8-sig', errors='replace', newline='') as f:
+        is_html = False
+        dropped_columns = []
+        line = f.readline()
+        # Anki exports start with '#key:value' header lines
+        while line.startswith('#') and ':' in line:
+            key, value = line[1:].rstrip('\r\n').split(':', 1)
+            key = key.strip().lower()
+            if key == 'separator':
+                delimiter = ANKI_SEPARATORS.get(value.strip().lower(), value[:1] or delimiter)
+            elif key == 'html':
+                is_html = value.strip().lower() == 'true'
+            elif key.endswith(' column') and value.strip().isdigit():
+                # Deck, notetype or guid columns come before the fields
+                dropped_columns.append(int(value) - 1)
+            line = f.readline()
+        
+        first = True
+        for row in csv.reader(itertools.chain([line], f), delimiter=delimiter):
+            for column in sorted(dropped_columns, reverse=True):
+                if column < len(row):
+                    del row[column]
+            if first:
+                first = False
+                if [field.strip().lower() for field in row[:2]] in (['question', 'answer'], ['front', 'back']):
+                    continue
+            if len(row) < 2:
+                if any(row):
+                    yield None
+                continue
+            question, answer = row[0], row[1]
+            if is_html:
+                question, answer = clean_html(question), clean_html(answer)
+            question, answer = question.strip(), answer.strip()
+            yield (question, answer) if question and answer else None
@@ -0,0 +1,968 @@
+import heapq
+import json
+import os
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from .cards import CARD_FIELDS, REVIEW_FIELDS, CardColumns, CardPositions, FlashCard, TextColumn, new_id
+from .scheduler import StudySession, sm2_review
+from .storage import JsonStorage, SnapshotCorrupt, shift_current_deck
+
+# Records that add, remove or move cards, shifting the positions after them
+RESHAPING_OPS = ('add_card', 'add_cards', 'insert_card', 'insert_cards',
+                 'delete_card', 'delete_cards', 'move_cards')
+# Records that leave the cards of the decks they name alone
+DECK_OPS = ('add_deck', 'insert_deck', 'edit_deck', 'select_deck', 'mount_deck')
+
+
+class FlashCardManager:
+    def __init__(self, storage=None, read_only=False):
+        self.decks = []
+        # Decks by id, and their positions, rebuilt on first use once decks
+        # are inserted or removed
+        self.decks_by_id = {}
+        self.deck_positions = None
+        self.current_deck_index = 0
+        self.current_card_index = 0
+        self.storage = storage if storage is not None else JsonStorage()
+        # Decks with their cards in memory, least recently used first
+        self.loaded_decks = OrderedDict()
+        self.max_loaded_decks = 5
+        self.session = None
+        self.duplicates = None
+        # Undo and redo steps, each a list of records that reverse it;
+        # history_size counts the cards those records hold
+        self.undo_stack = []
+        self.redo_stack = []
+        self.history_size = 0
+        self.max_history = 100
+        self.max_history_cards = 100000
+        # Inverse records of the step being committed, see undo_step()
+        self.step = None
+        # Records of the batch being executed not yet written, see execute()
+        self.unwritten = None
+        # SyncClient told of every change, if the library is synced
+        self.sync = None
+        # ReviewStats logging every grade, if review statistics are kept
+        self.reviews = None
+        # Set by tools that only read a library: loading neither saves nor
+        # adds the default deck
+        self.read_only = read_only
+        # Set while the journal is replayed, see load_decks()
+        self.loading = False
+        self.load_decks()
+        
+        # Create default deck if no decks exist
+        if not self.decks and not read_only:
+            self.add_deck("Mes Cartes")
+            self.clear_history()
+    
+    @property
+    def current_deck(self):
+        if self.decks and 0 <= self.current_deck_index < len(self.decks):
+            return self.decks[self.current_deck_index]
+        return None
+    
+    @property
+    def cards(self):
+        if self.current_deck:
+            return self.deck_cards(self.current_deck_index)
+        return []
+    
+    def deck_cards(self, index):
+        # Card bodies are fetched from storage the first time a deck is used
+        deck = self.decks[index]
+        if deck['cards'] is None:
+            # Storage finds decks by position, so it must have the batch so far
+            self.write_unwritten()
+            try:
+                deck['cards'] = self.storage.load_cards(index, deck)
+            except SnapshotCorrupt as e:
+                # A replay restarts from the backups itself
+                if self.loading:
+                    raise
+                print(f"Error loading deck: {e}")
+                self.recover_decks()
+                return self.deck_cards(index)
+            # A mounted file may have changed, or gone, since it was counted
+            if 'mount' in deck:
+                deck['count'] = len(deck['cards'])
+        self.loaded_decks[id(deck)] = deck
+        self.loaded_decks.move_to_end(id(deck))
+        self.evict_decks(keep=deck)
+        return deck['cards']
+    
+    def evict_decks(self, keep=None):
+        # Decks changed by a batch stay loaded until the storage has it,
+        # or reading them back would miss the changes
+        if self.unwritten is not None:
+            return
+        excess = len(self.loaded_decks) - self.max_loaded_decks
+        for key, deck in list(self.loaded_decks.items()):
+            if excess <= 0:
+                break
+            if deck is not keep and deck is not self.current_deck and self.storage.can_unload(deck):
+                deck['next_due'] = min(deck['cards'].columns['due'], default=None)
+                deck['cards'] = None
+                deck['queue'] = None
+                deck['search'] = None
+                deck['positions'] = None
+                del self.loaded_decks[key]
+                excess -= 1
+    
+    def add_deck(self, name):
+        self.commit({'op': 'add_deck', 'name': name, 'id': new_id()})
+    
+    def add_placeholder_deck(self):
+        # The empty deck that takes the place of the last one deleted; a
+        # synced library keeps it to this device until it is used, see
+        # SyncClient.changes()
+        self.commit({'op': 'add_deck', 'name': "Nouvelle Liste", 'id': new_id(), 'placeholder': True})
+    
+    def edit_deck(self, index, new_name):
+        if 0 <= index < len(self.decks):
+            self.commit({'op': 'edit_deck', 'deck': index, 'name': new_name})
+    
+    def delete_deck(self, index):
+        if 0 <= index < len(self.decks):
+            with self.undo_step():
+                self.commit({'op': 'delete_deck', 'deck': index})
+                if len(self.decks) == 0:
+                    self.add_placeholder_deck()
+    
+    def mount_deck(self, path, name=None):
+        # Adds a read-only deck kept in a binary snapshot file (the first
+        # deck in it unless name is given); see MappedCards. The file is
+        # checked here, once, and the record keeps the stamp it passed at
+        from .mounted import check_file, deck_name
+        self.commit({'op': 'mount_deck', 'path': os.path.abspath(path), 'name': deck_name(path, name),
+                     'checked': check_file(path), 'id': new_id()})
+    
+    def deck_unavailable(self, index):
+        # Why a mounted deck's file cannot be read, or None if it can; such
+        # a deck shows no cards until the file is back or it is deleted
+        return getattr(self.deck_cards(index), 'error', None)
+    
+    def set_current_deck(self, index):
+        if 0 <= index < len(self.decks):
+            self.current_deck_index = index
+            self.current_card_index = 0
+            self.commit({'op': 'select_deck', 'deck': index})
+    
+    def add_card(self, question, answer):
+        if self.current_deck:
+            self.commit({'op': 'add_card', 'deck': self.current_deck_index,
+                         'question': question, 'answer': answer, 'id': new_id()})
+    
+    def edit_card(self, index, question, answer):
+        if 0 <= index < len(self.cards):
+            self.commit({'op': 'edit_card', 'deck': self.current_deck_index, 'card': index,
+                         'question': question, 'answer': answer})
+    
+    def delete_card(self, index):
+        if 0 <= index < len(self.cards):
+            self.commit({'op': 'delete_card', 'deck': self.current_deck_index, 'card': index})
+    
+    def deck_index(self, deck_id):
+        # Position of a deck, or None if no deck has that id
+        if self.deck_positions is None:
+            self.deck_positions = {deck['id']: i for i, deck in enumerate(self.decks)}
+        return self.deck_positions.get(deck_id)
+    
+    def card_index(self, card_id, deck_index=None):
+        # Position of a card in a deck, the current one by default, or None
+        deck_index = self.current_deck_index if deck_index is None else deck_index
+        return self.card_positions(deck_index).get(card_id)
+    
+    def card_positions(self, deck_index):
+        # Card id -> position map of a deck; deletes and appends keep it up
+        # to date, inserts make it rebuilt on next use
+        deck = self.decks[deck_index]
+        cards = self.deck_cards(deck_index)
+        if deck.get('positions') is None:
+            deck['positions'] = CardPositions(cards.columns['id'])
+        return deck['positions']
+    
+    def get_card_by_id(self, card_id, deck_index=None):
+        deck_index = self.current_deck_index if deck_index is None else deck_index
+        index = self.card_index(card_id, deck_index)
+        return None if index is None else self.deck_cards(deck_index)[index]
+    
+    def edit_card_by_id(self, card_id, question, answer):
+        index = self.card_index(card_id)
+        if index is not None:
+            self.edit_card(index, question, answer)
+    
+    def delete_card_by_id(self, card_id):
+        index = self.card_index(card_id)
+        if index is not None:
+            self.delete_card(index)
+    
+    def valid_positions(self, deck_index, positions):
+        count = self.decks[deck_index]['count']
+        return sorted({i for i in positions if 0 <= i < count})
+    
+    def delete_many(self, positions, deck_index=None):
+        # Deletes several cards of a deck, the current one by default
+        deck_index = self.current_deck_index if deck_index is None else deck_index
+        positions = self.valid_positions(deck_index, positions)
+        if positions:
+            self.commit({'op': 'delete_cards', 'deck': deck_index, 'cards': positions})
+    
+    def move_cards_between_decks(self, source, positions, target):
+        # The cards keep their review state and go to the end of target
+        positions = self.valid_positions(source, positions)
+        if positions and source != target and 0 <= target < len(self.decks):
+            self.commit({'op': 'move_cards', 'deck': source, 'cards': positions, 'to': target})
+    
+    def merge_decks(self, indices):
+        # Cards of every listed deck go to the first one, in list order, and
+        # the other decks are deleted
+        indices = [i for i in dict.fromkeys(indices) if 0 <= i < len(self.decks)]
+        if len(indices) < 2:
+            return
+        target, others = indices[0], indices[1:]
+        records = [{'op': 'move_cards', 'deck': i, 'cards': list(range(self.decks[i]['count'])), 'to': target}
+                   for i in others if self.decks[i]['count']]
+        records += [{'op': 'delete_deck', 'deck': i} for i in sorted(others, reverse=True)]
+        # The merged deck is selected in the same write, where it ends up
+        records.append({'op': 'select_deck', 'deck': target - sum(1 for i in others if i < target)})
+        self.commit_many(records)
+        self.current_card_index = 0
+    
+    def split_deck(self, index, positions, name):
+        # Moves the given cards of a deck into a new deck called name
+        positions = self.valid_positions(index, positions)
+        if positions:
+            self.commit_many([
+                {'op': 'add_deck', 'name': name, 'id': new_id()},
+                {'op': 'move_cards', 'deck': index, 'cards': positions, 'to': len(self.decks)}
+            ])
+    
+    def delete_decks(self, indices):
+        indices = sorted({i for i in indices if 0 <= i < len(self.decks)}, reverse=True)
+        if indices:
+            with self.undo_step():
+                self.commit_many([{'op': 'delete_deck', 'deck': i} for i in indices])
+                if len(self.decks) == 0:
+                    self.add_placeholder_deck()
+    
+    def get_current_card(self):
+        cards = self.cards
+        if cards and 0 <= self.current_card_index < len(cards):
+            return cards[self.current_card_index]
+        return None
+    
+    def due_queue(self, index):
+        # Heap of (due, card index) for a deck, built on first use
+        deck = self.decks[index]
+        cards = self.deck_cards(index)
+        if deck.get('queue') is None:
+            due = cards.columns['due']
+            deck['queue'] = [(due[i], i) for i in range(len(cards))]
+            heapq.heapify(deck['queue'])
+        return deck['queue']
+    
+    def peek_due(self, index):
+        # Earliest (due, card index) of a deck, or None if it has no cards
+        due = self.deck_cards(index).columns['due']
+        queue = self.due_queue(index)
+        while queue:
+            card_due, card_index = queue[0]
+            # Entries superseded by a later grade are dropped lazily
+            if card_index >= len(due) or due[card_index] != card_due:
+                heapq.heappop(queue)
+                continue
+            return queue[0]
+        return None
+    
+    def deck_next_due(self, index):
+        # Unloaded decks answer from the due time cached in the deck index
+        deck = self.decks[index]
+        if deck['cards'] is None:
+            return deck.get('next_due', 0.0)
+        head = self.peek_due(index)
+        return head[0] if head else None
+    
+    def next_due_index(self, index=None, now=None):
+        index = self.current_deck_index if index is None else index
+        now = time.time() if now is None else now
+        head = self.peek_due(index)
+        if head and head[0] <= now:
+            return head[1]
+        return None
+    
+    def upcoming_cards(self, count):
+        # Best guess at the cards shown after the current one, for
+        # prefetching: the earliest due in the current deck, then the
+        # following ones in deck order
+        cards = self.cards
+        if not cards:
+            return []
+        due = cards.columns['due']
+        queue = self.due_queue(self.current_deck_index)
+        # The k smallest entries of a heap sit in its first 2**k - 1 slots
+        head = heapq.nsmallest(count + 1, queue[:2 ** (count + 1) - 1])
+        positions = [i for card_due, i in head if i < len(due) and due[i] == card_due]
+        positions += [(self.current_card_index + step) % len(cards) for step in range(1, count + 1)]
+        
+        seen = {self.current_card_index}
+        upcoming = []
+        for i in positions:
+            if i not in seen and len(upcoming) < count:
+                seen.add(i)
+                upcoming.append(cards[i])
+        return upcoming
+    
+    def import_cards(self, path, index=None, chunk_size=1000):
+        # Generator: commits one add_cards record per chunk of valid rows and
+        # yields the running (imported, skipped) counts, so the caller
+        # decides how to pace it. The deck is found by id for every chunk,
+        # as decks before it may come or go meanwhile, and all chunks are
+        # one undo step; raises ValueError if the deck itself is deleted
+        from .importer import read_card_rows
+        
+        index = self.current_deck_index if index is None else index
+        deck_id = self.decks[index]['id']
+        imported = skipped = 0
+        step = None
+        chunk = []
+        for row in read_card_rows(path):
+            if row is None:
+                skipped += 1
+                continue
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                step = self.import_chunk(deck_id, chunk, step)
+                imported += len(chunk)
+                chunk = []
+                yield imported, skipped
+        if chunk:
+            self.import_chunk(deck_id, chunk, step)
+            imported += len(chunk)
+        yield imported, skipped
+    
+    def import_chunk(self, deck_id, chunk, step):
+        index = self.deck_index(deck_id)
+        if index is None:
+            raise ValueError('the deck was deleted during the import')
+        self.commit({'op': 'add_cards', 'deck': index, 'cards': chunk, 'ids': [new_id() for _ in chunk]})
+        return self.join_step(step)
+    
+    def export_rows(self, deck_indices=None):
+        # Yields one card dict at a time, loading decks one after another
+        if deck_indices is None:
+            deck_indices = range(len(self.decks))
+        for index in deck_indices:
+            name = self.decks[index]['name']
+            for card in self.deck_cards(index):
+                row = {'question': card.question, 'answer': card.answer, 'deck': name}
+                for field in REVIEW_FIELDS:
+                    row[field] = getattr(card, field)
+                yield row
+    
+    def export_decks(self, path, fmt='csv', deck_indices=None, compress=None):
+        # Writes CSV or JSON Lines, gzipped if asked or if path ends in .gz;
+        # returns the number of cards written
+        import csv
+        import gzip
+        
+        if compress is None:
+            compress = path.endswith('.gz')
+        opener = gzip.open if compress else open
+        count = 0
+        with opener(path, 'wt', encoding='utf-8', newline='') as f:
+            if fmt == 'jsonl':
+                for row in self.export_rows(deck_indices):
+                    f.write(json.dumps(row, ensure_ascii=False) + '\n')
+                    count += 1
+            elif fmt == 'csv':
+                # Question and answer first, so the file imports back as is
+                writer = csv.DictWriter(f, fieldnames=['question', 'answer', 'deck'] + list(REVIEW_FIELDS))
+                writer.writeheader()
+                for row in self.export_rows(deck_indices):
+                    writer.writerow(row)
+                    count += 1
+            else:
+                raise ValueError(f"Unknown export format: {fmt}")
+        return count
+    
+    def search_cards(self, query, index=None):
+        # Positions of the cards matching query in a deck, current by default
+        index = self.current_deck_index if index is None else index
+        deck = self.decks[index]
+        cards = self.deck_cards(index)
+        if deck.get('search') is None:
+            from .search import SearchIndex
+            deck['search'] = SearchIndex(cards)
+        card_ids = deck['search'].search(query)
+        if not card_ids:
+            return []
+        positions = self.card_positions(index)
+        return sorted(positions[card_id] for card_id in card_ids)
+    
+    def duplicate_index(self):
+        # Built over the whole library on first use, one deck at a time so
+        # the LRU bound holds, then kept up to date by apply(); an index
+        # still being built by build_duplicates() is given up
+        if not self.duplicates_ready():
+            from .search import DuplicateIndex
+            duplicates = DuplicateIndex()
+            for index, deck in enumerate(self.decks):
+                for card in self.deck_cards(index):
+                    duplicates.add(id(deck), card.question)
+            self.duplicates = duplicates
+        return self.duplicates
+    
+    def duplicates_ready(self):
+        from .search import DuplicateIndex
+        return isinstance(self.duplicates, DuplicateIndex)
+    
+    def build_duplicates(self, run=None):
+        # Builds the duplicate index on the calling thread, e.g. a worker
+        # started once the app is up, so the first duplicate check finds it
+        # ready. run(step) calls step on the thread that owns the manager,
+        # as for SyncClient.sync(): there each deck's questions are read,
+        # one deck per step, and at the end the changes made meanwhile are
+        # replayed and the index handed over
+        from .search import DuplicateIndex
+        
+        run = run or (lambda step: step())
+        pending = run(self.start_duplicates)
+        if pending is None:
+            return
+        duplicates = DuplicateIndex()
+        while True:
+            batch = run(lambda: self.duplicates_step(pending, duplicates))
+            if batch is None:
+                return
+            deck_key, questions = batch
+            for question in questions:
+                duplicates.add(deck_key, question)
+    
+    def start_duplicates(self):
+        from .search import PendingDuplicates
+        if self.duplicates is not None:
+            return None
+        self.duplicates = PendingDuplicates()
+        return self.duplicates
+    
+    def duplicates_step(self, pending, duplicates):
+        # The next deck's key and questions, or None once the index is
+        # handed over or was given up, e.g. by recover_decks()
+        if self.duplicates is not pending:
+            return None
+        for index, deck in enumerate(self.decks):
+            if id(deck) not in pending.read:
+                pending.read[id(deck)] = deck
+                questions = self.deck_cards(index).columns['question']
+                # Copied, as the deck may change before the builder reads it
+                return id(deck), questions.copy() if isinstance(questions, TextColumn) else list(questions)
+        pending.replay(duplicates)
+        self.duplicates = duplicates
+        return None
+    
+    def find_duplicates(self, question):
+        # Returns ([(deck name, count)] of exact matches, [similar questions])
+        exact, similar = self.duplicate_index().find(question)
+        names = [(deck['name'], exact[id(deck)]) for deck in self.decks if id(deck) in exact]
+        return names, similar
+    
+    def duplicate_report(self):
+        # Exact groups as (question, [(deck name, count)]) and near pairs as
+        # (question, question, similarity) across the whole library
+        exact, near = self.duplicate_index().report()
+        groups = [(question, [(deck['name'], counts[id(deck)]) for deck in self.decks if id(deck) in counts])
+                  for question, counts in exact]
+        return groups, near
+    
+    def start_session(self, deck_indices=None):
+        self.session = StudySession(self, deck_indices)
+        return self.session
+    
+    def end_session(self):
+        if self.session:
+            self.session.close()
+            self.session = None
+    
+    def study_next_due(self, now=None):
+        card_index = self.next_due_index(now=now)
+        if card_index is None:
+            return False
+        self.current_card_index = card_index
+        return True
+    
+    def grade_card(self, quality, now=None, response_time=None):
+        card = self.get_current_card()
+        if card:
+            now = time.time() if now is None else now
+            card_id, scheduled = card.id, card.interval
+            due, interval, ease, reps = sm2_review(card, quality, now)
+            self.commit({'op': 'review_card', 'deck': self.current_deck_index,
+                         'card': self.current_card_index, 'due': due,
+                         'interval': interval, 'ease': ease, 'reps': reps})
+            if self.reviews is not None:
+                # Logged once committed; undoing the grade keeps the review
+                self.reviews.record(card_id, self.current_deck['id'], now, scheduled, quality, response_time)
+    
+    def next_card(self):
+        if self.cards:
+            self.current_card_index = (self.current_card_index + 1) % len(self.cards)
+    
+    def prev_card(self):
+        if self.cards:
+            self.current_card_index = (self.current_card_index - 1) % len(self.cards)
+    
+    def commit(self, record):
+        self.commit_many([record])
+    
+    def commit_many(self, records):
+        # One undo step and one storage write for the whole batch
+        with self.undo_step():
+            self.step.append(self.execute(records))
+    
+    @contextmanager
+    def undo_step(self):
+        # Commits made inside the block are undone together
+        if self.step is not None:
+            yield
+            return
+        self.step = []
+        try:
+            yield
+        finally:
+            step, self.step = self.step, None
+            records = [inverse for inverses in reversed(step) for inverse in inverses]
+            if records:
+                self.clear_steps(self.redo_stack)
+                self.push_step(self.undo_stack, records)
+    
+    def undo(self):
+        return self.replay(self.undo_stack, self.redo_stack)
+    
+    def redo(self):
+        return self.replay(self.redo_stack, self.undo_stack)
+    
+    def replay(self, source, target):
+        # Commits the newest step of one stack and files its inverse on the
+        # other; returns False when there is nothing to replay
+        if not source:
+            return False
+        records = source.pop()
+        self.history_size -= self.step_size(records)
+        self.push_step(target, self.execute(records))
+        return True
+    
+    def push_step(self, stack, records):
+        stack.append(records)
+        self.history_size += self.step_size(records)
+        # Oldest steps go first, undo history before redo history
+        for oldest in (self.undo_stack, self.redo_stack):
+            while oldest and (len(oldest) > self.max_history or self.history_size > self.max_history_cards):
+                self.history_size -= self.step_size(oldest.pop(0))
+    
+    def join_step(self, step):
+        # Folds the newest undo step into step if step is right below it,
+        # so a change committed in parts is undone at once; returns the
+        # step now on top
+        if step is None or len(self.undo_stack) < 2 or self.undo_stack[-2] is not step:
+            return self.undo_stack[-1] if self.undo_stack else None
+        records = self.undo_stack.pop()
+        first = step[0]
+        if len(records) == 1 and records[0]['op'] == first['op'] == 'delete_cards' and records[0]['deck'] == first['deck']:
+            # Chunks of one import: still one journal line to undo
+            step[0] = dict(first, cards=first['cards'] + records[0]['cards'])
+        else:
+            step[:0] = records
+        return step
+    
+    def step_size(self, records):
+        return sum(len(record['cards']) if 'cards' in record else 1 for record in records)
+    
+    def clear_steps(self, stack):
+        for records in stack:
+            self.history_size -= self.step_size(records)
+        stack.clear()
+    
+    def clear_history(self):
+        self.clear_steps(self.undo_stack)
+        self.clear_steps(self.redo_stack)
+    
+    def execute(self, records):
+        # Apply mutations in memory, then persist just those mutations in
+        # one write; returns the records that undo them, in commit order
+        inverses = []
+        self.unwritten = []
+        try:
+            for record in records:
+                # Cards are read before anything changes, so a deck failing
+                # its checksum is recovered before the record is half applied
+                if record['op'] not in DECK_OPS:
+                    for index in {record['deck'], record.get('to', record['deck'])}:
+                        self.deck_cards(index)
+                # Adding or removing cards shifts positions, which a mounted
+                # deck's overlay cannot follow, so such a deck is copied in first
+                if record['op'] in RESHAPING_OPS:
+                    for index in sorted({record['deck'], record.get('to', record['deck'])}):
+                        if 'mount' in self.decks[index]:
+                            materialize = {'op': 'materialize_deck', 'deck': index}
+                            changes = self.sync_changes(materialize)
+                            self.apply(materialize)
+                            self.sync_record(changes)
+                            self.unwritten.append(materialize)
+                inverses.append(self.inverse(record))
+                changes = self.sync_changes(record)
+                self.apply(record)
+                self.sync_record(changes)
+                self.unwritten.append(record)
+        finally:
+            self.write_unwritten()
+            self.unwritten = None
+            if self.sync is not None:
+                self.sync.write_log()
+        self.evict_decks(keep=self.current_deck)
+        if self.storage.needs_compaction():
+            self.save_decks()
+        return [inverse for step in reversed(inverses) for inverse in step]
+    
+    def sync_changes(self, record):
+        # Read before record is applied, kept once it is
+        if self.sync is None:
+            return None
+        return self.sync.changes(self, record)
+    
+    def sync_record(self, changes):
+        if changes:
+            self.sync.record(changes)
+    
+    def write_unwritten(self):
+        if self.unwritten:
+            self.storage.write_many(self.unwritten)
+            self.unwritten.clear()
+    
+    def inverse(self, record):
+        # Computed before record is applied, from the state it overwrites
+        op = record['op']
+        if op in ('add_deck', 'mount_deck'):
+            return [{'op': 'delete_deck', 'deck': len(self.decks)}]
+        if op == 'insert_deck':
+            return [{'op': 'delete_deck', 'deck': record['deck']}]
+        if op == 'edit_deck':
+            return [{'op': 'edit_deck', 'deck': record['deck'], 'name': self.decks[record['deck']]['name']}]
+        if op == 'delete_deck':
+            # Deleting the current deck moved the selection; undo moves it back
+            if record['deck'] == self.current_deck_index:
+                return [self.deck_record(record['deck']), {'op': 'select_deck', 'deck': record['deck']}]
+            return [self.deck_record(record['deck'])]
+        if op == 'add_card':
+            return [{'op': 'delete_card', 'deck': record['deck'], 'card': self.decks[record['deck']]['count']}]
+        if op == 'add_cards':
+            # One record, so undoing an import chunk is one journal line
+            count = self.decks[record['deck']]['count']
+            return [{'op': 'delete_cards', 'deck': record['deck'],
+                     'cards': list(range(count, count + len(record['cards'])))}]
+        if op == 'insert_card':
+            return [{'op': 'delete_card', 'deck': record['deck'], 'card': record['card']}]
+        if op == 'insert_cards':
+            return [{'op': 'delete_cards', 'deck': record['deck'], 'cards': [item[0] for item in record['cards']]}]
+        if op in ('delete_cards', 'move_cards'):
+            positions = sorted(set(record['cards']))
+            rows = self.deck_cards(record['deck']).rows(positions)
+            restore = {'op': 'insert_cards', 'deck': record['deck'],
+                       'cards': [[position, *row] for position, row in zip(positions, rows)]}
+            if op == 'delete_cards':
+                return [restore]
+            # Moved cards sit at the end of the target deck
+            count = self.decks[record['to']]['count']
+            return [{'op': 'delete_cards', 'deck': record['to'], 'cards': list(range(count, count + len(rows)))},
+                    restore]
+        if op in ('edit_card', 'delete_card', 'review_card'):
+            card = self.deck_cards(record['deck'])[record['card']]
+            inverse = {'op': op, 'deck': record['deck'], 'card': record['card']}
+            if op == 'delete_card':
+                inverse['op'] = 'insert_card'
+                fields = CARD_FIELDS
+            else:
+                fields = ('question', 'answer') if op == 'edit_card' else REVIEW_FIELDS
+            for name in fields:
+                inverse[name] = getattr(card, name)
+            return [inverse]
+        # Selecting a deck is not undone, and materializing changes no card
+        return []
+    
+    def deck_record(self, index):
+        # An insert_deck record that brings a deck back where it was
+        deck = self.decks[index]
+        cards = self.deck_cards(index)
+        record = {'op': 'insert_deck', 'deck': index, 'name': deck['name'], 'id': deck['id']}
+        if 'mount' in deck:
+            record['mount'] = deck['mount']
+            record['cards'] = cards.overlay_items()
+        else:
+            record['cards'] = list(zip(*(cards.columns[name] for name in CARD_FIELDS)))
+        return record
+    
+    def apply(self, record):
+        op = record['op']
+        if op == 'add_deck':
+            # Records journaled before ids existed get one on replay
+            self.append_deck({'id': record.get('id') or new_id(), 'name': record['name'],
+                              'cards': CardColumns(), 'count': 0})
+        elif op == 'edit_deck':
+            self.decks[record['deck']]['name'] = record['name']
+        elif op == 'delete_deck':
+            deck = self.decks.pop(record['deck'])
+            del self.decks_by_id[deck['id']]
+            self.deck_positions = None
+            self.loaded_decks.pop(id(deck), None)
+            if self.duplicates is not None:
+                self.duplicates.drop_deck(id(deck))
+            if record['deck'] == self.current_deck_index:
+                self.current_card_index = 0
+            self.current_deck_index = shift_current_deck(self.current_deck_index, op, record['deck'], len(self.decks))
+        elif op == 'insert_deck':
+            if record.get('mount'):
+                from .mounted import mount_cards
+                cards = mount_cards(record['mount'], record['cards'])
+            else:
+                cards = CardColumns.from_rows(record['cards'])
+            deck = {'id': record.get('id') or new_id(), 'name': record['name'],
+                    'cards': cards, 'count': len(cards), 'dirty': True}
+            if record.get('mount'):
+                deck['mount'] = record['mount']
+            self.decks.insert(record['deck'], deck)
+            self.decks_by_id[deck['id']] = deck
+            self.deck_positions = None
+            self.current_deck_index = shift_current_deck(self.current_deck_index, op, record['deck'], len(self.decks))
+            if self.duplicates is not None:
+                for card in cards:
+                    self.duplicates.add(id(deck), card.question)
+        elif op == 'select_deck':
+            self.current_deck_index = record['deck']
+        elif op == 'mount_deck':
+            from .mounted import mount_cards
+            deck_id = record.get('id') or new_id()
+            mount = {'path': record['path'], 'name': record['name'], 'salt': deck_id}
+            if record.get('checked'):
+                mount['checked'] = record['checked']
+            cards = mount_cards(mount)
+            deck = {
+                'id': deck_id,
+                'name': record['name'],
+                'cards': cards,
+                'count': len(cards),
+                'mount': mount
+            }
+            self.append_deck(deck)
+            if self.duplicates is not None:
+                for card in cards:
+                    self.duplicates.add(id(deck), card.question)
+        elif op == 'materialize_deck':
+            deck = self.decks[record['deck']]
+            deck['cards'] = self.deck_cards(record['deck']).materialize()
+            del deck['mount']
+            deck['dirty'] = True
+        elif op == 'add_card':
+            self.append_card(record['deck'], record['question'], record['answer'], record.get('id'))
+        elif op == 'add_cards':
+            for (question, answer), card_id in zip(record['cards'], record.get('ids') or [None] * len(record['cards'])):
+                self.append_card(record['deck'], question, answer, card_id)
+        elif op == 'edit_card':
+            deck = self.decks[record['deck']]
+            card = self.deck_cards(record['deck'])[record['card']]
+            if deck.get('search') is not None:
+                deck['search'].remove(card.id, card.question, card.answer)
+                deck['search'].add(card.id, record['question'], record['answer'])
+            if self.duplicates is not None:
+                self.duplicates.remove(id(deck), card.question)
+                self.duplicates.add(id(deck), record['question'])
+            card.question = record['question']
+            card.answer = record['answer']
+            deck['dirty'] = True
+        elif op == 'delete_card':
+            deck = self.decks[record['deck']]
+            cards = self.deck_cards(record['deck'])
+            card = cards.pop(record['card'])
+            if self.duplicates is not None:
+                self.duplicates.remove(id(deck), card.question)
+            if deck.get('search') is not None:
+                deck['search'].remove(card.id, card.question, card.answer)
+            if deck.get('positions') is not None:
+                deck['positions'].remove(card.id)
+            deck['count'] -= 1
+            deck['dirty'] = True
+            # Positions shifted, so the due queue is rebuilt on next use
+            deck['queue'] = None
+            # Adjust current card index if needed
+            if record['deck'] == self.current_deck_index:
+                if self.current_card_index >= len(cards) and len(cards) > 0:
+                    self.current_card_index = len(cards) - 1
+                elif len(cards) == 0:
+                    self.current_card_index = 0
+        elif op == 'insert_card':
+            deck = self.decks[record['deck']]
+            card = FlashCard(**{name: record[name] for name in CARD_FIELDS if name in record})
+            self.deck_cards(record['deck']).insert(record['card'], card)
+            if self.duplicates is not None:
+                self.duplicates.add(id(deck), record['question'])
+            if deck.get('search') is not None:
+                deck['search'].add(card.id, card.question, card.answer)
+            deck['count'] += 1
+            deck['dirty'] = True
+            deck['queue'] = None
+            deck['positions'] = None
+        elif op == 'insert_cards':
+            deck = self.decks[record['deck']]
+            cards = self.deck_cards(record['deck'])
+            cards.insert_rows([(item[0], item[1:]) for item in record['cards']])
+            if self.duplicates is not None:
+                for item in record['cards']:
+                    self.duplicates.add(id(deck), item[1])
+            if deck.get('search') is not None:
+                # Rows journaled before ids existed got theirs on insert
+                ids = cards.columns['id']
+                for item in record['cards']:
+                    deck['search'].add(ids[item[0]], item[1], item[2])
+            deck['positions'] = None
+            self.reshaped(record['deck'], len(record['cards']))
+        elif op == 'delete_cards':
+            deck = self.decks[record['deck']]
+            rows = self.deck_cards(record['deck']).remove(record['cards'])
+            if self.duplicates is not None:
+                for row in rows:
+                    self.duplicates.remove(id(deck), row[0])
+            self.forget_rows(deck, rows)
+            self.reshaped(record['deck'], -len(rows))
+        elif op == 'move_cards':
+            source = self.decks[record['deck']]
+            rows = self.deck_cards(record['deck']).remove(record['cards'])
+            # Marked dirty before the target is loaded, which may evict it
+            self.reshaped(record['deck'], -len(rows))
+            if self.duplicates is not None:
+                for row in rows:
+                    self.duplicates.remove(id(source), row[0])
+            self.forget_rows(source, rows)
+            target = self.decks[record['to']]
+            cards = self.deck_cards(record['to'])
+            start = len(cards)
+            cards.extend(rows)
+            if self.duplicates is not None:
+                for row in rows:
+                    self.duplicates.add(id(target), row[0])
+            if target.get('queue') is not None:
+                for i, row in enumerate(rows, start):
+                    heapq.heappush(target['queue'], (row[2], i))
+            if target.get('search') is not None:
+                for row in rows:
+                    target['search'].add(row[-1], row[0], row[1])
+            if target.get('positions') is not None:
+                for i, row in enumerate(rows, start):
+                    target['positions'][row[-1]] = i
+            target['count'] += len(rows)
+            target['dirty'] = True
+        elif op == 'review_card':
+            deck = self.decks[record['deck']]
+            card = self.deck_cards(record['deck'])[record['card']]
+            for name in REVIEW_FIELDS:
+                setattr(card, name, record[name])
+            deck['dirty'] = True
+            if deck.get('queue') is not None:
+                heapq.heappush(deck['queue'], (record['due'], record['card']))
+    
+    def reshaped(self, index, added):
+        # Bookkeeping after cards were inserted into or removed from the
+        # middle of a deck
+        deck = self.decks[index]
+        deck['count'] += added
+        deck['dirty'] = True
+        # Positions shifted, so the due queue is rebuilt on next use; the
+        # search index is keyed by id and kept
+        deck['queue'] = None
+        if index == self.current_deck_index:
+            self.current_card_index = max(0, min(self.current_card_index, deck['count'] - 1))
+    
+    def forget_rows(self, deck, rows):
+        # Drops removed cards, as rows, from the id-keyed search index and
+        # position map
+        if deck.get('search') is not None:
+            for row in rows:
+                deck['search'].remove(row[-1], row[0], row[1])
+        if deck.get('positions') is not None:
+            for row in rows:
+                deck['positions'].remove(row[-1])
+    
+    def append_deck(self, deck):
+        self.decks.append(deck)
+        self.decks_by_id[deck['id']] = deck
+        if self.deck_positions is not None:
+            self.deck_positions[deck['id']] = len(self.decks) - 1
+    
+    def append_card(self, index, question, answer, card_id=None):
+        deck = self.decks[index]
+        cards = self.deck_cards(index)
+        card = FlashCard(question, answer, id=card_id)
+        cards.append(card)
+        if deck.get('positions') is not None:
+            deck['positions'][card.id] = len(cards) - 1
+        deck['count'] += 1
+        deck['dirty'] = True
+        if deck.get('queue') is not None:
+            heapq.heappush(deck['queue'], (0.0, len(cards) - 1))
+        if deck.get('search') is not None:
+            deck['search'].add(card.id, question, answer)
+        if self.duplicates is not None:
+            self.duplicates.add(id(deck), question)
+    
+    def save_decks(self):
+        try:
+            self.storage.save(self.decks, self.current_deck_index)
+        except SnapshotCorrupt as e:
+            # Copying an unloaded deck found it damaged; the recovered
+            # library is saved in its place
+            print(f"Error saving decks: {e}")
+            self.recover_decks()
+            return
+        if self.reviews is not None:
+            self.reviews.save()
+    
+    def flush(self):
+        # Waits for writes still queued by a write-behind storage
+        self.storage.flush()
+    
+    def recover_decks(self):
+        # The snapshot is damaged: everything is read again from the newest
+        # backup that is intact plus the journals after it, which hold every
+        # change written so far
+        self.write_unwritten()
+        self.flush()
+        self.loaded_decks.clear()
+        self.duplicates = None
+        self.load_decks()
+    
+    def load_decks(self):
+        self.loading = True
+        try:
+            self.read_decks()
+        except SnapshotCorrupt as e:
+            # The storage marked its snapshot corrupt, so this reads backups
+            print(f"Error replaying journal: {e}")
+            self.loaded_decks.clear()
+            self.read_decks()
+        finally:
+            self.loading = False
+        if self.storage.needs_full_save and not self.read_only:
+            self.save_decks()
+    
+    def read_decks(self):
+        self.decks, self.current_deck_index, records = self.storage.load()
+        self.decks_by_id = {deck['id']: deck for deck in self.decks}
+        self.deck_positions = None
+        for deck in self.decks:
+            if deck['cards'] is not None:
+                self.loaded_decks[id(deck)] = deck
+        for record in records:
+            try:
+                self.apply(record)
+            except (KeyError, IndexError) as e:
+                print(f"Error replaying journal: {e}")
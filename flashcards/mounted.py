@@ -0,0 +1,245 @@
+import mmap
+import os
+from array import array
+from itertools import accumulate
+
+from .binary import CHECKSUM, decode_directory, file_checksum_ok, map_deck
+from .cards import CARD_FIELDS, REVIEW_FIELDS, CardColumns
+
+
+class MappedText:
+    # Read-only strings in a mapped UTF-8 blob, decoded on access
+    def __init__(self, data, lengths):
+        self.data = data
+        self.lengths = lengths
+        self.starts = array('Q', accumulate(lengths, initial=0))
+        self.starts.pop()
+    
+    def __len__(self):
+        return len(self.lengths)
+    
+    def __getitem__(self, index):
+        start = self.starts[index]
+        return str(self.data[start:start + self.lengths[index]], 'utf-8')
+    
+    def __iter__(self):
+        for i in range(len(self.lengths)):
+            yield self[i]
+
+
+class DerivedIds:
+    # Card ids for files from before version 3, which store none: made of
+    # the file's checksum and the card's position, so a card keeps its id
+    # every time the file is mounted
+    def __init__(self, seed, count):
+        self.base = (seed & 0x7fffffff) << 32
+        self.count = count
+    
+    def __len__(self):
+        return self.count
+    
+    def __getitem__(self, index):
+        if not 0 <= index < self.count:
+            raise IndexError('card index out of range')
+        return self.base | index
+    
+    def __iter__(self):
+        return iter(range(self.base, self.base + self.count))
+
+
+class SaltedIds:
+    # Card ids of a deck mounted since decks had ids: the file's mixed with
+    # the deck's, so two decks mounted from one file, here or on another
+    # device, do not share card ids
+    def __init__(self, ids, salt):
+        self.ids = ids
+        self.salt = salt
+    
+    def __len__(self):
+        return len(self.ids)
+    
+    def __getitem__(self, index):
+        return salted_id(self.salt, self.ids[index])
+    
+    def __iter__(self):
+        salt = self.salt
+        return (salted_id(salt, card_id) for card_id in self.ids)
+
+
+class MappedColumn:
+    # One column of a mounted deck: values come from the file until a card
+    # is written, then from a per-card overlay
+    def __init__(self, base, changed):
+        self.base = base
+        self.overlay = {}
+        # Shared by the deck's columns: positions of every written card
+        self.changed = changed
+    
+    def __len__(self):
+        return len(self.base)
+    
+    def __getitem__(self, index):
+        if index in self.overlay:
+            return self.overlay[index]
+        return self.base[index]
+    
+    def __setitem__(self, index, value):
+        self.overlay[index] = value
+        self.changed.add(index)
+    
+    def __iter__(self):
+        if not self.overlay:
+            return iter(self.base)
+        return (self[i] for i in range(len(self.base)))
+
+
+class MappedCards(CardColumns):
+    # Cards of one deck in a binary snapshot file, e.g. a shipped reference
+    # deck, read in place through mmap; the file is never written, edits and
+    # reviews go to the overlay and adding or removing cards needs
+    # materialize() first. checked is the stamp the file was last checked
+    # at, see check_file(); self.checked is the one to keep for next time
+    def __init__(self, path, name=None, salt=None, checked=None):
+        self.checked = check_file(path, checked)
+        with open(path, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self.map)
+        entry, version = find_deck(view, name)
+        self.name = entry['name']
+        question_lengths, answer_lengths, review, questions, answers = map_deck(
+            view[entry['offset']:entry['offset'] + entry['length']], version)
+        if review['id'] is None:
+            checksum, = CHECKSUM.unpack_from(view, len(view) - CHECKSUM.size)
+            review['id'] = DerivedIds(checksum, len(question_lengths))
+        if salt is not None:
+            review['id'] = SaltedIds(review['id'], salt)
+        
+        self.changed = set()
+        self.columns = {
+            'question': MappedColumn(MappedText(questions, question_lengths), self.changed),
+            'answer': MappedColumn(MappedText(answers, answer_lengths), self.changed)
+        }
+        for field in REVIEW_FIELDS + ('id',):
+            self.columns[field] = MappedColumn(review[field], self.changed)
+    
+    def append(self, card):
+        raise TypeError('mounted decks are read-only')
+    
+    def insert(self, index, card):
+        raise TypeError('mounted decks are read-only')
+    
+    def pop(self, index=-1):
+        raise TypeError('mounted decks are read-only')
+    
+    def extend(self, rows):
+        raise TypeError('mounted decks are read-only')
+    
+    def select(self, indexes):
+        raise TypeError('mounted decks are read-only')
+    
+    def copy(self):
+        # Shares the mapped file; only the overlay is copied
+        cards = CardColumns.__new__(MappedCards)
+        cards.__dict__.update(self.__dict__)
+        cards.changed = set(self.changed)
+        cards.columns = {}
+        for field, column in self.columns.items():
+            cards.columns[field] = MappedColumn(column.base, cards.changed)
+            cards.columns[field].overlay = dict(column.overlay)
+        return cards
+    
+    def overlay_items(self):
+        # Written cards as JSON-ready dicts, with their position
+        items = []
+        for index in sorted(self.changed):
+            card = self[index]
+            item = {'index': index}
+            for field in CARD_FIELDS:
+                item[field] = getattr(card, field)
+            items.append(item)
+        return items
+    
+    def apply_overlay(self, items):
+        # Ids always come from the file
+        for item in items:
+            card = self[item['index']]
+            for field in ('question', 'answer') + REVIEW_FIELDS:
+                setattr(card, field, item[field])
+    
+    def materialize(self):
+        # A regular in-memory copy, overlay included
+        return CardColumns.from_rows(
+            tuple(getattr(card, field) for field in CARD_FIELDS) for card in self
+        )
+
+
+class UnavailableCards(MappedCards):
+    # Stands in for a mounted deck whose file is missing or damaged: no
+    # cards, but the overlay is kept, so the deck's edits and reviews are
+    # saved again and come back once the file does
+    def __init__(self, error, overlay=()):
+        CardColumns.__init__(self)
+        self.error = error
+        self.overlay = list(overlay)
+    
+    def copy(self):
+        return UnavailableCards(self.error, self.overlay)
+    
+    def overlay_items(self):
+        return self.overlay
+    
+    def materialize(self):
+        raise TypeError(f'mounted deck file is unavailable: {self.error}')
+
+
+def salted_id(salt, card_id):
+    # splitmix64 finalizer over both ids, cut to 63 bits like new_id()
+    z = (salt ^ (card_id * 0x9e3779b97f4a7c15)) & 0xffffffffffffffff
+    z = ((z ^ (z >> 30)) * 0xbf58476d1ce4e5b9) & 0xffffffffffffffff
+    z = ((z ^ (z >> 27)) * 0x94d049bb133111eb) & 0xffffffffffffffff
+    return (z ^ (z >> 31)) >> 1
+
+
+def find_deck(view, name=None):
+    # Returns the deck's directory entry and the file's format version
+    entries, current_deck_index, journal_seq, version = decode_directory(view, verify=False)
+    for entry in entries:
+        if name is None or entry['name'] == name:
+            if entry.get('mount'):
+                raise ValueError(f"deck {entry['name']!r} is itself mounted")
+            return entry, version
+    raise ValueError(f'no deck named {name!r}')
+
+
+def check_file(path, checked=None):
+    # Checks a deck file whole unless its size and mtime are still those of
+    # checked; returns them as the [size, mtime_ns] stamp to keep
+    stat = os.stat(path)
+    stamp = [stat.st_size, stat.st_mtime_ns]
+    if stamp != checked and not file_checksum_ok(path):
+        raise ValueError(f'{path}: snapshot checksum mismatch')
+    return stamp
+
+
+def deck_name(path, name=None):
+    # Resolves the deck a mount refers to without checking the whole file
+    with open(path, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            with memoryview(data) as view:
+                return find_deck(view, name)[0]['name']
+
+
+def mount_cards(mount, overlay=()):
+    # Cards of a mount as saved in a snapshot: {'path', 'name', 'salt',
+    # 'checked'}, salt missing from mounts older than deck ids and checked
+    # from those never opened since stamps, plus the overlay items of its
+    # written cards. The stamp is updated in mount; a file that cannot be
+    # read gives UnavailableCards
+    try:
+        cards = MappedCards(mount['path'], mount['name'], mount.get('salt'), mount.get('checked'))
+    except (OSError, ValueError) as e:
+        print(f"Error mounting {mount['path']}: {e}")
+        return UnavailableCards(str(e), overlay)
+    mount['checked'] = cards.checked
+    cards.apply_overlay(overlay)
+    return cards
@@ -0,0 +1,107 @@
+import os
+import struct
+import zlib
+from array import array
+
+from .binary import little_endian
+
+
+# Append-only log of every review, as columns: each append writes a chunk
+# of a header (magic, row count, crc32 of the payload) then each column's
+# values for those rows, little-endian, so loading copies bytes straight
+# into arrays. Reading stops at the first bad chunk, the torn end of an
+# interrupted append, and the file is then rewritten without it
+CHUNK_MAGIC = b'RVLG'
+CHUNK_HEADER = struct.Struct('<4sII')
+# Card and deck ids, review time, the interval in days the card had been
+# scheduled for, grade (SM-2 quality) and seconds taken to answer, 0 if
+# unknown
+COLUMNS = (('card', 'Q'), ('deck', 'Q'), ('time', 'd'), ('interval', 'd'), ('grade', 'B'), ('response', 'f'))
+ROW_SIZE = sum(array(typecode).itemsize for name, typecode in COLUMNS)
+
+
+def empty_columns():
+    return {name: array(typecode) for name, typecode in COLUMNS}
+
+
+def encode_chunk(columns):
+    payload = b''.join(little_endian(columns[name]).tobytes() for name, typecode in COLUMNS)
+    return CHUNK_HEADER.pack(CHUNK_MAGIC, len(columns['card']), zlib.crc32(payload)) + payload
+
+
+def decode_chunks(data):
+    # Returns the columns and the number of chunks read, and whether a bad
+    # chunk cut the reading short
+    columns = empty_columns()
+    offset = 0
+    chunks = 0
+    while offset < len(data):
+        if len(data) - offset < CHUNK_HEADER.size:
+            return columns, chunks, True
+        magic, count, crc = CHUNK_HEADER.unpack_from(data, offset)
+        start = offset + CHUNK_HEADER.size
+        payload = data[start:start + count * ROW_SIZE]
+        if magic != CHUNK_MAGIC or len(payload) != count * ROW_SIZE or zlib.crc32(payload) != crc:
+            return columns, chunks, True
+        position = 0
+        for name, typecode in COLUMNS:
+            values = array(typecode)
+            size = count * values.itemsize
+            values.frombytes(payload[position:position + size])
+            columns[name].extend(little_endian(values))
+            position += size
+        offset = start + len(payload)
+        chunks += 1
+    return columns, chunks, False
+
+
+class ReviewLog:
+    # Columns are read from the file on first use; rows appended meanwhile
+    # go straight to the file
+    # Chunks past which loading rewrites the file as one chunk
+    max_chunks = 64
+    
+    def __init__(self, path='flashcards.reviews'):
+        self.path = path
+        self.loaded = None
+    
+    @property
+    def columns(self):
+        if self.loaded is None:
+            self.load()
+        return self.loaded
+    
+    def __len__(self):
+        return len(self.columns['card'])
+    
+    def size(self):
+        return os.path.getsize(self.path) if os.path.exists(self.path) else 0
+    
+    def load(self):
+        data = b''
+        if os.path.exists(self.path):
+            with open(self.path, 'rb') as f:
+                data = f.read()
+        self.loaded, chunks, torn = decode_chunks(data)
+        if torn:
+            print(f"Dropping a torn chunk at the end of {self.path}")
+        if torn or chunks > self.max_chunks:
+            self.rewrite()
+    
+    def rewrite(self):
+        with open(self.path + '.tmp', 'wb') as f:
+            f.write(encode_chunk(self.loaded))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(self.path + '.tmp', self.path)
+    
+    def append(self, card_id, deck_id, time, interval, grade, response=0.0):
+        row = dict(zip((name for name, typecode in COLUMNS), (card_id, deck_id, time, interval, grade, response)))
+        if self.loaded is not None:
+            for name, value in row.items():
+                self.loaded[name].append(value)
+        chunk = empty_columns()
+        for name, value in row.items():
+            chunk[name].append(value)
+        with open(self.path, 'ab') as f:
+            f.write(encode_chunk(chunk))
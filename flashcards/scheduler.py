@@ -0,0 +1,84 @@
+import heapq
+import time
+
+
+# Seconds before a failed card comes back in the same session
+RELEARN_DELAY = 60
+
+
+def sm2_review(card, quality, now):
+    # SM-2 with quality 0-5; returns the new (due, interval, ease, reps)
+    ease = max(1.3, card.ease + 0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02))
+    if quality < 3:
+        return now + RELEARN_DELAY, 0.0, ease, 0
+    reps = card.reps + 1
+    if reps == 1:
+        interval = 1.0
+    elif reps == 2:
+        interval = 6.0
+    else:
+        interval = round(card.interval * card.ease, 2)
+    return now + interval * 86400, interval, ease, reps
+
+
+class StudySession:
+    # Review across several decks: a k-way merge keyed by each deck's
+    # earliest due time, so a deck is only loaded once one of its cards
+    # is next. Decks are held by id, as positions may change while the
+    # session runs, e.g. when a sync deletes a deck
+    def __init__(self, manager, deck_indices=None):
+        self.manager = manager
+        self.home_deck_id = manager.current_deck['id'] if manager.current_deck else None
+        self.reviewed = 0
+        self.lapses = 0
+        
+        if deck_indices is None:
+            deck_indices = range(len(manager.decks))
+        self.heap = []
+        for index in deck_indices:
+            next_due = manager.deck_next_due(index)
+            if next_due is not None:
+                self.heap.append((next_due, manager.decks[index]['id']))
+        heapq.heapify(self.heap)
+    
+    def next_card(self, now=None):
+        # Point the manager at the most overdue card of all decks
+        now = time.time() if now is None else now
+        while self.heap:
+            estimate, deck_id = self.heap[0]
+            if estimate > now:
+                return False
+            index = self.manager.deck_index(deck_id)
+            head = None if index is None else self.manager.peek_due(index)
+            if head is None:
+                heapq.heappop(self.heap)
+            elif head[0] != estimate:
+                heapq.heapreplace(self.heap, (head[0], deck_id))
+            else:
+                self.manager.current_deck_index = index
+                self.manager.current_card_index = head[1]
+                return True
+        return False
+    
+    def grade(self, quality, now=None, response_time=None):
+        index = self.manager.current_deck_index
+        deck_id = self.manager.decks[index]['id']
+        self.manager.grade_card(quality, now, response_time)
+        self.reviewed += 1
+        if quality < 3:
+            self.lapses += 1
+        
+        # Re-key the graded deck with its new earliest due time
+        head = self.manager.peek_due(index)
+        if head is None:
+            return
+        if self.heap and self.heap[0][1] == deck_id:
+            heapq.heapreplace(self.heap, (head[0], deck_id))
+        else:
+            heapq.heappush(self.heap, (head[0], deck_id))
+    
+    def close(self):
+        index = self.manager.deck_index(self.home_deck_id)
+        if index is not None:
+            self.manager.current_deck_index = index
+        self.manager.current_card_index = 0
@@ -0,0 +1,218 @@
+import bisect
+import re
+import unicodedata
+import zlib
+
+
+# Combining accents left behind by NFKD are dropped for search, and the
+# ligatures NFKD keeps are spelled out
+SEARCH_FOLDING = dict.fromkeys(range(0x300, 0x370))
+SEARCH_FOLDING.update({ord('œ'): 'oe', ord('æ'): 'ae'})
+
+
+def search_tokens(text):
+    # Lowercase words without accents, so "ete" finds "Été"
+    text = unicodedata.normalize('NFKD', text.casefold()).translate(SEARCH_FOLDING)
+    return re.findall(r'\w+', text)
+
+
+class SearchIndex:
+    # Inverted index of one deck's questions and answers, by card id, so
+    # adding, moving or deleting cards never shifts its entries
+    def __init__(self, cards=None):
+        self.postings = {}
+        # Sorted vocabulary for prefix lookups, rebuilt after new terms
+        self.terms = []
+        if cards is not None:
+            # Straight from the columns, one tokenizing pass per card
+            columns = cards.columns
+            for card_id, question, answer in zip(columns['id'], columns['question'], columns['answer']):
+                self.add(card_id, question + '\n' + answer)
+    
+    def add(self, card_id, *texts):
+        for term in {term for text in texts for term in search_tokens(text)}:
+            card_ids = self.postings.get(term)
+            if card_ids is None:
+                card_ids = self.postings[term] = set()
+                self.terms = None
+            card_ids.add(card_id)
+    
+    def remove(self, card_id, *texts):
+        for text in texts:
+            for term in search_tokens(text):
+                card_ids = self.postings.get(term)
+                if card_ids is not None:
+                    card_ids.discard(card_id)
+    
+    def prefix_matches(self, prefix):
+        if self.terms is None:
+            self.terms = sorted(self.postings)
+        matches = set()
+        i = bisect.bisect_left(self.terms, prefix)
+        while i < len(self.terms) and self.terms[i].startswith(prefix):
+            matches |= self.postings[self.terms[i]]
+            i += 1
+        return matches
+    
+    def search(self, query):
+        # Ids of the cards where every word of the query starts a word
+        result = None
+        for token in search_tokens(query):
+            matches = self.prefix_matches(token)
+            result = matches if result is None else result & matches
+            if not result:
+                return set()
+        return result or set()
+
+
+# MinHash signature: bands of rows over one-permutation hash bins
+MINHASH_BANDS = 4
+MINHASH_ROWS = 3
+# Shingle Jaccard similarity from which two questions are near duplicates
+NEAR_DUPLICATE_THRESHOLD = 0.7
+
+
+def normalize_question(text):
+    return ' '.join(search_tokens(text))
+
+
+def shingles(text):
+    # Character trigrams of a normalized question
+    if len(text) < 3:
+        return {text}
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def jaccard(a, b):
+    return len(a & b) / len(a | b) if a or b else 1.0
+
+
+def minhash_bands(shingle_set):
+    # One hash per shingle, binned so each bin keeps its minimum. Short
+    # questions leave most bins empty; an empty bin borrows the value of
+    # the next filled one to its right, offset by the distance (rotation
+    # densification), so empty bins never make unrelated questions share
+    # a bucket
+    size = MINHASH_BANDS * MINHASH_ROWS
+    bins = [-1] * size
+    for shingle in shingle_set:
+        value = zlib.crc32(shingle.encode('utf-8'))
+        slot = value % size
+        if bins[slot] < 0 or value < bins[slot]:
+            bins[slot] = value
+    filled = [slot for slot in range(size) if bins[slot] >= 0]
+    if not filled:
+        return []
+    dense = list(bins)
+    for slot in range(size):
+        if bins[slot] < 0:
+            # crc32 values fit in 32 bits, so borrowed values never equal
+            # a real one
+            source = filled[bisect.bisect_left(filled, slot) % len(filled)]
+            dense[slot] = bins[source] + ((source - slot) % size << 32)
+    return [(band, tuple(dense[band * MINHASH_ROWS:(band + 1) * MINHASH_ROWS]))
+            for band in range(MINHASH_BANDS)]
+
+
+class DuplicateIndex:
+    # Exact duplicates by normalized question, near duplicates through
+    # MinHash LSH buckets; entries count cards per deck key, so the index
+    # survives position shifts
+    def __init__(self):
+        self.decks_by_question = {}
+        self.samples = {}
+        self.buckets = {}
+    
+    def add(self, deck_key, question):
+        norm = normalize_question(question)
+        counts = self.decks_by_question.get(norm)
+        if counts is None:
+            counts = self.decks_by_question[norm] = {}
+            self.samples[norm] = question
+            for band in minhash_bands(shingles(norm)):
+                self.buckets.setdefault(band, set()).add(norm)
+        counts[deck_key] = counts.get(deck_key, 0) + 1
+    
+    def remove(self, deck_key, question):
+        norm = normalize_question(question)
+        counts = self.decks_by_question.get(norm)
+        if counts is None or deck_key not in counts:
+            return
+        counts[deck_key] -= 1
+        if counts[deck_key] == 0:
+            del counts[deck_key]
+        if not counts:
+            self.forget(norm)
+    
+    def drop_deck(self, deck_key):
+        for norm in [norm for norm, counts in self.decks_by_question.items() if deck_key in counts]:
+            del self.decks_by_question[norm][deck_key]
+            if not self.decks_by_question[norm]:
+                self.forget(norm)
+    
+    def forget(self, norm):
+        del self.decks_by_question[norm]
+        del self.samples[norm]
+        for band in minhash_bands(shingles(norm)):
+            bucket = self.buckets.get(band)
+            if bucket is not None:
+                bucket.discard(norm)
+                if not bucket:
+                    del self.buckets[band]
+    
+    def find(self, question):
+        # Returns ({deck key: count} of exact matches, [similar questions])
+        norm = normalize_question(question)
+        exact = dict(self.decks_by_question.get(norm, {}))
+        norm_shingles = shingles(norm)
+        candidates = set()
+        for band in minhash_bands(norm_shingles):
+            candidates |= self.buckets.get(band, set())
+        candidates.discard(norm)
+        similar = [self.samples[other] for other in candidates
+                   if jaccard(norm_shingles, shingles(other)) >= NEAR_DUPLICATE_THRESHOLD]
+        return exact, similar
+    
+    def report(self):
+        # Exact groups: (question, {deck key: count}) seen more than once;
+        # near pairs: (question, question, similarity) sharing an LSH bucket
+        exact = [(self.samples[norm], counts) for norm, counts in self.decks_by_question.items()
+                 if sum(counts.values()) > 1]
+        near = {}
+        for bucket in self.buckets.values():
+            members = sorted(bucket)
+            for i, a in enumerate(members):
+                for b in members[i + 1:]:
+                    if (a, b) not in near:
+                        near[(a, b)] = jaccard(shingles(a), shingles(b))
+        near_pairs = [(self.samples[a], self.samples[b], score) for (a, b), score in near.items()
+                      if score >= NEAR_DUPLICATE_THRESHOLD]
+        return exact, near_pairs
+
+
+class PendingDuplicates:
+    # Stands in for a DuplicateIndex built on another thread, see
+    # FlashCardManager.build_duplicates(): keeps the decks whose questions
+    # were handed to the builder, by key, and the changes made to them
+    # since, to replay onto the index once it is built. Holding the decks
+    # keeps their keys from being reused meanwhile
+    def __init__(self):
+        self.read = {}
+        self.changes = []
+    
+    def add(self, deck_key, question):
+        if deck_key in self.read:
+            self.changes.append(('add', deck_key, question))
+    
+    def remove(self, deck_key, question):
+        if deck_key in self.read:
+            self.changes.append(('remove', deck_key, question))
+    
+    def drop_deck(self, deck_key):
+        if deck_key in self.read:
+            self.changes.append(('drop_deck', deck_key))
+    
+    def replay(self, index):
+        for op, *args in self.changes:
+            getattr(index, op)(*args)
+        self.changes = []
@@ -0,0 +1,1084 @@
+import json
+import mmap
+import os
+import threading
+import time
+import zlib
+
+from .binary import CHECKSUM, VERSION, decode_deck, decode_directory, directory_checksum, encode_deck, encode_directory, encode_header
+from .cards import CARD_FIELDS, REVIEW_FIELDS, CardColumns, card_item, card_row, new_id
+from .mounted import mount_cards
+
+# Columns of the cards table holding CARD_FIELDS, in that order: the card
+# id is uid, the row id being what orders a deck's cards
+CARD_COLUMNS = ', '.join(('question', 'answer') + REVIEW_FIELDS + ('uid',))
+CARD_PLACEHOLDERS = ', '.join('?' * len(CARD_FIELDS))
+
+
+class SnapshotCorrupt(ValueError):
+    # A deck's cards did not match the checksum the index holds for them;
+    # the storage marks its snapshot corrupt, so the next load() falls
+    # back to a backup
+    pass
+
+
+def check_range(data, deck):
+    # Decks indexed before per-deck checksums have none to check
+    if deck.get('crc') is not None and zlib.crc32(data) != deck['crc']:
+        raise SnapshotCorrupt(f"cards of deck {deck['name']!r} fail their checksum")
+
+
+def shift_current_deck(current, op, position, count):
+    # Position of the current deck once a delete_deck or insert_deck at
+    # position leaves count decks: it follows its deck, and a deleted one
+    # gives way to the deck after it, or the last
+    if op == 'delete_deck':
+        if position < current:
+            return current - 1
+        return min(current, max(count - 1, 0))
+    if position <= current and count > 1:
+        return current + 1
+    return current
+
+
+def check_snapshot(raw):
+    # Snapshots end with a crc32 of everything before the checksum field;
+    # older snapshots without one are taken as they are
+    marker = raw.rfind(b'    "checksum": "')
+    if marker < 0:
+        return
+    expected = raw[marker + 17:marker + 25]
+    if f'{zlib.crc32(raw[:marker]):08x}'.encode('ascii') != expected:
+        raise ValueError('snapshot checksum mismatch')
+
+
+def fsync_dir(path):
+    # Make a rename durable; not every platform can open a directory
+    try:
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class JsonStorage:
+    def __init__(self, data_file='flashcards.json', journal_file='flashcards.journal',
+                 index_file='flashcards.index.json'):
+        self.data_file = data_file
+        self.journal_file = journal_file
+        # Deck names, counts and byte ranges of each deck's cards in data_file
+        self.index_file = index_file
+        # Number of journal records after which the snapshot is rewritten
+        self.journal_limit = 500
+        # Previous snapshots and journals kept as data_file.1, .2, ...
+        self.backup_count = 3
+        self.journal_seq = 0
+        self.journal_count = 0
+        self.needs_full_save = False
+        # Set when data_file failed to load, so save() moves it aside
+        self.data_corrupt = False
+    
+    def load(self):
+        # Returns the snapshot decks plus the journal records still to replay
+        self.journal_count = 0
+        # A snapshot found corrupt while in use is only read through its
+        # backups from then on
+        index = None if self.data_corrupt else self.read_index()
+        if index is not None:
+            decks = [{
+                'id': entry['id'],
+                'name': entry['name'],
+                'cards': None,
+                'count': entry['count'],
+                'next_due': entry.get('next_due', 0.0),
+                'offset': entry['offset'],
+                'length': entry['length'],
+                'crc': entry.get('crc')
+            } for entry in index['decks']]
+            for deck, entry in zip(decks, index['decks']):
+                if entry.get('mount'):
+                    deck['mount'] = entry['mount']
+            self.journal_seq = index['journal_seq']
+            return decks, index['current_deck_index'], self.read_journal()
+        
+        # Newest snapshot that reads back intact, falling back to backups
+        self.data_corrupt = False
+        for generation in range(self.backup_count + 1):
+            path = self.generation_file(self.data_file, generation)
+            if not os.path.exists(path):
+                continue
+            try:
+                decks, current_deck_index = self.read_snapshot(path)
+            except (ValueError, KeyError, TypeError) as e:
+                print(f"Error loading decks from {path}: {e}")
+                if generation == 0:
+                    self.data_corrupt = True
+                continue
+            # Rewrite once so the next start only needs the index
+            self.needs_full_save = True
+            if generation == 0:
+                return decks, current_deck_index, self.read_journal()
+            # The backup's later records may sit in rotated journals
+            print(f"Restored decks from {path}")
+            journals = [self.generation_file(self.journal_file, n) for n in range(self.backup_count, -1, -1)]
+            return decks, current_deck_index, self.read_journal(journals)
+        
+        if self.data_corrupt:
+            # Nothing readable; save() keeps the damaged file aside
+            self.needs_full_save = True
+        return [], 0, self.read_journal()
+    
+    def generation_file(self, path, generation):
+        return f'{path}.{generation}' if generation else path
+    
+    def read_snapshot(self, path):
+        with open(path, 'rb') as f:
+            raw = f.read()
+        check_snapshot(raw)
+        data = json.loads(raw.decode('utf-8'))
+        
+        # Handle both old format (list of cards) and new format (decks)
+        if isinstance(data, list):
+            # Old format - convert to new format with one deck
+            decks = [{
+                'id': new_id(),
+                'name': 'Mes Cartes',
+                'cards': CardColumns.from_rows(card_row(item) for item in data)
+            }]
+            current_deck_index = 0
+            self.journal_seq = 0
+        else:
+            # New format with decks
+            decks = []
+            for deck_data in data.get('decks', []):
+                if deck_data.get('mount'):
+                    deck = {
+                        'name': deck_data['name'],
+                        'cards': mount_cards(deck_data['mount'], deck_data['cards']),
+                        'mount': deck_data['mount']
+                    }
+                else:
+                    deck = {
+                        'name': deck_data['name'],
+                        'cards': CardColumns.from_rows(card_row(item) for item in deck_data['cards'])
+                    }
+                # Decks saved before ids existed get one now
+                deck['id'] = deck_data['id'] if 'id' in deck_data else new_id()
+                decks.append(deck)
+            current_deck_index = data.get('current_deck_index', 0)
+            self.journal_seq = data.get('journal_seq', 0)
+        
+        for deck in decks:
+            deck['count'] = len(deck['cards'])
+        return decks, current_deck_index
+    
+    def read_index(self):
+        if not os.path.exists(self.index_file) or not os.path.exists(self.data_file):
+            return None
+        try:
+            with open(self.index_file, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+        except ValueError:
+            return None
+        # An index left over from an older snapshot is ignored, and so is
+        # one from before ids, whose cards would get new ids on every load,
+        # or from before per-deck checksums. A truncated snapshot fails the
+        # size check; damage inside it is caught by the deck's checksum
+        # once its cards are read
+        if index.get('size') != os.path.getsize(self.data_file):
+            return None
+        if any('id' not in entry or 'crc' not in entry for entry in index['decks']):
+            return None
+        return index
+    
+    def read_journal(self, paths=None):
+        # Journals are read oldest first; replay stops at the first gap in
+        # seq, since positional records only make sense in order
+        records = []
+        for path in paths or [self.journal_file]:
+            if not os.path.exists(path):
+                continue
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # Torn last record from an interrupted append: fold the
+                        # readable records into a fresh snapshot so new appends
+                        # never land after a partial line
+                        self.needs_full_save = True
+                        break
+                    # Skip records already folded into the snapshot
+                    if record.get('seq', 0) <= self.journal_seq:
+                        continue
+                    if record['seq'] != self.journal_seq + 1:
+                        print(f"Journal {path} skips from {self.journal_seq} to {record['seq']}")
+                        self.needs_full_save = True
+                        return records
+                    records.append(record)
+                    self.journal_seq = record['seq']
+                    self.journal_count += 1
+        return records
+    
+    def load_cards(self, index, deck):
+        with open(self.data_file, 'rb') as f:
+            f.seek(deck['offset'])
+            data = f.read(deck['length'])
+        self.check_deck(data, deck)
+        items = json.loads(data.decode('utf-8'))
+        if 'mount' in deck:
+            return mount_cards(deck['mount'], items)
+        return CardColumns.from_rows(card_row(item) for item in items)
+    
+    def check_deck(self, data, deck):
+        try:
+            check_range(data, deck)
+        except SnapshotCorrupt:
+            self.data_corrupt = True
+            raise
+    
+    def can_unload(self, deck):
+        # Only decks whose cards match the snapshot can be read back later
+        return 'offset' in deck and not deck.get('dirty')
+    
+    def write(self, record):
+        self.write_many([record])
+    
+    def write_many(self, records):
+        # One append for the whole batch
+        lines = []
+        for record in records:
+            self.journal_seq += 1
+            record = dict(record, seq=self.journal_seq)
+            lines.append(json.dumps(record, ensure_ascii=False) + '\n')
+        with open(self.journal_file, 'a', encoding='utf-8') as f:
+            f.write(''.join(lines))
+        self.journal_count += len(records)
+    
+    def needs_compaction(self):
+        return self.journal_count >= self.journal_limit
+    
+    def encode_cards(self, cards):
+        lines = [json.dumps(card_item(card), ensure_ascii=False) for card in cards]
+        if not lines:
+            return b'[]'
+        return ('[\n            ' + ',\n            '.join(lines) + '\n        ]').encode('utf-8')
+    
+    def save(self, decks, current_deck_index):
+        # The snapshot is written by hand so the byte range of every deck's
+        # cards is known; unloaded decks are copied over without parsing
+        old_file = None
+        if any(deck['cards'] is None for deck in decks):
+            old_file = open(self.data_file, 'rb')
+        tmp_file = self.data_file + '.tmp'
+        entries = []
+        crc = 0
+        try:
+            with open(tmp_file, 'wb') as f:
+                def put(data):
+                    nonlocal crc
+                    crc = zlib.crc32(data, crc)
+                    f.write(data)
+                
+                put(b'{\n    "decks": [')
+                for i, deck in enumerate(decks):
+                    put(b',\n' if i else b'\n')
+                    name = json.dumps(deck['name'], ensure_ascii=False)
+                    put(f'        {{"id": {deck["id"]}, "name": {name}, '.encode('utf-8'))
+                    # A mounted deck keeps only its overlay in "cards"
+                    mount = deck.get('mount')
+                    if mount:
+                        put(f'"mount": {json.dumps(mount, ensure_ascii=False)}, '.encode('utf-8'))
+                    put(b'"cards": ')
+                    if deck['cards'] is None:
+                        old_file.seek(deck['offset'])
+                        cards_json = old_file.read(deck['length'])
+                        # Damage is never copied into a fresh checksum
+                        self.check_deck(cards_json, deck)
+                        next_due = deck.get('next_due', 0.0)
+                    else:
+                        if mount:
+                            cards_json = json.dumps(deck['cards'].overlay_items(), ensure_ascii=False).encode('utf-8')
+                        else:
+                            cards_json = self.encode_cards(deck['cards'])
+                        next_due = min(deck['cards'].columns['due'], default=None)
+                    entries.append({
+                        'id': deck['id'],
+                        'name': deck['name'],
+                        'count': deck['count'],
+                        'next_due': next_due,
+                        'offset': f.tell(),
+                        'length': len(cards_json),
+                        'crc': zlib.crc32(cards_json)
+                    })
+                    if mount:
+                        entries[-1]['mount'] = mount
+                    put(cards_json)
+                    put(b'}')
+                put((
+                    '\n    ],\n'
+                    f'    "current_deck_index": {current_deck_index},\n'
+                    f'    "journal_seq": {self.journal_seq},\n'
+                ).encode('utf-8'))
+                # Last field, covering every byte before it
+                f.write(f'    "checksum": "{crc:08x}"\n}}\n'.encode('utf-8'))
+                f.flush()
+                os.fsync(f.fileno())
+        finally:
+            if old_file is not None:
+                old_file.close()
+        
+        # Swap the snapshot in, so a crash mid-write leaves the previous
+        # snapshot and the journal intact; if the crash lands between the
+        # rotation and the swap, load() falls back to data_file.1
+        self.rotate()
+        os.replace(tmp_file, self.data_file)
+        fsync_dir(self.data_file)
+        for deck, entry in zip(decks, entries):
+            deck['offset'] = entry['offset']
+            deck['length'] = entry['length']
+            deck['crc'] = entry['crc']
+            deck['dirty'] = False
+        
+        index = {
+            'size': os.path.getsize(self.data_file),
+            'journal_seq': self.journal_seq,
+            'current_deck_index': current_deck_index,
+            'decks': entries
+        }
+        with open(self.index_file + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(index, f, ensure_ascii=False)
+        os.replace(self.index_file + '.tmp', self.index_file)
+        
+        # Records up to journal_seq are now part of the snapshot; the old
+        # journal was rotated out with the old snapshot
+        open(self.journal_file, 'w').close()
+        self.journal_count = 0
+        self.needs_full_save = False
+        self.data_corrupt = False
+    
+    def rotate(self):
+        # data_file.1 and journal_file.1 become .2, and so on; a snapshot
+        # that failed to load is kept as data_file.corrupt instead
+        for path in (self.data_file, self.journal_file):
+            for generation in range(self.backup_count - 1, 0, -1):
+                older = self.generation_file(path, generation)
+                if os.path.exists(older):
+                    os.replace(older, self.generation_file(path, generation + 1))
+            if not os.path.exists(path):
+                continue
+            if path == self.data_file and self.data_corrupt:
+                os.replace(path, path + '.corrupt')
+            elif self.backup_count:
+                os.replace(path, self.generation_file(path, 1))
+    
+    def flush(self):
+        pass
+    
+    def close(self):
+        pass
+
+
+class BinaryStorage(JsonStorage):
+    # Same journal, backups and lazy deck loading as JsonStorage, but the
+    # snapshot uses the binary format from binary.py and is read through
+    # mmap; decks are decoded straight into their columns on first use
+    def __init__(self, data_file='flashcards.bin', journal_file='flashcards.bin.journal',
+                 legacy_file='flashcards.json', legacy_journal_file='flashcards.journal'):
+        super().__init__(data_file, journal_file, index_file=None)
+        self.legacy_file = legacy_file
+        self.legacy_journal_file = legacy_journal_file
+        self.map = None
+    
+    def load(self):
+        snapshots = [self.generation_file(self.data_file, n) for n in range(self.backup_count + 1)]
+        if any(os.path.exists(path) for path in snapshots) or not os.path.exists(self.legacy_file):
+            return super().load()
+        
+        # One-time conversion of the JSON library; the manager replays its
+        # journal and hands everything to save()
+        legacy = JsonStorage(self.legacy_file, self.legacy_journal_file)
+        decks, current_deck_index, records = legacy.load()
+        for i, deck in enumerate(decks):
+            if deck['cards'] is None:
+                deck['cards'] = legacy.load_cards(i, deck)
+            # Byte ranges into the JSON file mean nothing here
+            deck.pop('offset', None)
+            deck.pop('length', None)
+        self.journal_seq = legacy.journal_seq
+        self.needs_full_save = True
+        return decks, current_deck_index, records
+    
+    def read_index(self):
+        # The deck directory lives at the end of the snapshot itself; only
+        # it is checked here, each deck's block when it is decoded
+        self.close_map()
+        if not os.path.exists(self.data_file):
+            return None
+        try:
+            self.open_map()
+            with memoryview(self.map) as view:
+                entries, current_deck_index, journal_seq, version = decode_directory(view)
+        except (OSError, ValueError) as e:
+            print(f"Error reading {self.data_file}: {e}")
+            self.close_map()
+            return None
+        if version < VERSION:
+            # Read eagerly and rewritten once, so cards keep the ids they
+            # are given now
+            return None
+        return {'decks': entries, 'current_deck_index': current_deck_index, 'journal_seq': journal_seq}
+    
+    def read_snapshot(self, path):
+        # Eager load, used when falling back to a backup generation
+        with open(path, 'rb') as f:
+            data = memoryview(f.read())
+        entries, current_deck_index, self.journal_seq, version = decode_directory(data)
+        decks = []
+        for entry in entries:
+            block = data[entry['offset']:entry['offset'] + entry['length']]
+            deck = {'id': entry['id'] if 'id' in entry else new_id(), 'name': entry['name']}
+            check_range(block, entry)
+            if entry.get('mount'):
+                deck['cards'] = mount_cards(entry['mount'], json.loads(bytes(block).decode('utf-8')))
+                deck['mount'] = entry['mount']
+            else:
+                deck['cards'] = decode_deck(block, version)
+            deck['count'] = len(deck['cards'])
+            decks.append(deck)
+        return decks, current_deck_index
+    
+    def load_cards(self, index, deck):
+        # The slice is released even when the check fails, so recovery can
+        # unmap the file
+        with memoryview(self.map) as view, view[deck['offset']:deck['offset'] + deck['length']] as block:
+            self.check_deck(block, deck)
+            if 'mount' in deck:
+                return mount_cards(deck['mount'], json.loads(bytes(block).decode('utf-8')))
+            return decode_deck(block)
+    
+    def open_map(self):
+        with open(self.data_file, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    
+    def close_map(self):
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+    
+    def save(self, decks, current_deck_index):
+        # Unloaded decks are copied from the mapped snapshot as raw blocks
+        tmp_file = self.data_file + '.tmp'
+        entries = []
+        header = encode_header()
+        with open(tmp_file, 'wb') as f:
+            f.write(header)
+            for deck in decks:
+                if deck['cards'] is None:
+                    block = self.map[deck['offset']:deck['offset'] + deck['length']]
+                    # Damage is never copied into a fresh checksum
+                    self.check_deck(block, deck)
+                    next_due = deck.get('next_due', 0.0)
+                else:
+                    if 'mount' in deck:
+                        block = json.dumps(deck['cards'].overlay_items(), ensure_ascii=False).encode('utf-8')
+                    else:
+                        block = encode_deck(deck['cards'])
+                    next_due = min(deck['cards'].columns['due'], default=None)
+                entries.append({
+                    'id': deck['id'],
+                    'name': deck['name'],
+                    'count': deck['count'],
+                    'next_due': next_due,
+                    'offset': f.tell(),
+                    'length': len(block),
+                    'crc': zlib.crc32(block),
+                    'mount': deck.get('mount')
+                })
+                f.write(block)
+            directory = encode_directory(entries, current_deck_index, self.journal_seq, f.tell())
+            f.write(directory)
+            f.write(CHECKSUM.pack(directory_checksum(header, directory)))
+            f.flush()
+            os.fsync(f.fileno())
+        
+        # Unmap first: a mapped file cannot be replaced on every platform
+        self.close_map()
+        self.rotate()
+        os.replace(tmp_file, self.data_file)
+        fsync_dir(self.data_file)
+        self.open_map()
+        for deck, entry in zip(decks, entries):
+            deck['offset'] = entry['offset']
+            deck['length'] = entry['length']
+            deck['crc'] = entry['crc']
+            deck['dirty'] = False
+        
+        # Records up to journal_seq are now part of the snapshot
+        open(self.journal_file, 'w').close()
+        self.journal_count = 0
+        self.needs_full_save = False
+        self.data_corrupt = False
+    
+    def close(self):
+        self.close_map()
+
+
+class SqliteStorage:
+    def __init__(self, db_file='flashcards.db', legacy_file='flashcards.json',
+                 legacy_journal_file='flashcards.journal'):
+        self.db_file = db_file
+        self.legacy_file = legacy_file
+        self.legacy_journal_file = legacy_journal_file
+        self.needs_full_save = False
+        # Row ids by position, mirroring the manager's lists
+        self.deck_ids = []
+        self.card_ids = {}
+        # Mounted decks by row id; their cards rows only hold the overlay,
+        # keyed by position
+        self.mounts = {}
+        self.mounted_files = {}
+        
+        # Imported here so the JSON backend does not pay for sqlite3
+        import sqlite3
+        # WriteBehindStorage writes from its worker thread, one at a time
+        self.conn = sqlite3.connect(db_file, check_same_thread=False)
+        with self.conn:
+            self.conn.execute(
+                'CREATE TABLE IF NOT EXISTS decks ('
+                'id INTEGER PRIMARY KEY, name TEXT NOT NULL, uid INTEGER)'
+            )
+            self.conn.execute(
+                'CREATE TABLE IF NOT EXISTS cards ('
+                'id INTEGER PRIMARY KEY, deck_id INTEGER NOT NULL, '
+                'question TEXT NOT NULL, answer TEXT NOT NULL, '
+                'due REAL NOT NULL DEFAULT 0, interval REAL NOT NULL DEFAULT 0, '
+                'ease REAL NOT NULL DEFAULT 2.5, reps INTEGER NOT NULL DEFAULT 0, uid INTEGER)'
+            )
+            # Databases created before review state existed
+            columns = [row[1] for row in self.conn.execute('PRAGMA table_info(cards)')]
+            if 'due' not in columns:
+                self.conn.execute('ALTER TABLE cards ADD COLUMN due REAL NOT NULL DEFAULT 0')
+                self.conn.execute('ALTER TABLE cards ADD COLUMN interval REAL NOT NULL DEFAULT 0')
+                self.conn.execute('ALTER TABLE cards ADD COLUMN ease REAL NOT NULL DEFAULT 2.5')
+                self.conn.execute('ALTER TABLE cards ADD COLUMN reps INTEGER NOT NULL DEFAULT 0')
+            # Databases created before mounted decks existed
+            if 'position' not in columns:
+                self.conn.execute('ALTER TABLE cards ADD COLUMN position INTEGER')
+            deck_columns = [row[1] for row in self.conn.execute('PRAGMA table_info(decks)')]
+            if 'mount' not in deck_columns:
+                self.conn.execute('ALTER TABLE decks ADD COLUMN mount TEXT')
+            # Databases created before ids existed: every row gets one
+            for table, table_columns in (('cards', columns), ('decks', deck_columns)):
+                if 'uid' not in table_columns:
+                    self.conn.execute(f'ALTER TABLE {table} ADD COLUMN uid INTEGER')
+                    rows = self.conn.execute(f'SELECT id FROM {table}').fetchall()
+                    self.conn.executemany(f'UPDATE {table} SET uid = ? WHERE id = ?',
+                                          ((new_id(), row_id) for row_id, in rows))
+            self.conn.execute('CREATE INDEX IF NOT EXISTS cards_deck ON cards (deck_id, id)')
+            self.conn.execute(
+                'CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)'
+            )
+    
+    def get_meta(self, key, default=None):
+        row = self.conn.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else default
+    
+    def set_meta(self, key, value):
+        self.conn.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, str(value)))
+    
+    def load(self):
+        if self.get_meta('migrated') is None and os.path.exists(self.legacy_file):
+            # One-time import of the JSON library, old list format included;
+            # the manager replays the journal and hands everything to save()
+            self.needs_full_save = True
+            legacy = JsonStorage(self.legacy_file, self.legacy_journal_file)
+            decks, current_deck_index, records = legacy.load()
+            for i, deck in enumerate(decks):
+                if deck['cards'] is None:
+                    deck['cards'] = legacy.load_cards(i, deck)
+            return decks, current_deck_index, records
+        
+        decks = []
+        self.deck_ids = []
+        self.mounts = {}
+        rows = self.conn.execute(
+            'SELECT decks.id, decks.uid, decks.name, decks.mount, COUNT(cards.id), MIN(cards.due) FROM decks '
+            'LEFT JOIN cards ON cards.deck_id = decks.id '
+            'GROUP BY decks.id ORDER BY decks.id'
+        ).fetchall()
+        for deck_id, uid, name, mount, count, next_due in rows:
+            self.deck_ids.append(deck_id)
+            deck = {'id': uid, 'name': name, 'cards': None, 'count': count, 'next_due': next_due}
+            if mount:
+                # Counts and due times come from the file, so load it now
+                self.mounts[deck_id] = deck['mount'] = json.loads(mount)
+                deck['cards'] = self.load_cards(len(self.deck_ids) - 1, deck)
+                deck['count'] = len(deck['cards'])
+            decks.append(deck)
+        current_deck_index = int(self.get_meta('current_deck_index', 0))
+        return decks, current_deck_index, []
+    
+    def load_cards(self, index, deck):
+        deck_id = self.deck_ids[index]
+        if deck_id in self.mounts:
+            mount = self.mounts[deck_id]
+            checked = mount.get('checked')
+            cards = mount_cards(mount, self.overlay_items(deck_id))
+            # The file was checked whole; its new stamp spares the next load
+            if mount.get('checked') != checked:
+                with self.conn:
+                    self.conn.execute('UPDATE decks SET mount = ? WHERE id = ?',
+                                      (json.dumps(mount, ensure_ascii=False), deck_id))
+            return cards
+        rows = self.conn.execute(
+            f'SELECT id, {CARD_COLUMNS} FROM cards WHERE deck_id = ? ORDER BY id', (deck_id,)
+        ).fetchall()
+        self.card_ids[deck_id] = [row[0] for row in rows]
+        return CardColumns.from_rows(row[1:] for row in rows)
+    
+    def overlay_items(self, deck_id):
+        rows = self.conn.execute(f'SELECT position, {CARD_COLUMNS} FROM cards WHERE deck_id = ?', (deck_id,))
+        return [dict(zip(('index',) + CARD_FIELDS, row)) for row in rows]
+    
+    def write_overlay(self, deck_id, position, values):
+        # Overlay rows hold whole cards; the first write of a card copies
+        # the rest of it from the mounted file
+        row = self.conn.execute('SELECT id FROM cards WHERE deck_id = ? AND position = ?',
+                                (deck_id, position)).fetchone()
+        if row is None:
+            if deck_id not in self.mounted_files:
+                self.mounted_files[deck_id] = mount_cards(self.mounts[deck_id])
+            card = self.mounted_files[deck_id][position]
+            values = dict({field: getattr(card, field) for field in CARD_FIELDS}, **values)
+            self.conn.execute(
+                f'INSERT INTO cards (deck_id, position, {CARD_COLUMNS}) VALUES (?, ?, {CARD_PLACEHOLDERS})',
+                (deck_id, position) + tuple(values[field] for field in CARD_FIELDS)
+            )
+        else:
+            assignments = ', '.join(f'{field} = ?' for field in values)
+            self.conn.execute(f'UPDATE cards SET {assignments} WHERE id = ?',
+                              tuple(values.values()) + (row[0],))
+    
+    def can_unload(self, deck):
+        # Every mutation is already in the database
+        return True
+    
+    def write(self, record):
+        self.write_many([record])
+    
+    def write_many(self, records):
+        # One transaction for the whole batch
+        with self.conn:
+            for record in records:
+                self.write_record(record)
+    
+    def write_record(self, record):
+        op = record['op']
+        # insert_deck names the position the new deck takes
+        deck_id = self.deck_ids[record['deck']] if 'deck' in record and op != 'insert_deck' else None
+        if deck_id in self.mounts and op in ('edit_card', 'review_card'):
+            fields = ('question', 'answer') if op == 'edit_card' else REVIEW_FIELDS
+            self.write_overlay(deck_id, record['card'], {field: record[field] for field in fields})
+        elif op == 'add_deck':
+            cursor = self.conn.execute('INSERT INTO decks (name, uid) VALUES (?, ?)', (record['name'], record['id']))
+            self.deck_ids.append(cursor.lastrowid)
+            self.card_ids[cursor.lastrowid] = []
+        elif op == 'mount_deck':
+            mount = {'path': record['path'], 'name': record['name'], 'salt': record['id']}
+            if record.get('checked'):
+                mount['checked'] = record['checked']
+            cursor = self.conn.execute('INSERT INTO decks (name, mount, uid) VALUES (?, ?, ?)',
+                                       (record['name'], json.dumps(mount, ensure_ascii=False), record['id']))
+            self.deck_ids.append(cursor.lastrowid)
+            self.mounts[cursor.lastrowid] = mount
+        elif op == 'materialize_deck':
+            self.mounted_files.pop(deck_id, None)
+            cards = mount_cards(self.mounts.pop(deck_id), self.overlay_items(deck_id))
+            self.conn.execute('DELETE FROM cards WHERE deck_id = ?', (deck_id,))
+            self.conn.execute('UPDATE decks SET mount = NULL WHERE id = ?', (deck_id,))
+            self.insert_cards(deck_id, cards)
+            self.card_ids.pop(deck_id, None)
+        elif op == 'edit_deck':
+            self.conn.execute('UPDATE decks SET name = ? WHERE id = ?',
+                              (record['name'], self.deck_ids[record['deck']]))
+        elif op == 'delete_deck':
+            self.deck_ids.pop(record['deck'])
+            self.card_ids.pop(deck_id, None)
+            self.mounts.pop(deck_id, None)
+            self.mounted_files.pop(deck_id, None)
+            self.conn.execute('DELETE FROM cards WHERE deck_id = ?', (deck_id,))
+            self.conn.execute('DELETE FROM decks WHERE id = ?', (deck_id,))
+            self.shift_current_deck(record)
+        elif op == 'select_deck':
+            self.set_meta('current_deck_index', record['deck'])
+        elif op == 'add_card':
+            deck_id = self.deck_ids[record['deck']]
+            cursor = self.conn.execute(
+                'INSERT INTO cards (deck_id, question, answer, uid) VALUES (?, ?, ?, ?)',
+                (deck_id, record['question'], record['answer'], record['id'])
+            )
+            if deck_id in self.card_ids:
+                self.card_ids[deck_id].append(cursor.lastrowid)
+        elif op == 'add_cards':
+            deck_id = self.deck_ids[record['deck']]
+            card_ids = self.card_ids.get(deck_id)
+            for (question, answer), card_id in zip(record['cards'], record['ids']):
+                cursor = self.conn.execute(
+                    'INSERT INTO cards (deck_id, question, answer, uid) VALUES (?, ?, ?, ?)',
+                    (deck_id, question, answer, card_id)
+                )
+                if card_ids is not None:
+                    card_ids.append(cursor.lastrowid)
+        elif op == 'edit_card':
+            card_id = self.card_row_ids(record['deck'])[record['card']]
+            self.conn.execute('UPDATE cards SET question = ?, answer = ? WHERE id = ?',
+                              (record['question'], record['answer'], card_id))
+        elif op == 'delete_card':
+            card_id = self.card_row_ids(record['deck']).pop(record['card'])
+            self.conn.execute('DELETE FROM cards WHERE id = ?', (card_id,))
+        elif op == 'review_card':
+            card_id = self.card_row_ids(record['deck'])[record['card']]
+            self.conn.execute(
+                'UPDATE cards SET due = ?, interval = ?, ease = ?, reps = ? WHERE id = ?',
+                (record['due'], record['interval'], record['ease'], record['reps'], card_id)
+            )
+        elif op == 'insert_card':
+            card_ids = self.card_row_ids(record['deck'])
+            card_id = self.row_id_before('cards', card_ids, record['card'], deck_id)
+            cursor = self.conn.execute(
+                f'INSERT INTO cards (id, deck_id, {CARD_COLUMNS}) VALUES (?, ?, {CARD_PLACEHOLDERS})',
+                (card_id, deck_id) + tuple(record[name] for name in CARD_FIELDS)
+            )
+            card_ids.insert(record['card'], cursor.lastrowid)
+        elif op == 'insert_cards':
+            # Right to left, so each card's right-hand neighbour already has
+            # its final id; item k is at position - k until the ones before
+            # it are in
+            card_ids = self.card_row_ids(record['deck'])
+            for k in range(len(record['cards']) - 1, -1, -1):
+                position, *row = record['cards'][k]
+                card_id = self.row_id_before('cards', card_ids, position - k, deck_id)
+                cursor = self.conn.execute(
+                    f'INSERT INTO cards (id, deck_id, {CARD_COLUMNS}) VALUES (?, ?, {CARD_PLACEHOLDERS})',
+                    (card_id, deck_id) + tuple(row)
+                )
+                card_ids.insert(position - k, cursor.lastrowid)
+        elif op == 'delete_cards':
+            card_ids = self.card_row_ids(record['deck'])
+            drop = set(record['cards'])
+            self.conn.executemany('DELETE FROM cards WHERE id = ?', ((card_ids[i],) for i in sorted(drop)))
+            card_ids[:] = [card_id for i, card_id in enumerate(card_ids) if i not in drop]
+        elif op == 'move_cards':
+            # Moved rows get ids past the end so they sort after the
+            # target's cards
+            card_ids = self.card_row_ids(record['deck'])
+            target_ids = self.card_row_ids(record['to'])
+            drop = set(record['cards'])
+            next_id = self.conn.execute('SELECT MAX(id) FROM cards').fetchone()[0] + 1
+            moved = [(next_id + k, self.deck_ids[record['to']], card_ids[i]) for k, i in enumerate(sorted(drop))]
+            self.conn.executemany('UPDATE cards SET id = ?, deck_id = ? WHERE id = ?', moved)
+            card_ids[:] = [card_id for i, card_id in enumerate(card_ids) if i not in drop]
+            target_ids.extend(new_id for new_id, _, _ in moved)
+        elif op == 'insert_deck':
+            mount = record.get('mount')
+            deck_id = self.row_id_before('decks', self.deck_ids, record['deck'])
+            cursor = self.conn.execute(
+                'INSERT INTO decks (id, name, mount, uid) VALUES (?, ?, ?, ?)',
+                (deck_id, record['name'], json.dumps(mount, ensure_ascii=False) if mount else None, record['id'])
+            )
+            deck_id = cursor.lastrowid
+            self.deck_ids.insert(record['deck'], deck_id)
+            if mount:
+                self.mounts[deck_id] = mount
+                self.insert_overlay(deck_id, record['cards'])
+            else:
+                self.insert_rows(deck_id, record['cards'])
+            self.shift_current_deck(record)
+    
+    def shift_current_deck(self, record):
+        # The stored current deck follows the manager's across undo and sync
+        current = int(self.get_meta('current_deck_index', 0))
+        self.set_meta('current_deck_index', shift_current_deck(current, record['op'], record['deck'], len(self.deck_ids)))
+    
+    def row_id_before(self, table, ids, position, deck_id=None):
+        # Rows are ordered by id, so a row put back at position needs an id
+        # between its neighbours: the one it had before being deleted is
+        # usually still free. The highest free one is taken, leaving room
+        # for rows undone before it. Failing that, the rows from position
+        # on are moved past the end of the table. None means append
+        if position == len(ids):
+            return None
+        low = ids[position - 1] if position else 0
+        candidate = ids[position] - 1
+        for (used,) in self.conn.execute(f'SELECT id FROM {table} WHERE id > ? AND id < ? ORDER BY id DESC',
+                                         (low, ids[position])):
+            if used < candidate:
+                break
+            candidate = used - 1
+        if candidate > low:
+            return candidate
+        
+        shift = self.conn.execute(f'SELECT MAX(id) FROM {table}').fetchone()[0] - ids[position] + 2
+        if table == 'cards':
+            self.conn.execute('UPDATE cards SET id = id + ? WHERE deck_id = ? AND id >= ?',
+                              (shift, deck_id, ids[position]))
+        else:
+            self.conn.execute('UPDATE decks SET id = id + ? WHERE id >= ?', (shift, ids[position]))
+            self.conn.execute('UPDATE cards SET deck_id = deck_id + ? WHERE deck_id >= ?', (shift, ids[position]))
+            for cache in (self.card_ids, self.mounts, self.mounted_files):
+                for old_id in sorted((key for key in cache if key >= ids[position]), reverse=True):
+                    cache[old_id + shift] = cache.pop(old_id)
+        ids[position:] = [row_id + shift for row_id in ids[position:]]
+        return ids[position] - 1
+    
+    def insert_overlay(self, deck_id, items):
+        self.conn.executemany(
+            f'INSERT INTO cards (deck_id, position, {CARD_COLUMNS}) VALUES (?, ?, {CARD_PLACEHOLDERS})',
+            ((deck_id, item['index']) + tuple(item[name] for name in CARD_FIELDS) for item in items)
+        )
+    
+    def insert_cards(self, deck_id, cards):
+        self.insert_rows(deck_id, (tuple(getattr(card, name) for name in CARD_FIELDS) for card in cards))
+    
+    def insert_rows(self, deck_id, rows):
+        # Rows are sequences in CARD_FIELDS order
+        self.conn.executemany(
+            f'INSERT INTO cards (deck_id, {CARD_COLUMNS}) VALUES (?, {CARD_PLACEHOLDERS})',
+            ((deck_id,) + tuple(row) for row in rows)
+        )
+    
+    def card_row_ids(self, deck_index):
+        deck_id = self.deck_ids[deck_index]
+        if deck_id not in self.card_ids:
+            rows = self.conn.execute('SELECT id FROM cards WHERE deck_id = ? ORDER BY id', (deck_id,))
+            self.card_ids[deck_id] = [row[0] for row in rows]
+        return self.card_ids[deck_id]
+    
+    def needs_compaction(self):
+        # Every write is already its own transaction
+        return False
+    
+    def save(self, decks, current_deck_index):
+        with self.conn:
+            if self.needs_full_save:
+                # Unloaded decks are read back before the tables are cleared
+                deck_cards = [deck['cards'] if deck['cards'] is not None else self.load_cards(i, deck)
+                              for i, deck in enumerate(decks)]
+                self.conn.execute('DELETE FROM cards')
+                self.conn.execute('DELETE FROM decks')
+                self.deck_ids = []
+                self.card_ids = {}
+                self.mounts = {}
+                for deck, cards in zip(decks, deck_cards):
+                    mount = deck.get('mount')
+                    cursor = self.conn.execute(
+                        'INSERT INTO decks (name, mount, uid) VALUES (?, ?, ?)',
+                        (deck['name'], json.dumps(mount, ensure_ascii=False) if mount else None, deck['id'])
+                    )
+                    self.deck_ids.append(cursor.lastrowid)
+                    if mount:
+                        self.mounts[cursor.lastrowid] = mount
+                        self.insert_overlay(cursor.lastrowid, cards.overlay_items())
+                    else:
+                        self.insert_cards(cursor.lastrowid, cards)
+                self.set_meta('migrated', 1)
+                self.needs_full_save = False
+            self.set_meta('current_deck_index', current_deck_index)
+    
+    def flush(self):
+        pass
+    
+    def close(self):
+        self.conn.close()
+
+
+class WriteBehindStorage:
+    # Wraps a storage so write() only queues the record; a worker thread
+    # writes whatever has queued up in one batch, `delay` seconds after the
+    # first record arrives. save() queues a snapshot the same way: decks
+    # changed since the last one are copied on the calling thread, the
+    # others are copied from the old snapshot by the worker. Decks keep a
+    # 'saving' mark, which stops them being unloaded, until the calling
+    # thread sees the snapshot written, see finish_saves()
+    def __init__(self, storage, delay=0.5):
+        self.storage = storage
+        self.delay = delay
+        # Records, and (decks, copies, current deck index) snapshots
+        self.pending = []
+        # Snapshots queued and not yet written, and those written but not
+        # yet handed back to their decks as (decks, copies, written)
+        self.saves = 0
+        self.saved = []
+        # SnapshotCorrupt a queued snapshot ran into, raised by save()
+        self.error = None
+        # storage_lock serializes access to the wrapped storage and is
+        # always taken before queue_lock
+        self.storage_lock = threading.Lock()
+        self.queue_lock = threading.Condition()
+        self.closed = False
+        self.worker = threading.Thread(target=self.run, name='flashcards-writer', daemon=True)
+        self.worker.start()
+    
+    def __getattr__(self, name):
+        return getattr(self.storage, name)
+    
+    def load(self):
+        with self.storage_lock:
+            return self.storage.load()
+    
+    def load_cards(self, index, deck):
+        # The database may not hold the deck's queued cards yet, nor the
+        # snapshot file the deck's queued byte range
+        with self.storage_lock:
+            self.write_pending()
+            self.finish_saves()
+            return self.storage.load_cards(index, deck)
+    
+    def can_unload(self, deck):
+        self.finish_saves()
+        return not deck.get('saving') and self.storage.can_unload(deck)
+    
+    def write(self, record):
+        self.write_many([record])
+    
+    def write_many(self, records):
+        with self.queue_lock:
+            self.pending.extend(records)
+            self.queue_lock.notify_all()
+    
+    def needs_compaction(self):
+        # A failed batch is recovered by a full save from memory; nothing
+        # is compacted again until the queued snapshot is written
+        with self.queue_lock:
+            if self.saves:
+                return False
+        return self.storage.needs_full_save or self.storage.needs_compaction()
+    
+    def save(self, decks, current_deck_index):
+        # A deck left unloaded or copied from the old snapshot is found by
+        # the byte range the previous snapshot gave it, so that one must
+        # be handed back first
+        if self.saves:
+            self.flush()
+        self.finish_saves()
+        with self.queue_lock:
+            error, self.error = self.error, None
+        if error is not None:
+            raise error
+        copies = [self.copy_deck(deck) for deck in decks]
+        for deck in decks:
+            deck['saving'] = True
+            deck['dirty'] = False
+        with self.queue_lock:
+            self.pending.append((list(decks), copies, current_deck_index))
+            self.saves += 1
+            self.queue_lock.notify_all()
+    
+    def copy_deck(self, deck):
+        # What the wrapped storage's save() reads of a deck
+        copy = {key: deck[key] for key in ('id', 'name', 'count', 'offset', 'length', 'crc', 'next_due') if key in deck}
+        if 'mount' in deck:
+            copy['mount'] = dict(deck['mount'])
+        cards = deck['cards']
+        if cards is not None and 'offset' in deck and not deck.get('dirty'):
+            # Still as the snapshot holds them
+            copy['cards'] = None
+            copy['next_due'] = min(cards.columns['due'], default=None)
+        else:
+            copy['cards'] = None if cards is None else cards.copy()
+        return copy
+    
+    def finish_saves(self):
+        # Hands written snapshots back to their decks, on the thread that
+        # changes them: the new byte ranges, or if the snapshot failed the
+        # dirty mark of every loaded deck
+        with self.queue_lock:
+            saved, self.saved = self.saved, []
+        for decks, copies, written in saved:
+            for deck, copy in zip(decks, copies):
+                deck.pop('saving', None)
+                if written:
+                    deck['offset'] = copy['offset']
+                    deck['length'] = copy['length']
+                    deck['crc'] = copy['crc']
+                elif deck['cards'] is not None:
+                    deck['dirty'] = True
+    
+    def flush(self):
+        # Blocks until every queued record and snapshot is written
+        with self.storage_lock:
+            self.write_pending()
+        self.finish_saves()
+    
+    def close(self):
+        with self.queue_lock:
+            self.closed = True
+            self.queue_lock.notify_all()
+        self.worker.join()
+        with self.storage_lock:
+            self.write_pending()
+            self.storage.close()
+        self.finish_saves()
+    
+    def write_pending(self):
+        # Caller holds storage_lock, so batches and snapshots reach the
+        # storage in the order they were queued
+        with self.queue_lock:
+            queued, self.pending = self.pending, []
+        records = []
+        for item in queued:
+            if isinstance(item, dict):
+                records.append(item)
+                continue
+            self.write_records(records)
+            records = []
+            self.write_snapshot(*item)
+        self.write_records(records)
+    
+    def write_records(self, records):
+        if not records:
+            return
+        try:
+            self.storage.write_many(records)
+        except Exception as e:
+            print(f"Error writing journal: {e}")
+            self.storage.needs_full_save = True
+    
+    def write_snapshot(self, decks, copies, current_deck_index):
+        error = None
+        try:
+            self.storage.save(copies, current_deck_index)
+        except Exception as e:
+            print(f"Error saving decks: {e}")
+            error = e
+            self.storage.needs_full_save = True
+        with self.queue_lock:
+            # Copying an unloaded deck found it damaged: the manager
+            # recovers once save() raises it
+            if isinstance(error, SnapshotCorrupt):
+                self.error = error
+            self.saved.append((decks, copies, error is None))
+            self.saves -= 1
+    
+    def run(self):
+        while True:
+            with self.queue_lock:
+                while not self.pending and not self.closed:
+                    self.queue_lock.wait()
+                if self.closed:
+                    return
+                # Give the rest of a burst of edits time to join the batch
+                deadline = time.monotonic() + self.delay
+                while not self.closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.queue_lock.wait(remaining)
+            with self.storage_lock:
+                self.write_pending()
@@ -0,0 +1,706 @@
+import bisect
+import json
+import os
+import threading
+import time
+import zlib
+
+from .cards import REVIEW_FIELDS, new_id
+
+# Sync keeps, per card and per deck, the latest change to each group of
+# fields: a card's content (deck, question and answer) and review state,
+# and a deck's state (its name). A group is [clock, value], value None
+# once the item is deleted, and clock [hybrid time, node]. Merging keeps
+# the later clock of every group, so replicas that saw the same changes
+# agree whatever order they came in. Cards also carry the decks they have
+# been in, so a device can find a card another device moved.
+#
+# Mounted decks stay on their device: their files are not synced until
+# they are materialized.
+GROUPS = ('content', 'review', 'state')
+
+
+def entry_key(entry):
+    return ('card', entry['card']) if 'card' in entry else ('deck', entry['deck'])
+
+
+def merge(old, new):
+    if old is None:
+        return new
+    merged = dict(old)
+    for group in GROUPS:
+        if group in new and (group not in old or new[group][0] > old[group][0]):
+            merged[group] = new[group]
+    if 'trail' in new:
+        merged['trail'] = list(dict.fromkeys(old.get('trail', []) + new['trail']))
+    return merged
+
+
+def encode_payload(data):
+    return zlib.compress(json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+
+
+def decode_payload(data):
+    try:
+        return json.loads(zlib.decompress(data).decode('utf-8'))
+    except zlib.error as e:
+        raise ValueError(f'bad sync payload: {e}') from e
+
+
+class HybridClock:
+    # Wall time in milliseconds shifted left 16 bits, plus a counter: it
+    # follows real time, never goes back and moves past any clock seen
+    def __init__(self, last=0):
+        self.last = last
+    
+    def now(self):
+        self.last = max(int(time.time() * 1000) << 16, self.last + 1)
+        return self.last
+    
+    def observe(self, remote):
+        self.last = max(self.last, remote)
+
+
+class SyncServer:
+    # Reference server: keeps the merged entry of every item and hands out
+    # the ones changed since a client's cursor. Accepted entries are
+    # appended to path, if given, as [seq, entry] lines and read back on
+    # start, so cursors stay valid across restarts
+    def __init__(self, path=None):
+        self.path = path
+        self.entries = {}
+        # Seq of the latest accepted change of every item, and (seq, key)
+        # pairs in seq order; pairs whose item changed again are skipped
+        self.seqs = {}
+        self.log_seqs = []
+        self.log_keys = []
+        self.seq = 0
+        # Lines in path
+        self.lines = 0
+        self.lock = threading.Lock()
+        if path and os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        seq, entry = json.loads(line)
+                    except ValueError:
+                        # Torn last line from an interrupted append
+                        break
+                    self.store(entry, seq)
+                    self.lines += 1
+    
+    def store(self, entry, seq):
+        key = entry_key(entry)
+        self.entries[key] = entry
+        self.seq = seq
+        self.seqs[key] = seq
+        self.log_seqs.append(seq)
+        self.log_keys.append(key)
+    
+    def push(self, entries):
+        with self.lock:
+            accepted = []
+            for entry in entries:
+                old = self.entries.get(entry_key(entry))
+                merged = merge(old, entry)
+                if merged != old:
+                    self.store(merged, self.seq + 1)
+                    accepted.append([self.seq, merged])
+            if len(self.log_seqs) > 2 * len(self.entries) + 1000:
+                self.compact_log()
+            if self.path and accepted:
+                if self.lines + len(accepted) > 2 * len(self.entries) + 1000:
+                    self.compact_file()
+                else:
+                    with open(self.path, 'a', encoding='utf-8') as f:
+                        f.write(''.join(json.dumps(line, ensure_ascii=False) + '\n' for line in accepted))
+                    self.lines += len(accepted)
+            return self.seq
+    
+    def pull(self, since, limit, node=None):
+        # Returns up to limit entries changed after seq since, the seq to
+        # resume from and whether more are left. Entries node wrote all of
+        # are left out: it has them already
+        with self.lock:
+            entries = []
+            seq = self.seq
+            for i in range(bisect.bisect_right(self.log_seqs, since), len(self.log_seqs)):
+                key = self.log_keys[i]
+                if self.seqs[key] != self.log_seqs[i]:
+                    continue
+                entry = self.entries[key]
+                if all(entry[group][0][1] == node for group in GROUPS if group in entry):
+                    continue
+                if len(entries) == limit:
+                    seq = self.log_seqs[i - 1]
+                    break
+                entries.append(entry)
+            return entries, seq, len(entries) == limit and seq < self.seq
+    
+    def compact_log(self):
+        pairs = sorted((seq, key) for key, seq in self.seqs.items())
+        self.log_seqs = [seq for seq, key in pairs]
+        self.log_keys = [key for seq, key in pairs]
+    
+    def compact_file(self):
+        # Only the latest entry of each item, in seq order
+        self.compact_log()
+        with open(self.path + '.tmp', 'w', encoding='utf-8') as f:
+            for seq, key in zip(self.log_seqs, self.log_keys):
+                f.write(json.dumps([seq, self.entries[key]], ensure_ascii=False) + '\n')
+        os.replace(self.path + '.tmp', self.path)
+        self.lines = len(self.entries)
+    
+    def handle(self, path, data):
+        # One request, both ways as compressed JSON
+        request = decode_payload(data)
+        if path == '/push':
+            response = {'seq': self.push(request['entries'])}
+        elif path == '/pull':
+            entries, seq, more = self.pull(request['since'], request['limit'], request.get('node'))
+            response = {'entries': entries, 'seq': seq, 'more': more}
+        else:
+            raise ValueError(f'unknown sync request {path}')
+        return encode_payload(response)
+
+
+class LocalTransport:
+    # A server in the same process, reached through the same payloads as
+    # over HTTP
+    def __init__(self, server):
+        self.server = server
+    
+    def request(self, path, data):
+        return self.server.handle(path, data)
+
+
+class HttpTransport:
+    def __init__(self, url, timeout=30):
+        self.url = url.rstrip('/')
+        self.timeout = timeout
+    
+    def request(self, path, data):
+        import urllib.request
+        
+        request = urllib.request.Request(self.url + path, data=data,
+                                         headers={'Content-Type': 'application/octet-stream'})
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            return response.read()
+
+
+def http_server(server, host='127.0.0.1', port=8765):
+    # Serves a SyncServer over HTTP; the caller runs serve_forever()
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            data = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            try:
+                body = server.handle(self.path, data)
+            except (ValueError, KeyError, TypeError) as e:
+                self.send_error(400, str(e))
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/octet-stream')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        
+        def log_message(self, format, *args):
+            pass
+    
+    return ThreadingHTTPServer((host, port), Handler)
+
+
+class SyncClient:
+    # Records the manager's changes as entries and trades them with a
+    # server. Changes wait in pending, logged to log_file as they happen,
+    # until pushed; state_file keeps the node id, clock, server cursor and
+    # pending entries between syncs. Each sync costs in proportion to the
+    # changes made since the last one, except the first, which pushes the
+    # whole library.
+    # sync() and send() may run on a worker thread while the app keeps
+    # changing the library: lock guards what both sides touch, and sync()
+    # hands the steps that read or change the manager to its run argument
+    def __init__(self, manager, transport, state_file='flashcards.sync.json', log_file='flashcards.sync.log'):
+        self.manager = manager
+        self.transport = transport
+        self.state_file = state_file
+        self.log_file = log_file
+        # Entries per request
+        self.batch_size = 500
+        self.pending = {}
+        self.unlogged = []
+        # Entries of cards left out because their deck is missing here, by
+        # card id, in case the deck comes back
+        self.orphans = {}
+        # Set while remote changes are applied, so they are not sent back
+        self.applying = False
+        self.lock = threading.RLock()
+        # Held for a whole sync() or send(), so only one runs at a time
+        self.running = threading.Lock()
+        self.load_state()
+        manager.sync = self
+    
+    def load_state(self):
+        state = None
+        if os.path.exists(self.state_file):
+            try:
+                with open(self.state_file, 'r', encoding='utf-8') as f:
+                    state = json.load(f)
+            except ValueError as e:
+                print(f"Error loading {self.state_file}: {e}")
+        if state is None:
+            # First sync of this library pushes all of it
+            state = {'node': new_id(), 'clock': 0, 'cursor': 0, 'pending': [], 'orphans': [], 'seeded': False}
+        self.node = state['node']
+        self.clock = HybridClock(state['clock'])
+        self.cursor = state['cursor']
+        self.seeded = state['seeded']
+        # Id of the default deck of a new library, held back by seed()
+        # until the first pull shows whether it is wanted
+        self.default_deck = state.get('default_deck')
+        # Id of the empty deck that took the place of the last one deleted,
+        # held back until it is used, see changes()
+        self.placeholder_deck = state.get('placeholder_deck')
+        self.orphans = {entry['card']: entry for entry in state['orphans']}
+        for entry in state['pending']:
+            self.add(entry, log=False)
+        if os.path.exists(self.log_file):
+            with open(self.log_file, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # Torn last line from an interrupted append
+                        break
+                    if 'placeholder' in entry:
+                        self.placeholder_deck = entry['placeholder']
+                        continue
+                    self.add(entry, log=False)
+                    self.observe(entry)
+    
+    def save_state(self):
+        with self.lock:
+            state = {
+                'node': self.node,
+                'clock': self.clock.last,
+                'cursor': self.cursor,
+                'pending': list(self.pending.values()),
+                'orphans': list(self.orphans.values()),
+                'seeded': self.seeded,
+                'default_deck': self.default_deck,
+                'placeholder_deck': self.placeholder_deck
+            }
+            with open(self.state_file + '.tmp', 'w', encoding='utf-8') as f:
+                json.dump(state, f, ensure_ascii=False)
+            os.replace(self.state_file + '.tmp', self.state_file)
+            # Everything logged is in the state now
+            open(self.log_file, 'w').close()
+    
+    def add(self, entry, log=True):
+        key = entry_key(entry)
+        with self.lock:
+            self.pending[key] = merge(self.pending.get(key), entry)
+            if log:
+                self.unlogged.append(entry)
+    
+    def record(self, entries):
+        for entry in entries:
+            self.add(entry)
+    
+    def write_log(self):
+        # Called by the manager once a batch is applied
+        with self.lock:
+            if self.unlogged:
+                with open(self.log_file, 'a', encoding='utf-8') as f:
+                    f.write(''.join(json.dumps(entry, ensure_ascii=False) + '\n' for entry in self.unlogged))
+                self.unlogged.clear()
+    
+    def observe(self, entry):
+        for group in GROUPS:
+            if group in entry:
+                self.clock.observe(entry[group][0][0])
+    
+    def stamp(self):
+        return [self.clock.now(), self.node]
+    
+    def deck_entry(self, deck_id, name):
+        return {'deck': deck_id, 'state': [self.stamp(), None if name is None else {'name': name}]}
+    
+    def card_entry(self, card_id, deck_id, question=None, answer=None, review=None, trail=()):
+        # Deleted when deck_id is None; review is a dict of REVIEW_FIELDS
+        if deck_id is None:
+            return {'card': card_id, 'content': [self.stamp(), None]}
+        entry = {'card': card_id, 'trail': list(dict.fromkeys([*trail, deck_id]))}
+        if question is not None:
+            entry['content'] = [self.stamp(), {'deck': deck_id, 'question': question, 'answer': answer}]
+        if review is not None:
+            entry['review'] = [self.stamp(), review]
+        return entry
+    
+    def row_entry(self, deck_id, row, trail=()):
+        # row in CARD_FIELDS order
+        return self.card_entry(row[-1], deck_id, row[0], row[1], dict(zip(REVIEW_FIELDS, row[2:6])), trail)
+    
+    def changes(self, manager, record):
+        # Entries for a record the manager is about to apply, read from the
+        # state it changes; the manager hands them to record() once applied
+        if self.applying:
+            return []
+        op = record['op']
+        if op == 'add_deck' and record.get('placeholder'):
+            self.hold_placeholder(record['id'])
+            return []
+        entries = []
+        if self.placeholder_deck is not None and op not in ('add_deck', 'insert_deck', 'mount_deck', 'select_deck'):
+            named = {manager.decks[record['deck']]['id']}
+            if 'to' in record:
+                named.add(manager.decks[record['to']]['id'])
+            if self.placeholder_deck in named:
+                # First use: from now on the deck is synced like any other;
+                # deleted unused, it was never known elsewhere
+                deck_id = self.placeholder_deck
+                self.hold_placeholder(None)
+                if op == 'delete_deck':
+                    return []
+                entries.append(self.deck_entry(deck_id, manager.decks[manager.deck_index(deck_id)]['name']))
+        return entries + self.record_changes(manager, record)
+    
+    def hold_placeholder(self, deck_id):
+        # Logged like a change, so the hold outlives a restart before the
+        # next sync saves the state
+        with self.lock:
+            self.placeholder_deck = deck_id
+            self.unlogged.append({'placeholder': deck_id})
+    
+    def record_changes(self, manager, record):
+        op = record['op']
+        if op in ('select_deck', 'mount_deck') or (op == 'insert_deck' and record.get('mount')):
+            return []
+        if op in ('add_deck', 'insert_deck'):
+            entries = [self.deck_entry(record['id'], record['name'])]
+            if op == 'insert_deck':
+                entries += [self.row_entry(record['id'], row) for row in record['cards']]
+            return entries
+        
+        deck = manager.decks[record['deck']]
+        if 'mount' in deck and op != 'materialize_deck':
+            return []
+        deck_id = deck['id']
+        if op == 'edit_deck':
+            return [self.deck_entry(deck_id, record['name'])]
+        if op in ('delete_deck', 'materialize_deck'):
+            # A deleted deck's cards are deleted one by one too, so a rename
+            # that wins over the deletion brings back an empty deck everywhere
+            cards = manager.deck_cards(record['deck'])
+            if op == 'delete_deck':
+                return [self.deck_entry(deck_id, None)] + [self.card_entry(card_id, None) for card_id in cards.columns['id']]
+            return [self.deck_entry(deck_id, deck['name'])] + [self.row_entry(deck_id, row) for row in cards.rows(range(len(cards)))]
+        if op == 'add_card':
+            return [self.card_entry(record['id'], deck_id, record['question'], record['answer'])]
+        if op == 'add_cards':
+            return [self.card_entry(card_id, deck_id, question, answer)
+                    for (question, answer), card_id in zip(record['cards'], record['ids'])]
+        if op == 'insert_card':
+            return [self.card_entry(record['id'], deck_id, record['question'], record['answer'],
+                                    {name: record[name] for name in REVIEW_FIELDS})]
+        if op == 'insert_cards':
+            return [self.row_entry(deck_id, item[1:]) for item in record['cards']]
+        
+        cards = manager.deck_cards(record['deck'])
+        if op == 'edit_card':
+            return [self.card_entry(cards[record['card']].id, deck_id, record['question'], record['answer'])]
+        if op == 'review_card':
+            return [self.card_entry(cards[record['card']].id, deck_id,
+                                    review={name: record[name] for name in REVIEW_FIELDS})]
+        if op == 'delete_card':
+            return [self.card_entry(cards[record['card']].id, None)]
+        if op == 'delete_cards':
+            ids = cards.columns['id']
+            return [self.card_entry(ids[i], None) for i in sorted(set(record['cards']))]
+        if op == 'move_cards':
+            target = manager.decks[record['to']]['id']
+            rows = cards.rows(sorted(set(record['cards'])))
+            return [self.card_entry(row[-1], target, row[0], row[1], trail=[deck_id]) for row in rows]
+        return []
+    
+    def seed(self):
+        # Every deck and card as a change, one deck loaded at a time. The
+        # empty deck a new library starts with is held back: pushed from
+        # every new device, it would turn up once per device everywhere
+        manager = self.manager
+        for index, deck in enumerate(manager.decks):
+            if 'mount' in deck or deck['id'] == self.placeholder_deck:
+                continue
+            if self.is_default_deck(deck):
+                self.default_deck = deck['id']
+                continue
+            self.add(self.deck_entry(deck['id'], deck['name']))
+            cards = manager.deck_cards(index)
+            for row in cards.rows(range(len(cards))):
+                self.add(self.row_entry(deck['id'], row))
+        self.write_log()
+        self.seeded = True
+    
+    def is_default_deck(self, deck):
+        manager = self.manager
+        return len(manager.decks) == 1 and deck['name'] == 'Mes Cartes' and deck['count'] == 0
+    
+    def settle_default_deck(self):
+        # After the first pull: the held back default deck goes if decks
+        # came from other devices and it is still untouched, and is pushed
+        # like any other deck otherwise
+        manager = self.manager
+        index = manager.deck_index(self.default_deck)
+        self.default_deck = None
+        if index is None:
+            return
+        deck = manager.decks[index]
+        if len(manager.decks) > 1 and deck['name'] == 'Mes Cartes' and deck['count'] == 0:
+            self.applying = True
+            try:
+                manager.execute([{'op': 'delete_deck', 'deck': index}])
+            finally:
+                self.applying = False
+            manager.clear_history()
+        else:
+            self.add(self.deck_entry(deck['id'], deck['name']))
+            self.write_log()
+    
+    def sync(self, run=None):
+        # Pull first, so pending changes that lost are not pushed, then
+        # push, then pull whatever landed meanwhile; returns the number of
+        # entries pulled and pushed. run(step) calls step on the thread
+        # that owns the manager and returns its result; without it every
+        # step runs here
+        run = run or (lambda step: step())
+        with self.running:
+            try:
+                if not self.seeded:
+                    run(self.seed)
+                pulled = self.pull(run)
+                if self.default_deck is not None:
+                    run(self.settle_default_deck)
+                pushed = self.push()
+                pulled += self.pull(run)
+            finally:
+                self.save_state()
+        return pulled, pushed
+    
+    def send(self):
+        # Pushes pending changes without pulling, so the library is left
+        # alone, e.g. from a worker thread as the app goes to the background
+        with self.running:
+            if not self.seeded:
+                return 0
+            try:
+                return self.push()
+            finally:
+                self.save_state()
+    
+    def call(self, path, request):
+        return decode_payload(self.transport.request(path, encode_payload(request)))
+    
+    def push(self):
+        with self.lock:
+            entries = list(self.pending.values())
+        for start in range(0, len(entries), self.batch_size):
+            batch = entries[start:start + self.batch_size]
+            self.call('/push', {'entries': batch})
+            # Entries changed again meanwhile stay pending
+            with self.lock:
+                for entry in batch:
+                    key = entry_key(entry)
+                    if self.pending.get(key) is entry:
+                        del self.pending[key]
+        return len(entries)
+    
+    def pull(self, run=None):
+        run = run or (lambda step: step())
+        count = 0
+        while True:
+            response = self.call('/pull', {'since': self.cursor, 'limit': self.batch_size, 'node': self.node})
+            run(lambda: self.apply_remote(response['entries']))
+            self.cursor = response['seq']
+            count += len(response['entries'])
+            if not response['more']:
+                return count
+    
+    def apply_remote(self, entries):
+        # Keeps the groups of each entry that beat this device's pending
+        # ones, and drops the pending groups they beat
+        decks = []
+        cards = []
+        for entry in entries:
+            self.observe(entry)
+            key = entry_key(entry)
+            local = self.pending.get(key)
+            orphan = self.orphans.pop(key[1], None) if key[0] == 'card' else None
+            if orphan is not None:
+                entry = merge(orphan, entry)
+            wins = {}
+            for group in GROUPS:
+                # Groups this node wrote are already applied here, unless the
+                # card was left out
+                if group not in entry or (entry[group][0][1] == self.node and orphan is None):
+                    continue
+                if local is not None and group in local and local[group][0] >= entry[group][0]:
+                    continue
+                wins[group] = entry[group]
+            if not wins and orphan is None:
+                continue
+            if local is not None:
+                kept = {name: value for name, value in local.items() if name not in wins}
+                if any(group in kept for group in GROUPS):
+                    self.pending[key] = kept
+                else:
+                    del self.pending[key]
+            if key[0] == 'deck':
+                decks.append((key[1], wins['state'][1]))
+            else:
+                cards.append((key[1], wins, entry, local))
+        if decks or cards:
+            self.applying = True
+            try:
+                self.apply_changes(decks, cards)
+            finally:
+                self.applying = False
+            self.settle_placeholder()
+            # Undo steps hold positions that remote changes may have moved
+            self.manager.clear_history()
+    
+    def settle_placeholder(self):
+        # A deck is added, and held back, if remote changes deleted every
+        # deck; the held back one goes once decks come from elsewhere.
+        # Pushed from every device, it would turn up once per device
+        manager = self.manager
+        if not manager.decks:
+            manager.add_placeholder_deck()
+            return
+        index = None if self.placeholder_deck is None else manager.deck_index(self.placeholder_deck)
+        if index is not None and len(manager.decks) > 1:
+            self.applying = True
+            try:
+                manager.execute([{'op': 'delete_deck', 'deck': index}])
+            finally:
+                self.applying = False
+            self.hold_placeholder(None)
+    
+    def locate(self, card_id, entries):
+        # Deck id of the card here, looked for in the decks the entries
+        # name, or None
+        manager = self.manager
+        candidates = []
+        for entry in entries:
+            if entry is None:
+                continue
+            content = entry.get('content')
+            if content and content[1]:
+                candidates.append(content[1]['deck'])
+            candidates += entry.get('trail', [])
+        for deck_id in dict.fromkeys(candidates):
+            index = manager.deck_index(deck_id)
+            if index is not None and 'mount' not in manager.decks[index] and manager.card_index(card_id, index) is not None:
+                return deck_id
+        return None
+    
+    def apply_changes(self, decks, cards):
+        # Applied in phases so positions are looked up once per deck and
+        # phase: decks added or renamed, cards deleted, moved, added, then
+        # edited and reviewed, and last decks deleted
+        manager = self.manager
+        removed_decks = []
+        for deck_id, state in decks:
+            index = manager.deck_index(deck_id)
+            if state is None:
+                removed_decks.append(deck_id)
+            elif index is None:
+                manager.execute([{'op': 'add_deck', 'name': state['name'], 'id': deck_id}])
+                # Cards that came before their deck
+                for card_id, entry in list(self.orphans.items()):
+                    if entry['content'][1]['deck'] == deck_id:
+                        del self.orphans[card_id]
+                        cards.append((card_id, entry, entry, None))
+            elif manager.decks[index]['name'] != state['name']:
+                manager.execute([{'op': 'edit_deck', 'deck': index, 'name': state['name']}])
+        
+        deletes = {}
+        moves = {}
+        adds = {}
+        updates = []
+        for card_id, wins, entry, local in cards:
+            current = self.locate(card_id, [local, entry])
+            if current is None:
+                # Not here: brought in whole, with whichever changes of this
+                # device and the pulled ones are later
+                entry = merge(entry, local) if local is not None else entry
+                value = entry['content'][1] if 'content' in entry else None
+                if value is None:
+                    continue
+                if manager.deck_index(value['deck']) is None:
+                    # The deck is gone or not here yet
+                    self.orphans[card_id] = entry
+                    continue
+                adds.setdefault(value['deck'], []).append((card_id, value))
+                if 'review' in entry:
+                    updates.append((card_id, value['deck'], entry['review'][1]))
+                continue
+            content = wins.get('content')
+            value = content[1] if content else None
+            if value is not None and manager.deck_index(value['deck']) is None:
+                self.orphans[card_id] = merge(entry, local) if local is not None else entry
+                value = None
+            if content:
+                if value is None:
+                    deletes.setdefault(current, []).append(card_id)
+                    continue
+                if value['deck'] != current:
+                    moves.setdefault((current, value['deck']), []).append(card_id)
+                updates.append((card_id, value['deck'], value))
+            if 'review' in wins:
+                updates.append((card_id, value['deck'] if value is not None else current, wins['review'][1]))
+        
+        for deck_id, card_ids in deletes.items():
+            index = manager.deck_index(deck_id)
+            positions = [manager.card_index(card_id, index) for card_id in card_ids]
+            manager.execute([{'op': 'delete_cards', 'deck': index, 'cards': positions}])
+        for (source, target), card_ids in moves.items():
+            index = manager.deck_index(source)
+            positions = [manager.card_index(card_id, index) for card_id in card_ids]
+            manager.execute([{'op': 'move_cards', 'deck': index, 'cards': positions, 'to': manager.deck_index(target)}])
+        if adds:
+            manager.execute([{'op': 'add_cards', 'deck': manager.deck_index(deck_id),
+                              'cards': [[value['question'], value['answer']] for card_id, value in added],
+                              'ids': [card_id for card_id, value in added]}
+                             for deck_id, added in adds.items()])
+        
+        records = []
+        for card_id, deck_id, value in updates:
+            index = manager.deck_index(deck_id)
+            position = manager.card_index(card_id, index)
+            if position is None:
+                continue
+            card = manager.deck_cards(index)[position]
+            if 'question' in value:
+                if (card.question, card.answer) != (value['question'], value['answer']):
+                    records.append({'op': 'edit_card', 'deck': index, 'card': position,
+                                    'question': value['question'], 'answer': value['answer']})
+            elif any(getattr(card, name) != value[name] for name in REVIEW_FIELDS):
+                records.append(dict({'op': 'review_card', 'deck': index, 'card': position}, **value))
+        if records:
+            manager.execute(records)
+        
+        for deck_id in removed_decks:
+            index = manager.deck_index(deck_id)
+            if index is None:
+                continue
+            # Cards deleted with the deck would come back with it
+            cards = manager.deck_cards(index)
+            for row in cards.rows(range(len(cards))):
+                self.orphans[row[-1]] = merge(self.orphans.get(row[-1]), {
+                    'card': row[-1],
+                    'content': [[0, 0], {'deck': deck_id, 'question': row[0], 'answer': row[1]}],
+                    'review': [[0, 0], dict(zip(REVIEW_FIELDS, row[2:6]))]
+                })
+            manager.execute([{'op': 'delete_deck', 'deck': index}])
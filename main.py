@@ -1,35 +1,102 @@
+import time
+
+# Taken before Kivy is imported so the startup timeline includes it
+STARTUP_T0 = time.perf_counter()
+
 from kivy.app import App
 from kivy.uix.screenmanager import ScreenManager, Screen, SlideTransition
 from kivy.uix.boxlayout import BoxLayout
 from kivy.uix.button import Button
 from kivy.uix.label import Label
 from kivy.uix.textinput import TextInput
+from kivy.uix.checkbox import CheckBox
 from kivy.uix.scrollview import ScrollView
-from kivy.uix.gridlayout import GridLayout
+from kivy.uix.popup import Popup
+from kivy.uix.image import Image
+from kivy.uix.filechooser import FileChooserListView
+from kivy.clock import Clock
+from kivy.uix.recycleview import RecycleView
+from kivy.uix.recycleview.views import RecycleDataViewBehavior
+from kivy.uix.recycleboxlayout import RecycleBoxLayout
 from kivy.core.window import Window
+from kivy.core.text import Label as CoreLabel
 from kivy.graphics import Color, Rectangle, RoundedRectangle
 from kivy.metrics import dp
 from kivy.utils import get_color_from_hex
-import json
+import csv
 import os
+import threading
+from collections import OrderedDict
+
+from flashcards import BinaryStorage, FlashCardManager, JsonStorage, SqliteStorage, WriteBehindStorage
+
+
+class StartupTimeline:
+    # Milestones in ms since main.py started importing
+    def __init__(self, start):
+        self.start = start
+        self.marks = []
+    
+    def mark(self, label):
+        self.marks.append((label, (time.perf_counter() - self.start) * 1000))
+    
+    def lines(self):
+        lines = []
+        previous = 0.0
+        for label, at in self.marks:
+            lines.append(f'{at:8.1f} ms  (+{at - previous:6.1f})  {label}')
+            previous = at
+        return lines
+    
+    def report(self, path=None):
+        text = '\n'.join(self.lines()) + '\n'
+        if path:
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(text)
+        else:
+            print(text, end='')
+
+
+startup = StartupTimeline(STARTUP_T0)
+startup.mark('imports')
+
+
+# Theme colors and metrics, resolved once at import instead of per widget
+COLORS = {
+    'primary': tuple(get_color_from_hex('#F9AA33')),
+    'secondary': tuple(get_color_from_hex('#4A6572')),
+    'danger': tuple(get_color_from_hex('#E53935')),
+    'success': tuple(get_color_from_hex('#43A047')),
+    'white': tuple(get_color_from_hex('#FFFFFF')),
+    'text': tuple(get_color_from_hex('#344955')),
+    'title': tuple(get_color_from_hex('#232F34')),
+    'hint': tuple(get_color_from_hex('#888888')),
+    'background': tuple(get_color_from_hex('#ECEFF1')),
+}
+RADIUS = [dp(10)] * 4
+BODY_FONT_SIZE = dp(16)
+CARD_FONT_SIZE = dp(20)
+TITLE_FONT_SIZE = dp(28)
+INPUT_PADDING = [dp(15), dp(15)]
+ROW_PADDING = [dp(10), dp(10)]
+ROW_SPACING = dp(10)
 
 
 class StyledButton(Button):
+    # Subclasses only pick a theme color; the canvas is built once here
+    theme_color = 'secondary'
+    
     def __init__(self, **kwargs):
+        kwargs.setdefault('background_color', (0, 0, 0, 0))
+        kwargs.setdefault('background_normal', '')
+        kwargs.setdefault('font_size', BODY_FONT_SIZE)
+        kwargs.setdefault('bold', True)
+        kwargs.setdefault('color', COLORS['white'])
         super().__init__(**kwargs)
-        self.background_color = (0, 0, 0, 0)
-        self.background_normal = ''
-        self.font_size = dp(16)
-        self.bold = True
-        self.color = get_color_from_hex('#FFFFFF')
         
         with self.canvas.before:
-            Color(*get_color_from_hex('#4A6572'))
-            self.rect = RoundedRectangle(
-                radius=[dp(10), dp(10), dp(10), dp(10)],
-                size=self.size,
-                pos=self.pos
-            )
+            Color(*COLORS[self.theme_color])
+            self.rect = RoundedRectangle(radius=RADIUS, size=self.size, pos=self.pos)
         
         self.bind(pos=self.update_rect, size=self.update_rect)
     
@@ -39,131 +106,139 @@ class StyledButton(Button):
 
 
 class PrimaryButton(StyledButton):
-    def __init__(self, **kwargs):
-        super().__init__(**kwargs)
-        with self.canvas.before:
-            self.canvas.before.clear()
-            Color(*get_color_from_hex('#F9AA33'))
-            self.rect = RoundedRectangle(
-                radius=[dp(10), dp(10), dp(10), dp(10)],
-                size=self.size,
-                pos=self.pos
-            )
+    theme_color = 'primary'
 
 
 class SecondaryButton(StyledButton):
-    def __init__(self, **kwargs):
-        super().__init__(**kwargs)
-        with self.canvas.before:
-            self.canvas.before.clear()
-            Color(*get_color_from_hex('#4A6572'))
-            self.rect = RoundedRectangle(
-                radius=[dp(10), dp(10), dp(10), dp(10)],
-                size=self.size,
-                pos=self.pos
-            )
+    theme_color = 'secondary'
 
 
 class DangerButton(StyledButton):
-    def __init__(self, **kwargs):
-        super().__init__(**kwargs)
-        with self.canvas.before:
-            self.canvas.before.clear()
-            Color(*get_color_from_hex('#E53935'))
-            self.rect = RoundedRectangle(
-                radius=[dp(10), dp(10), dp(10), dp(10)],
-                size=self.size,
-                pos=self.pos
-            )
+    theme_color = 'danger'
 
 
 class SuccessButton(StyledButton):
-    def __init__(self, **kwargs):
-        super().__init__(**kwargs)
-        with self.canvas.before:
-            self.canvas.before.clear()
-            Color(*get_color_from_hex('#43A047'))  # Green
-            self.rect = RoundedRectangle(
-                radius=[dp(10), dp(10), dp(10), dp(10)],
-                size=self.size,
-                pos=self.pos
-            )
+    theme_color = 'success'
 
 
 class StyledLabel(Label):
     def __init__(self, **kwargs):
+        kwargs.setdefault('color', COLORS['text'])
+        kwargs.setdefault('halign', 'center')
+        kwargs.setdefault('valign', 'middle')
         super().__init__(**kwargs)
-        self.color = get_color_from_hex('#344955')
-        self.halign = 'center'
-        self.valign = 'middle'
 
 
 class TitleLabel(StyledLabel):
     def __init__(self, **kwargs):
+        kwargs.setdefault('font_size', TITLE_FONT_SIZE)
+        kwargs.setdefault('bold', True)
+        kwargs.setdefault('color', COLORS['title'])
         super().__init__(**kwargs)
-        self.font_size = dp(28)
-        self.bold = True
-        self.color = get_color_from_hex('#232F34')
 
 
 class StyledTextInput(TextInput):
     def __init__(self, **kwargs):
+        kwargs.setdefault('background_color', (1, 1, 1, 1))
+        kwargs.setdefault('background_normal', '')
+        kwargs.setdefault('background_active', '')
+        kwargs.setdefault('foreground_color', COLORS['text'])
+        kwargs.setdefault('font_size', BODY_FONT_SIZE)
+        kwargs.setdefault('padding', INPUT_PADDING)
+        kwargs.setdefault('multiline', True)
+        kwargs.setdefault('write_tab', False)
+        kwargs.setdefault('hint_text_color', COLORS['hint'])
         super().__init__(**kwargs)
-        self.background_color = (1, 1, 1, 1)
-        self.background_normal = ''
-        self.background_active = ''
-        self.foreground_color = get_color_from_hex('#344955')
-        self.font_size = dp(16)
-        self.padding = [dp(15), dp(15)]
-        self.multiline = True
-        self.write_tab = False
-        self.hint_text_color = get_color_from_hex('#888888')
 
 
-class DeckWidget(BoxLayout):
-    def __init__(self, deck, index, select_callback, edit_callback, delete_callback, **kwargs):
+class StyledRow(RecycleDataViewBehavior, BoxLayout):
+    # White rounded row with a faint tinted border, shared by the
+    # RecycleView rows
+    border_color = 'secondary'
+    row_height = dp(120)
+    
+    def __init__(self, **kwargs):
+        kwargs.setdefault('orientation', 'horizontal')
+        kwargs.setdefault('size_hint_y', None)
+        kwargs.setdefault('height', self.row_height)
+        kwargs.setdefault('padding', ROW_PADDING)
+        kwargs.setdefault('spacing', ROW_SPACING)
         super().__init__(**kwargs)
-        self.orientation = 'horizontal'
-        self.size_hint_y = None
-        self.height = dp(140)  # Augmenté pour accommoder les boutons en colonne
-        self.padding = [dp(10), dp(10)]
-        self.spacing = dp(10)
+        # Id of the deck or card shown, which the buttons act on: unlike
+        # the row index it still names the same item after rows move
+        self.item_id = None
+        self.rv = None
         
         with self.canvas.before:
-            Color(*get_color_from_hex('#FFFFFF'))
-            self.rect = RoundedRectangle(
-                radius=[dp(10), dp(10), dp(10), dp(10)],
-                size=self.size,
-                pos=self.pos
-            )
-            Color(*get_color_from_hex('#4A6572'), a=0.1)
+            Color(*COLORS['white'])
+            self.rect = RoundedRectangle(radius=RADIUS, size=self.size, pos=self.pos)
+            Color(*COLORS[self.border_color], a=0.1)
             self.border = RoundedRectangle(
-                radius=[dp(10), dp(10), dp(10), dp(10)],
+                radius=RADIUS,
                 size=(self.size[0]-2, self.size[1]-2),
                 pos=(self.pos[0]+1, self.pos[1]+1)
             )
         
         self.bind(pos=self.update_rect, size=self.update_rect)
         
+        # Only shown while the list is in selection mode
+        self.check = CheckBox(size_hint_x=None, width=0, opacity=0, disabled=True, color=COLORS['secondary'])
+        self.check.bind(active=self.on_check)
+        self.add_widget(self.check)
+    
+    def update_rect(self, *args):
+        self.rect.pos = self.pos
+        self.rect.size = self.size
+        self.border.size = (self.size[0]-2, self.size[1]-2)
+        self.border.pos = (self.pos[0]+1, self.pos[1]+1)
+    
+    def show_selection(self, rv):
+        # rv.selected holds the picked ids, None outside selection mode
+        selecting = rv.selected is not None
+        self.check.width = dp(40) if selecting else 0
+        self.check.opacity = 1 if selecting else 0
+        self.check.disabled = not selecting
+        self.check.active = selecting and self.item_id in rv.selected
+    
+    def on_check(self, check, active):
+        selected = self.rv.selected if self.rv is not None else None
+        if selected is None or (self.item_id in selected) == active:
+            return
+        if active:
+            selected.add(self.item_id)
+        else:
+            selected.discard(self.item_id)
+        self.rv.selection_callback()
+
+
+class DeckWidget(StyledRow):
+    # Row view recycled by DecksScreen's RecycleView; rows carry the deck
+    # id, name and cached card count
+    border_color = 'secondary'
+    row_height = dp(140)  # Augmenté pour accommoder les boutons en colonne
+    
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        
         # Deck content
         content_layout = BoxLayout(orientation='vertical', size_hint_x=0.6)
         
-        name_label = StyledLabel(
-            text=deck['name'],
+        self.name_label = StyledLabel(
+            text='',
             font_size=dp(18),
             bold=True,
             size_hint_y=0.6,
             halign='left'
         )
-        content_layout.add_widget(name_label)
+        content_layout.add_widget(self.name_label)
         
-        count_label = StyledLabel(
-            text=f"{len(deck['cards'])} cartes",
+        self.count_label = StyledLabel(
+            text='',
             font_size=dp(14),
             size_hint_y=0.4,
             halign='left'
         )
-        content_layout.add_widget(count_label)
+        content_layout.add_widget(self.count_label)
         
         self.add_widget(content_layout)
         
@@ -174,75 +249,61 @@ class DeckWidget(BoxLayout):
             text='Ouvrir',
             size_hint_y=0.33
         )
-        select_btn.bind(on_press=lambda x: select_callback(index))
+        select_btn.bind(on_press=lambda x: self.rv.select_callback(self.item_id))
         button_layout.add_widget(select_btn)
         
         edit_btn = SuccessButton(
             text='Modifier', 
             size_hint_y=0.33
         )
-        edit_btn.bind(on_press=lambda x: edit_callback(index))
+        edit_btn.bind(on_press=lambda x: self.rv.edit_callback(self.item_id))
         button_layout.add_widget(edit_btn)
         
         delete_btn = DangerButton(
             text='Supprimer',
             size_hint_y=0.33
         )
-        delete_btn.bind(on_press=lambda x: delete_callback(index))
+        delete_btn.bind(on_press=lambda x: self.rv.delete_callback(self.item_id))
         button_layout.add_widget(delete_btn)
         
         self.add_widget(button_layout)
     
-    def update_rect(self, *args):
-        self.rect.pos = self.pos
-        self.rect.size = self.size
-        self.border.size = (self.size[0]-2, self.size[1]-2)
-        self.border.pos = (self.pos[0]+1, self.pos[1]+1)
+    def refresh_view_attrs(self, rv, index, data):
+        self.rv = rv
+        self.item_id = data['id']
+        self.show_selection(rv)
+        self.name_label.text = data['name']
+        self.count_label.text = f"{data['count']} cartes"
+        return super().refresh_view_attrs(rv, index, data)
 
-class CardWidget(BoxLayout):
-    def __init__(self, card, index, edit_callback, delete_callback, **kwargs):
+class CardWidget(StyledRow):
+    # Row view recycled by ManageCardsScreen's RecycleView; the card is
+    # found in refresh_view_attrs and its text read from the deck
+    border_color = 'primary'
+    row_height = dp(120)
+    
+    def __init__(self, **kwargs):
         super().__init__(**kwargs)
-        self.orientation = 'horizontal'
-        self.size_hint_y = None
-        self.height = dp(120)
-        self.padding = [dp(10), dp(10)]
-        self.spacing = dp(10)
-        
-        with self.canvas.before:
-            Color(*get_color_from_hex('#FFFFFF'))
-            self.rect = RoundedRectangle(
-                radius=[dp(10), dp(10), dp(10), dp(10)],
-                size=self.size,
-                pos=self.pos
-            )
-            Color(*get_color_from_hex('#F9AA33'), a=0.1)
-            self.border = RoundedRectangle(
-                radius=[dp(10), dp(10), dp(10), dp(10)],
-                size=(self.size[0]-2, self.size[1]-2),
-                pos=(self.pos[0]+1, self.pos[1]+1)
-            )
-        
-        self.bind(pos=self.update_rect, size=self.update_rect)
         
         # Card content
         content_layout = BoxLayout(orientation='vertical', size_hint_x=0.7)
         
-        question_label = StyledLabel(
-            text=f"Q: {card.question[:50]}{'...' if len(card.question) > 50 else ''}",
+        self.question_label = StyledLabel(
+            text='',
             font_size=dp(16),
             bold=True,
             size_hint_y=0.5,
             halign='left'
         )
-        content_layout.add_widget(question_label)
+        content_layout.add_widget(self.question_label)
         
-        answer_label = StyledLabel(
-            text=f"A: {card.answer[:50]}{'...' if len(card.answer) > 50 else ''}",
+        self.answer_label = StyledLabel(
+            text='',
             font_size=dp(14),
             size_hint_y=0.5,
             halign='left'
         )
-        content_layout.add_widget(answer_label)
+        content_layout.add_widget(self.answer_label)
         
         self.add_widget(content_layout)
         
@@ -250,162 +311,24 @@ class CardWidget(BoxLayout):
         button_layout = BoxLayout(orientation='vertical', size_hint_x=0.3, spacing=dp(5))
         
         edit_btn = SuccessButton(text='Modifier')
-        edit_btn.bind(on_press=lambda x: edit_callback(index))
+        edit_btn.bind(on_press=lambda x: self.rv.edit_callback(self.item_id))
         button_layout.add_widget(edit_btn)
         
         delete_btn = DangerButton(text='Supprimer')
-        delete_btn.bind(on_press=lambda x: delete_callback(index))
+        delete_btn.bind(on_press=lambda x: self.rv.delete_callback(self.item_id))
         button_layout.add_widget(delete_btn)
         
         self.add_widget(button_layout)
     
-    def update_rect(self, *args):
-        self.rect.pos = self.pos
-        self.rect.size = self.size
-        self.border.size = (self.size[0]-2, self.size[1]-2)
-        self.border.pos = (self.pos[0]+1, self.pos[1]+1)
-
-
-class FlashCard:
-    def __init__(self, question, answer):
-        self.question = question
-        self.answer = answer
-
-
-class FlashCardManager:
-    def __init__(self):
-        self.decks = []
-        self.current_deck_index = 0
-        self.current_card_index = 0
-        self.data_file = 'flashcards.json'
-        self.load_decks()
-        
-        # Create default deck if no decks exist
-        if not self.decks:
-            self.add_deck("Mes Cartes")
-    
-    @property
-    def current_deck(self):
-        if self.decks and 0 <= self.current_deck_index < len(self.decks):
-            return self.decks[self.current_deck_index]
-        return None
-    
-    @property
-    def cards(self):
-        deck = self.current_deck
-        return deck['cards'] if deck else []
-    
-    def add_deck(self, name):
-        new_deck = {
-            'name': name,
-            'cards': []
-        }
-        self.decks.append(new_deck)
-        self.save_decks()
-    
-    def edit_deck(self, index, new_name):
-        if 0 <= index < len(self.decks):
-            self.decks[index]['name'] = new_name
-            self.save_decks()
-    
-    def delete_deck(self, index):
-        if 0 <= index < len(self.decks):
-            self.decks.pop(index)
-            # Adjust current deck index if needed
-            if self.current_deck_index >= len(self.decks) and len(self.decks) > 0:
-                self.current_deck_index = len(self.decks) - 1
-            elif len(self.decks) == 0:
-                self.current_deck_index = 0
-                self.add_deck("Nouvelle Liste")
-            self.save_decks()
-    
-    def set_current_deck(self, index):
-        if 0 <= index < len(self.decks):
-            self.current_deck_index = index
-            self.current_card_index = 0
-    
-    def add_card(self, question, answer):
-        deck = self.current_deck
-        if deck:
-            deck['cards'].append(FlashCard(question, answer))
-            self.save_decks()
-    
-    def edit_card(self, index, question, answer):
-        deck = self.current_deck
-        if deck and 0 <= index < len(deck['cards']):
-            deck['cards'][index].question = question
-            deck['cards'][index].answer = answer
-            self.save_decks()
-    
-    def delete_card(self, index):
-        deck = self.current_deck
-        if deck and 0 <= index < len(deck['cards']):
-            deck['cards'].pop(index)
-            # Adjust current card index if needed
-            if self.current_card_index >= len(deck['cards']) and len(deck['cards']) > 0:
-                self.current_card_index = len(deck['cards']) - 1
-            elif len(deck['cards']) == 0:
-                self.current_card_index = 0
-            self.save_decks()
-    
-    def get_current_card(self):
-        cards = self.cards
-        if cards and 0 <= self.current_card_index < len(cards):
-            return cards[self.current_card_index]
-        return None
-    
-    def next_card(self):
-        if self.cards:
-            self.current_card_index = (self.current_card_index + 1) % len(self.cards)
-    
-    def prev_card(self):
-        if self.cards:
-            self.current_card_index = (self.current_card_index - 1) % len(self.cards)
-    
-    def save_decks(self):
-        # Convert FlashCard objects to dictionaries for JSON serialization
-        data = {
-            'decks': [],
-            'current_deck_index': self.current_deck_index
-        }
-        
-        for deck in self.decks:
-            deck_data = {
-                'name': deck['name'],
-                'cards': [{'question': card.question, 'answer': card.answer} for card in deck['cards']]
-            }
-            data['decks'].append(deck_data)
-        
-        with open(self.data_file, 'w') as f:
-            json.dump(data, f, indent=4, ensure_ascii=False)
-    
-    def load_decks(self):
-        if os.path.exists(self.data_file):
-            try:
-                with open(self.data_file, 'r') as f:
-                    data = json.load(f)
-                    
-                    # Handle both old format (list of cards) and new format (decks)
-                    if isinstance(data, list):
-                        # Old format - convert to new format with one deck
-                        self.decks = [{
-                            'name': 'Mes Cartes',
-                            'cards': [FlashCard(item['question'], item['answer']) for item in data]
-                        }]
-                        self.current_deck_index = 0
-                    else:
-                        # New format with decks
-                        self.decks = []
-                        for deck_data in data.get('decks', []):
-                            deck = {
-                                'name': deck_data['name'],
-                                'cards': [FlashCard(item['question'], item['answer']) for item in deck_data['cards']]
-                            }
-                            self.decks.append(deck)
-                        self.current_deck_index = data.get('current_deck_index', 0)
-            except Exception as e:
-                print(f"Error loading decks: {e}")
-                self.decks = []
+    def refresh_view_attrs(self, rv, index, data):
+        # Search results name their card by id; otherwise row and card match
+        self.rv = rv
+        card = rv.find_card(data['card_id']) if 'card_id' in data else rv.cards[index]
+        self.item_id = card.id
+        self.show_selection(rv)
+        self.question_label.text = f"Q: {card.question[:50]}{'...' if len(card.question) > 50 else ''}"
+        self.answer_label.text = f"A: {card.answer[:50]}{'...' if len(card.answer) > 50 else ''}"
+        return super().refresh_view_attrs(rv, index, data)
 
 
 class HomeScreen(Screen):
@@ -418,7 +341,7 @@ class HomeScreen(Screen):
         
         # Set background
         with main_layout.canvas.before:
-            Color(*get_color_from_hex('#ECEFF1'))
+            Color(*COLORS['background'])
             self.rect = Rectangle(size=Window.size, pos=main_layout.pos)
         main_layout.bind(pos=self.update_rect, size=self.update_rect)
         
@@ -442,13 +365,25 @@ class HomeScreen(Screen):
         )
         main_layout.add_widget(self.stats_label)
         
+        # Review statistics, from the summary kept alongside the review log
+        self.reviews_label = StyledLabel(
+            text='',
+            font_size=dp(14),
+            size_hint=(1, 0.08)
+        )
+        main_layout.add_widget(self.reviews_label)
+        
         # Buttons
-        button_layout = BoxLayout(orientation='vertical', spacing=dp(15), size_hint=(1, 0.65))
+        button_layout = BoxLayout(orientation='vertical', spacing=dp(15), size_hint=(1, 0.57))
         
         study_btn = PrimaryButton(text='Étudier', size_hint=(1, 0.2))
         study_btn.bind(on_press=self.go_to_study)
         button_layout.add_widget(study_btn)
         
+        review_all_btn = PrimaryButton(text='Tout Réviser', size_hint=(1, 0.2))
+        review_all_btn.bind(on_press=self.go_to_review_all)
+        button_layout.add_widget(review_all_btn)
+        
         add_btn = SecondaryButton(text='Ajouter une Carte', size_hint=(1, 0.2))
         add_btn.bind(on_press=self.go_to_add)
         button_layout.add_widget(add_btn)
@@ -477,17 +412,44 @@ class HomeScreen(Screen):
         deck = self.manager_ref.current_deck
         if deck:
             self.deck_info.text = f"Liste: {deck['name']}"
-            card_count = len(deck['cards'])
+            card_count = deck['count']
             self.stats_label.text = f'{card_count} carte{"s" if card_count != 1 else ""}'
         else:
             self.deck_info.text = "Aucune liste"
             self.stats_label.text = "0 cartes"
+        self.update_reviews()
+    
+    def update_reviews(self):
+        reviews = self.manager_ref.reviews
+        if reviews is None:
+            self.reviews_label.text = ''
+            return
+        summary = reviews.summary
+        streak, longest = summary.streaks()
+        text = f"Aujourd'hui: {summary.today()} · Série: {streak} j (record {longest} j)"
+        deck = self.manager_ref.current_deck
+        accuracy = summary.accuracy(deck['id']) if deck else None
+        if accuracy is not None:
+            text += f" · Réussite: {accuracy * 100:.0f} %"
+        self.reviews_label.text = text
     
     def go_to_study(self, instance):
         if self.manager_ref.cards:
+            self.manager.transition = SlideTransition(direction='left')
+            self.manager_ref.study_next_due()
+            self.manager.current = 'study'
+            self.manager.get_screen('study').update_card()
+    
+    def go_to_review_all(self, instance):
+        # Due cards from every deck, most overdue first
+        session = self.manager_ref.start_session()
+        if session.next_card():
             self.manager.transition = SlideTransition(direction='left')
             self.manager.current = 'study'
             self.manager.get_screen('study').update_card()
+        else:
+            self.manager_ref.end_session()
+            self.stats_label.text = "Aucune carte à réviser"
     
     def go_to_add(self, instance):
         self.manager.transition = SlideTransition(direction='left')
@@ -505,17 +467,34 @@ class HomeScreen(Screen):
 
 
 class StudyScreen(Screen):
+    # Card faces are rendered to textures once and kept in a small LRU,
+    # and the faces of the next cards are rendered one per frame ahead
+    texture_cache_size = 32
+    prefetch_count = 3
+    
     def __init__(self, manager_ref, **kwargs):
         super().__init__(**kwargs)
         self.manager_ref = manager_ref
         self.show_answer = False
+        # Set once every card of the deck has been graded into the future
+        self.nothing_due = False
+        self.shown_at = 0.0
+        self.response_time = None
+        # Id of the card shown, to find it again after a sync
+        self.card_id = None
+        self.textures = OrderedDict()
+        self.text_width = Window.width - dp(80)
+        self.card_text = ''
+        self.prefetch_queue = []
+        self.prefetch_trigger = Clock.create_trigger(self.prefetch_step)
+        Window.bind(on_resize=self.on_window_resize)
         
         # Main layout
         main_layout = BoxLayout(orientation='vertical', padding=dp(20), spacing=dp(15))
         
         # Set background
         with main_layout.canvas.before:
-            Color(*get_color_from_hex('#ECEFF1'))
+            Color(*COLORS['background'])
             self.rect = Rectangle(size=Window.size, pos=main_layout.pos)
         main_layout.bind(pos=self.update_rect, size=self.update_rect)
         
@@ -536,10 +515,10 @@ class StudyScreen(Screen):
         main_layout.add_widget(self.progress_label)
         
         # Card display
-        card_container = BoxLayout(orientation='vertical', size_hint=(1, 0.6))
+        card_container = BoxLayout(orientation='vertical', size_hint=(1, 0.5))
         
         with card_container.canvas.before:
-            Color(*get_color_from_hex('#FFFFFF'))
+            Color(*COLORS['white'])
             self.card_bg = RoundedRectangle(
                 radius=[dp(15), dp(15), dp(15), dp(15)],
                 size=card_container.size,
@@ -547,13 +526,9 @@ class StudyScreen(Screen):
             )
         card_container.bind(pos=self.update_card_bg, size=self.update_card_bg)
         
-        self.card_label = StyledLabel(
-            text='Aucune carte disponible.\nAjoutez des cartes pour étudier!',
-            font_size=dp(20),
-            text_size=(Window.width - dp(80), None)
-        )
-        self.card_label.bind(texture_size=self.update_text_size)
-        card_container.add_widget(self.card_label)
+        self.card_view = Image()
+        self.show_text('Aucune carte disponible.\nAjoutez des cartes pour étudier!')
+        card_container.add_widget(self.card_view)
         
         main_layout.add_widget(card_container)
         
@@ -562,6 +537,21 @@ class StudyScreen(Screen):
         self.flip_btn.bind(on_press=self.flip_card)
         main_layout.add_widget(self.flip_btn)
         
+        # Grading, from forgotten to easy (SM-2 quality)
+        grade_layout = BoxLayout(size_hint=(1, 0.1), spacing=dp(5))
+        
+        for text, quality, button_class in (
+            ('À revoir', 1, DangerButton),
+            ('Difficile', 3, SecondaryButton),
+            ('Bien', 4, SuccessButton),
+            ('Facile', 5, PrimaryButton)
+        ):
+            grade_btn = button_class(text=text, font_size=dp(14))
+            grade_btn.bind(on_press=lambda x, q=quality: self.grade_card(q))
+            grade_layout.add_widget(grade_btn)
+        
+        main_layout.add_widget(grade_layout)
+        
         # Navigation
         nav_layout = BoxLayout(size_hint=(1, 0.1), spacing=dp(10))
         
@@ -590,52 +580,160 @@ class StudyScreen(Screen):
         self.card_bg.pos = instance.pos
         self.card_bg.size = instance.size
     
-    def update_text_size(self, instance, value):
-        instance.text_size = (Window.width - dp(80), None)
+    def on_window_resize(self, window, width, height):
+        self.text_width = width - dp(80)
+        self.textures.clear()
+        self.show_text(self.card_text)
+    
+    def render_text(self, text):
+        key = (text, self.text_width)
+        texture = self.textures.get(key)
+        if texture is not None:
+            self.textures.move_to_end(key)
+            return texture
+        label = CoreLabel(
+            text=text,
+            font_size=CARD_FONT_SIZE,
+            text_size=(self.text_width, None),
+            halign='center',
+            valign='middle',
+            color=COLORS['text']
+        )
+        label.refresh()
+        texture = label.texture
+        self.textures[key] = texture
+        if len(self.textures) > self.texture_cache_size:
+            self.textures.popitem(last=False)
+        return texture
+    
+    def show_text(self, text):
+        self.card_text = text
+        self.card_view.texture = self.render_text(text)
+    
+    def prefetch(self, card):
+        # Current answer first, then both faces of the likely next cards
+        texts = [card.answer]
+        for upcoming in self.manager_ref.upcoming_cards(self.prefetch_count):
+            texts.append(upcoming.question)
+            texts.append(upcoming.answer)
+        self.prefetch_queue = texts
+        self.prefetch_trigger()
+    
+    def prefetch_step(self, dt):
+        if not self.prefetch_queue:
+            return
+        self.render_text(self.prefetch_queue.pop(0))
+        if self.prefetch_queue:
+            self.prefetch_trigger()
+    
+    def on_enter(self):
+        # Also dispatched once a sync pulled changes, which may have deleted
+        # the card shown
+        if self.card_id is not None and self.locate_card() is None:
+            self.show_next_due()
+    
+    def locate_card(self):
+        # The card shown: remote changes applied between frames may have
+        # moved it, so it is looked up by id, None once it is gone
+        card = self.manager_ref.get_current_card()
+        if self.card_id is None or card is not None and card.id == self.card_id:
+            return card
+        if not self.manager_ref.current_deck:
+            return None
+        index = self.manager_ref.card_index(self.card_id)
+        if index is None:
+            return None
+        self.manager_ref.current_card_index = index
+        return self.manager_ref.get_current_card()
     
     def update_card(self):
         self.show_answer = False
+        self.nothing_due = False
         card = self.manager_ref.get_current_card()
         deck = self.manager_ref.current_deck
+        self.card_id = card.id if card else None
         
         if deck:
             self.deck_label.text = f"Liste: {deck['name']}"
         
         if card:
-            self.card_label.text = card.question
+            self.show_text(card.question)
             self.flip_btn.text = 'Montrer la Réponse'
+            # Seconds to recall are counted until the answer is first shown
+            self.shown_at = time.monotonic()
+            self.response_time = None
             self.update_progress()
+            self.prefetch(card)
         else:
-            self.card_label.text = "Aucune carte disponible.\nAjoutez des cartes pour étudier!"
+            self.show_text("Aucune carte disponible.\nAjoutez des cartes pour étudier!")
             self.progress_label.text = ""
     
     def update_progress(self):
+        session = self.manager_ref.session
         cards = self.manager_ref.cards
-        if cards:
+        if session:
+            self.progress_label.text = f"Révisées: {session.reviewed} · Oubliées: {session.lapses}"
+        elif cards:
             current = self.manager_ref.current_card_index + 1
             total = len(cards)
             self.progress_label.text = f"Carte {current} sur {total}"
     
     def flip_card(self, instance):
-        card = self.manager_ref.get_current_card()
-        if card:
+        card = self.locate_card()
+        if card is None:
+            self.on_enter()
+        elif not self.nothing_due:
             self.show_answer = not self.show_answer
             if self.show_answer:
-                self.card_label.text = card.answer
+                self.show_text(card.answer)
                 instance.text = 'Montrer la Question'
+                if self.response_time is None:
+                    self.response_time = time.monotonic() - self.shown_at
             else:
-                self.card_label.text = card.question
+                self.show_text(card.question)
                 instance.text = 'Montrer la Réponse'
     
+    def grade_card(self, quality):
+        if self.nothing_due:
+            return
+        if not self.locate_card():
+            self.on_enter()
+            return
+        session = self.manager_ref.session
+        if session:
+            session.grade(quality, response_time=self.response_time)
+        else:
+            self.manager_ref.grade_card(quality, response_time=self.response_time)
+        self.show_next_due()
+    
+    def show_next_due(self):
+        session = self.manager_ref.session
+        if session:
+            found = session.next_card()
+        else:
+            found = self.manager_ref.study_next_due()
+        if found:
+            self.update_card()
+        else:
+            self.nothing_due = True
+            self.card_id = None
+            self.prefetch_queue = []
+            self.show_text("Aucune carte à réviser pour le moment.\nUtilisez Suivant pour parcourir la liste.")
+            self.flip_btn.text = 'Montrer la Réponse'
+            self.progress_label.text = ""
+    
     def next_card(self, instance):
+        self.locate_card()
         self.manager_ref.next_card()
         self.update_card()
     
     def prev_card(self, instance):
+        self.locate_card()
         self.manager_ref.prev_card()
         self.update_card()
     
     def go_home(self, instance):
+        self.manager_ref.end_session()
         self.manager.transition = SlideTransition(direction='right')
         self.manager.current = 'home'
 
@@ -644,13 +742,15 @@ class AddCardScreen(Screen):
     def __init__(self, manager_ref, **kwargs):
         super().__init__(**kwargs)
         self.manager_ref = manager_ref
+        # Question the user chose to save despite a duplicate warning
+        self.confirmed_question = None
         
         # Main layout
         main_layout = BoxLayout(orientation='vertical', padding=dp(20), spacing=dp(15))
         
         # Set background
         with main_layout.canvas.before:
-            Color(*get_color_from_hex('#ECEFF1'))
+            Color(*COLORS['background'])
             self.rect = Rectangle(size=Window.size, pos=main_layout.pos)
         main_layout.bind(pos=self.update_rect, size=self.update_rect)
         
@@ -669,7 +769,7 @@ class AddCardScreen(Screen):
         main_layout.add_widget(title_layout)
         
         # Form
-        form_layout = BoxLayout(orientation='vertical', spacing=dp(10), size_hint=(1, 0.7))
+        form_layout = BoxLayout(orientation='vertical', spacing=dp(10), size_hint=(1, 0.62))
         
         # Question
         form_layout.add_widget(StyledLabel(text='Question:', size_hint=(1, 0.1)))
@@ -689,6 +789,16 @@ class AddCardScreen(Screen):
         
         main_layout.add_widget(form_layout)
         
+        # Duplicate warning
+        self.warning_label = StyledLabel(
+            text='',
+            font_size=dp(14),
+            size_hint=(1, 0.08)
+        )
+        self.warning_label.color = COLORS['danger']
+        self.warning_label.bind(size=lambda instance, value: setattr(instance, 'text_size', value))
+        main_layout.add_widget(self.warning_label)
+        
         # Buttons
         button_layout = BoxLayout(spacing=dp(10), size_hint=(1, 0.15))
         
@@ -709,6 +819,8 @@ class AddCardScreen(Screen):
         deck = self.manager_ref.current_deck
         if deck:
             self.deck_label.text = f"Liste: {deck['name']}"
+        self.confirmed_question = None
+        self.warning_label.text = ''
     
     def update_rect(self, instance, value):
         self.rect.pos = instance.pos
@@ -719,7 +831,20 @@ class AddCardScreen(Screen):
         answer = self.answer_input.text.strip()
         
         if question and answer:
+            # Warn once about a duplicate; pressing again saves anyway. No
+            # warning until the index is built, see finish_startup()
+            if question != self.confirmed_question and self.manager_ref.duplicates_ready():
+                exact, similar = self.manager_ref.find_duplicates(question)
+                if exact:
+                    self.warning_label.text = f"Déjà présente dans « {exact[0][0]} ». Appuyez à nouveau pour sauvegarder."
+                elif similar:
+                    self.warning_label.text = f"Question similaire : « {similar[0][:40]} ». Appuyez à nouveau pour sauvegarder."
+                if exact or similar:
+                    self.confirmed_question = question
+                    return
             self.manager_ref.add_card(question, answer)
+            self.confirmed_question = None
+            self.warning_label.text = ''
             self.question_input.text = ''
             self.answer_input.text = ''
             self.manager.transition = SlideTransition(direction='right')
@@ -734,14 +859,14 @@ class EditCardScreen(Screen):
     def __init__(self, manager_ref, **kwargs):
         super().__init__(**kwargs)
         self.manager_ref = manager_ref
-        self.card_index = None
+        self.card_id = None
         
         # Main layout
         main_layout = BoxLayout(orientation='vertical', padding=dp(20), spacing=dp(15))
         
         # Set background
         with main_layout.canvas.before:
-            Color(*get_color_from_hex('#ECEFF1'))
+            Color(*COLORS['background'])
             self.rect = Rectangle(size=Window.size, pos=main_layout.pos)
         main_layout.bind(pos=self.update_rect, size=self.update_rect)
         
@@ -801,9 +926,9 @@ class EditCardScreen(Screen):
         if deck:
             self.deck_label.text = f"Liste: {deck['name']}"
         
-        # Load card data if index is set
-        if self.card_index is not None:
-            card = self.manager_ref.cards[self.card_index]
+        # Load card data if a card is set
+        card = self.manager_ref.get_card_by_id(self.card_id) if self.card_id is not None else None
+        if card:
             self.question_input.text = card.question
             self.answer_input.text = card.answer
     
@@ -815,8 +940,9 @@ class EditCardScreen(Screen):
         question = self.question_input.text.strip()
         answer = self.answer_input.text.strip()
         
-        if question and answer and self.card_index is not None:
-            self.manager_ref.edit_card(self.card_index, question, answer)
+        if question and answer and self.card_id is not None:
+            self.manager_ref.edit_card_by_id(self.card_id, question, answer)
+            self.manager.get_screen('manage').update_row(self.card_id)
             self.manager.transition = SlideTransition(direction='right')
             self.manager.current = 'manage'
     
@@ -829,13 +955,15 @@ class ManageCardsScreen(Screen):
     def __init__(self, manager_ref, **kwargs):
         super().__init__(**kwargs)
         self.manager_ref = manager_ref
+        # True while the list shows search results
+        self.filtered = False
         
         # Main layout
         main_layout = BoxLayout(orientation='vertical', padding=dp(20), spacing=dp(15))
         
         # Set background
         with main_layout.canvas.before:
-            Color(*get_color_from_hex('#ECEFF1'))
+            Color(*COLORS['background'])
             self.rect = Rectangle(size=Window.size, pos=main_layout.pos)
         main_layout.bind(pos=self.update_rect, size=self.update_rect)
         
@@ -853,18 +981,82 @@ class ManageCardsScreen(Screen):
         
         main_layout.add_widget(title_layout)
         
-        # Scroll view for cards
-        scroll = ScrollView(size_hint=(1, 0.8))
-        self.cards_layout = GridLayout(cols=1, spacing=dp(10), size_hint_y=None)
-        self.cards_layout.bind(minimum_height=self.cards_layout.setter('height'))
-        scroll.add_widget(self.cards_layout)
-        main_layout.add_widget(scroll)
+        # Search
+        self.search_input = StyledTextInput(
+            hint_text='Rechercher...',
+            size_hint=(1, 0.08),
+            multiline=False
+        )
+        self.search_input.bind(text=lambda instance, value: self.refresh_list())
+        main_layout.add_widget(self.search_input)
+        
+        # Recycled list: only the visible rows exist as widgets
+        self.list_container = BoxLayout(size_hint=(1, 0.72))
+        self.cards_view = RecycleView()
+        self.cards_view.viewclass = CardWidget
+        self.cards_view.cards = []
+        self.cards_view.find_card = self.manager_ref.get_card_by_id
+        self.cards_view.edit_callback = self.edit_card
+        self.cards_view.delete_callback = self.delete_card
+        self.cards_view.selected = None
+        self.cards_view.selection_callback = self.update_selection
+        cards_layout = RecycleBoxLayout(
+            orientation='vertical',
+            spacing=dp(10),
+            default_size=(None, dp(120)),
+            default_size_hint=(1, None),
+            size_hint_y=None
+        )
+        cards_layout.bind(minimum_height=cards_layout.setter('height'))
+        self.cards_view.add_widget(cards_layout)
         
-        # Back button
-        back_btn = SecondaryButton(text='Retour', size_hint=(1, 0.1))
+        self.no_cards_label = StyledLabel(
+            text='Aucune carte dans cette liste.\nAjoutez des cartes pour commencer !',
+            font_size=dp(18)
+        )
+        main_layout.add_widget(self.list_container)
+        
+        # Buttons
+        self.button_layout = BoxLayout(spacing=dp(10), size_hint=(1, 0.1))
+        
+        back_btn = SecondaryButton(text='Retour')
         back_btn.bind(on_press=self.go_home)
-        main_layout.add_widget(back_btn)
+        self.button_layout.add_widget(back_btn)
+        
+        self.undo_btn = SecondaryButton(text='Annuler')
+        self.undo_btn.bind(on_press=self.undo)
+        self.button_layout.add_widget(self.undo_btn)
+        
+        self.redo_btn = SecondaryButton(text='Rétablir')
+        self.redo_btn.bind(on_press=self.redo)
+        self.button_layout.add_widget(self.redo_btn)
+        
+        select_btn = PrimaryButton(text='Sélection')
+        select_btn.bind(on_press=lambda x: self.set_selecting(True))
+        self.button_layout.add_widget(select_btn)
+        
+        main_layout.add_widget(self.button_layout)
+        
+        # Replaces the buttons above in selection mode
+        self.selection_layout = BoxLayout(spacing=dp(10), size_hint=(1, 0.1))
+        
+        done_btn = SecondaryButton(text='Terminer')
+        done_btn.bind(on_press=lambda x: self.set_selecting(False))
+        self.selection_layout.add_widget(done_btn)
+        
+        self.delete_selected_btn = DangerButton(text='Supprimer')
+        self.delete_selected_btn.bind(on_press=self.delete_selected)
+        self.selection_layout.add_widget(self.delete_selected_btn)
         
+        move_btn = PrimaryButton(text='Déplacer')
+        move_btn.bind(on_press=self.choose_move_target)
+        self.selection_layout.add_widget(move_btn)
+        
+        split_btn = SuccessButton(text='Nouvelle liste')
+        split_btn.bind(on_press=self.choose_split_name)
+        self.selection_layout.add_widget(split_btn)
+        
+        self.main_layout = main_layout
         self.add_widget(main_layout)
     
     def on_enter(self):
@@ -879,34 +1071,156 @@ class ManageCardsScreen(Screen):
         self.rect.size = instance.size
     
     def refresh_list(self):
-        self.cards_layout.clear_widgets()
-        self.cards_layout.height = 0
-        
         cards = self.manager_ref.cards
-        if not cards:
-            no_cards_label = StyledLabel(
-                text='Aucune carte dans cette liste.\nAjoutez des cartes pour commencer !',
-                font_size=dp(18)
-            )
-            self.cards_layout.add_widget(no_cards_label)
-            return
-        
-        for i, card in enumerate(cards):
-            card_widget = CardWidget(card, i, self.edit_card, self.delete_card)
-            self.cards_layout.add_widget(card_widget)
-            self.cards_layout.height += card_widget.height + dp(10)
+        rows = self.cards_view.data
+        query = self.search_input.text.strip()
+        
+        if query:
+            # Matches come from the deck's search index, not a scan
+            self.filtered = True
+            self.cards_view.cards = cards
+            ids = cards.columns['id']
+            self.cards_view.data = [{'card_id': ids[i]} for i in self.manager_ref.search_cards(query)]
+        elif self.filtered or cards is not self.cards_view.cards:
+            self.filtered = False
+            # Rows carry no data: CardWidget reads the card at its index
+            self.cards_view.cards = cards
+            self.cards_view.data = [{} for _ in range(len(cards))]
+        elif len(rows) < len(cards):
+            # Cards were added since the list was shown
+            rows.extend({} for _ in range(len(cards) - len(rows)))
+        elif len(rows) > len(cards):
+            # Cards were removed, e.g. by undo or a sync, from anywhere in
+            # the deck, so the rows left are rebound too
+            del rows[len(cards):]
+            self.cards_view.refresh_from_data()
+        self.show_empty_state(not cards)
+        self.undo_btn.disabled = not self.manager_ref.undo_stack
+        self.redo_btn.disabled = not self.manager_ref.redo_stack
+    
+    def show_empty_state(self, empty):
+        widget = self.no_cards_label if empty else self.cards_view
+        if widget.parent is None:
+            self.list_container.clear_widgets()
+            self.list_container.add_widget(widget)
+    
+    def row_index(self, card_id):
+        # Search result rows name their card; other rows follow the deck
+        if not self.filtered:
+            return self.manager_ref.card_index(card_id)
+        for i, row in enumerate(self.cards_view.data):
+            if row['card_id'] == card_id:
+                return i
+        return None
+    
+    def update_row(self, card_id):
+        # Rebind just the edited row
+        row = self.row_index(card_id)
+        if row is not None and row < len(self.cards_view.data):
+            self.cards_view.data[row] = self.cards_view.data[row].copy()
     
-    def edit_card(self, index):
+    def edit_card(self, card_id):
         edit_screen = self.manager.get_screen('edit_card')
-        edit_screen.card_index = index
+        edit_screen.card_id = card_id
         self.manager.transition = SlideTransition(direction='left')
         self.manager.current = 'edit_card'
     
-    def delete_card(self, index):
-        self.manager_ref.delete_card(index)
-        self.refresh_list()
+    def delete_card(self, card_id):
+        # Only the deleted row goes; the others still name their cards
+        row = self.row_index(card_id)
+        self.manager_ref.delete_card_by_id(card_id)
+        if row is not None:
+            self.cards_view.data.pop(row)
+        self.show_empty_state(not self.manager_ref.cards)
+        self.undo_btn.disabled = False
+        self.redo_btn.disabled = True
+    
+    def undo(self, instance):
+        if self.manager_ref.undo():
+            self.reload()
+    
+    def redo(self, instance):
+        if self.manager_ref.redo():
+            self.reload()
+    
+    def reload(self):
+        # Cards may have come back anywhere in the deck, so every row is
+        # rebound
+        self.cards_view.cards = None
+        self.on_enter()
+    
+    def set_selecting(self, selecting, refresh=True):
+        self.cards_view.selected = set() if selecting else None
+        old, new = (self.button_layout, self.selection_layout) if selecting else (self.selection_layout, self.button_layout)
+        if old.parent is not None:
+            self.main_layout.remove_widget(old)
+            self.main_layout.add_widget(new)
+        self.update_selection()
+        if refresh:
+            self.cards_view.refresh_from_data()
+    
+    def update_selection(self):
+        count = len(self.cards_view.selected or ())
+        self.delete_selected_btn.text = f'Supprimer ({count})'
+    
+    def finish_batch(self):
+        # The list is rebuilt once for the whole batch
+        self.set_selecting(False, refresh=False)
+        self.reload()
+    
+    def selected_positions(self):
+        positions = (self.manager_ref.card_index(card_id) for card_id in self.cards_view.selected)
+        return [i for i in positions if i is not None]
+    
+    def delete_selected(self, instance):
+        if self.cards_view.selected:
+            self.manager_ref.delete_many(self.selected_positions())
+            self.finish_batch()
+    
+    def choose_move_target(self, instance):
+        if not self.cards_view.selected:
+            return
+        content = BoxLayout(orientation='vertical', spacing=dp(10), size_hint_y=None)
+        content.bind(minimum_height=content.setter('height'))
+        popup = Popup(title='Déplacer vers la liste', size_hint=(0.9, 0.8))
+        for index, deck in enumerate(self.manager_ref.decks):
+            if index == self.manager_ref.current_deck_index:
+                continue
+            btn = PrimaryButton(text=deck['name'], size_hint_y=None, height=dp(50))
+            btn.bind(on_press=lambda x, target=index: self.move_selected(target, popup))
+            content.add_widget(btn)
+        scroll = ScrollView()
+        scroll.add_widget(content)
+        popup.content = scroll
+        popup.open()
+    
+    def move_selected(self, target, popup):
+        popup.dismiss()
+        self.manager_ref.move_cards_between_decks(self.manager_ref.current_deck_index, self.selected_positions(), target)
+        self.finish_batch()
+    
+    def choose_split_name(self, instance):
+        if not self.cards_view.selected:
+            return
+        content = BoxLayout(orientation='vertical', spacing=dp(10))
+        name_input = StyledTextInput(hint_text='Nom de la nouvelle liste...', multiline=False, size_hint_y=0.5)
+        content.add_widget(name_input)
+        ok_btn = SuccessButton(text='Créer', size_hint_y=0.5)
+        content.add_widget(ok_btn)
+        popup = Popup(title='Nouvelle liste avec la sélection', content=content, size_hint=(0.9, 0.4))
+        ok_btn.bind(on_press=lambda x: self.split_selected(name_input.text.strip(), popup))
+        popup.open()
+    
+    def split_selected(self, name, popup):
+        if not name:
+            return
+        popup.dismiss()
+        self.manager_ref.split_deck(self.manager_ref.current_deck_index, self.selected_positions(), name)
+        self.finish_batch()
     
     def go_home(self, instance):
+        if self.cards_view.selected is not None:
+            self.set_selecting(False, refresh=False)
         self.manager.transition = SlideTransition(direction='right')
         self.manager.current = 'home'
 
@@ -915,14 +1229,14 @@ class EditDeckScreen(Screen):
     def __init__(self, manager_ref, **kwargs):
         super().__init__(**kwargs)
         self.manager_ref = manager_ref
-        self.deck_index = None
+        self.deck_id = None
         
         # Main layout
         main_layout = BoxLayout(orientation='vertical', padding=dp(20), spacing=dp(15))
         
         # Set background
         with main_layout.canvas.before:
-            Color(*get_color_from_hex('#ECEFF1'))
+            Color(*COLORS['background'])
             self.rect = Rectangle(size=Window.size, pos=main_layout.pos)
         main_layout.bind(pos=self.update_rect, size=self.update_rect)
         
@@ -968,11 +1282,11 @@ class EditDeckScreen(Screen):
         self.add_widget(main_layout)
     
     def on_enter(self):
-        # Load deck data if index is set
-        if self.deck_index is not None:
-            deck = self.manager_ref.decks[self.deck_index]
+        # Load deck data if a deck is set
+        deck = self.manager_ref.decks_by_id.get(self.deck_id)
+        if deck:
             self.deck_name_input.text = deck['name']
-            card_count = len(deck['cards'])
+            card_count = deck['count']
             self.card_count_label.text = f"{card_count} carte{'s' if card_count != 1 else ''} dans cette liste"
     
     def update_rect(self, instance, value):
@@ -982,8 +1296,9 @@ class EditDeckScreen(Screen):
     def update_deck(self, instance):
         name = self.deck_name_input.text.strip()
         
-        if name and self.deck_index is not None:
-            self.manager_ref.edit_deck(self.deck_index, name)
+        index = self.manager_ref.deck_index(self.deck_id)
+        if name and index is not None:
+            self.manager_ref.edit_deck(index, name)
             self.manager.transition = SlideTransition(direction='right')
             self.manager.current = 'decks'
     
@@ -1002,7 +1317,7 @@ class DecksScreen(Screen):
         
         # Set background
         with main_layout.canvas.before:
-            Color(*get_color_from_hex('#ECEFF1'))
+            Color(*COLORS['background'])
             self.rect = Rectangle(size=Window.size, pos=main_layout.pos)
         main_layout.bind(pos=self.update_rect, size=self.update_rect)
         
@@ -1026,40 +1341,106 @@ class DecksScreen(Screen):
         
         main_layout.add_widget(add_layout)
         
-        # Scroll view for decks
-        scroll = ScrollView(size_hint=(1, 0.7))
-        self.decks_layout = GridLayout(cols=1, spacing=dp(10), size_hint_y=None)
-        self.decks_layout.bind(minimum_height=self.decks_layout.setter('height'))
-        scroll.add_widget(self.decks_layout)
-        main_layout.add_widget(scroll)
+        # Recycled list: only the visible rows exist as widgets
+        self.list_container = BoxLayout(size_hint=(1, 0.7))
+        self.decks_view = RecycleView()
+        self.decks_view.viewclass = DeckWidget
+        self.decks_view.select_callback = self.select_deck
+        self.decks_view.edit_callback = self.edit_deck
+        self.decks_view.delete_callback = self.delete_deck
+        self.decks_view.selected = None
+        self.decks_view.selection_callback = self.update_selection
+        decks_layout = RecycleBoxLayout(
+            orientation='vertical',
+            spacing=dp(10),
+            default_size=(None, dp(140)),
+            default_size_hint=(1, None),
+            size_hint_y=None
+        )
+        decks_layout.bind(minimum_height=decks_layout.setter('height'))
+        self.decks_view.add_widget(decks_layout)
+        
+        self.no_decks_label = StyledLabel(
+            text='Aucune liste.\nCréez une liste pour commencer!',
+            font_size=dp(18)
+        )
+        main_layout.add_widget(self.list_container)
         
-        # Back button
-        back_btn = SecondaryButton(text='Retour', size_hint=(1, 0.1))
+        # Buttons
+        self.button_layout = BoxLayout(spacing=dp(10), size_hint=(1, 0.1))
+        
+        back_btn = SecondaryButton(text='Retour')
         back_btn.bind(on_press=self.go_home)
-        main_layout.add_widget(back_btn)
+        self.button_layout.add_widget(back_btn)
+        
+        self.undo_btn = SecondaryButton(text='Annuler')
+        self.undo_btn.bind(on_press=self.undo)
+        self.button_layout.add_widget(self.undo_btn)
+        
+        self.redo_btn = SecondaryButton(text='Rétablir')
+        self.redo_btn.bind(on_press=self.redo)
+        self.button_layout.add_widget(self.redo_btn)
+        
+        select_btn = PrimaryButton(text='Sélection')
+        select_btn.bind(on_press=lambda x: self.set_selecting(True))
+        self.button_layout.add_widget(select_btn)
+        
+        duplicates_btn = SecondaryButton(text='Doublons')
+        duplicates_btn.bind(on_press=self.show_duplicates)
+        self.button_layout.add_widget(duplicates_btn)
+        
+        import_btn = SecondaryButton(text='Importer')
+        import_btn.bind(on_press=self.choose_import_file)
+        self.button_layout.add_widget(import_btn)
         
+        main_layout.add_widget(self.button_layout)
+        
+        # Replaces the buttons above in selection mode
+        self.selection_layout = BoxLayout(spacing=dp(10), size_hint=(1, 0.1))
+        
+        done_btn = SecondaryButton(text='Terminer')
+        done_btn.bind(on_press=lambda x: self.set_selecting(False))
+        self.selection_layout.add_widget(done_btn)
+        
+        self.merge_btn = PrimaryButton(text='Fusionner')
+        self.merge_btn.bind(on_press=self.merge_selected)
+        self.selection_layout.add_widget(self.merge_btn)
+        
+        self.delete_selected_btn = DangerButton(text='Supprimer')
+        self.delete_selected_btn.bind(on_press=self.delete_selected)
+        self.selection_layout.add_widget(self.delete_selected_btn)
+        
+        self.main_layout = main_layout
         self.add_widget(main_layout)
     
     def update_rect(self, instance, value):
         self.rect.pos = instance.pos
         self.rect.size = instance.size
     
+    def on_enter(self):
+        self.refresh_list()
+    
     def refresh_list(self):
-        self.decks_layout.clear_widgets()
-        self.decks_layout.height = 0
-        
-        if not self.manager_ref.decks:
-            no_decks_label = StyledLabel(
-                text='Aucune liste.\nCréez une liste pour commencer!',
-                font_size=dp(18)
-            )
-            self.decks_layout.add_widget(no_decks_label)
-            return
-        
-        for i, deck in enumerate(self.manager_ref.decks):
-            deck_widget = DeckWidget(deck, i, self.select_deck, self.edit_deck, self.delete_deck)
-            self.decks_layout.add_widget(deck_widget)
-            self.decks_layout.height += deck_widget.height + dp(10)
+        # Diff the rows against the decks so only changed rows are rebound
+        rows = self.decks_view.data
+        decks = self.manager_ref.decks
+        for i, deck in enumerate(decks):
+            row = {'id': deck['id'], 'name': deck['name'], 'count': deck['count']}
+            if i >= len(rows):
+                rows.append(row)
+            elif rows[i] != row:
+                rows[i] = row
+        if len(rows) > len(decks):
+            del rows[len(decks):]
+        self.show_empty_state(not decks)
+        self.undo_btn.disabled = not self.manager_ref.undo_stack
+        self.redo_btn.disabled = not self.manager_ref.redo_stack
+    
+    def show_empty_state(self, empty):
+        widget = self.no_decks_label if empty else self.decks_view
+        if widget.parent is None:
+            self.list_container.clear_widgets()
+            self.list_container.add_widget(widget)
     
     def add_deck(self, instance):
         name = self.deck_name_input.text.strip()
@@ -1068,45 +1449,381 @@ class DecksScreen(Screen):
             self.deck_name_input.text = ''
             self.refresh_list()
     
-    def select_deck(self, index):
-        self.manager_ref.set_current_deck(index)
+    def select_deck(self, deck_id):
+        index = self.manager_ref.deck_index(deck_id)
+        if index is not None:
+            self.manager_ref.set_current_deck(index)
+            # A mounted list whose file was moved or deleted
+            error = self.manager_ref.deck_unavailable(index)
+            if error:
+                self.offer_remove(deck_id, error)
+                return
         self.manager.transition = SlideTransition(direction='right')
         self.manager.current = 'home'
     
-    def edit_deck(self, index):
+    def offer_remove(self, deck_id, error):
+        content = BoxLayout(orientation='vertical', spacing=dp(10))
+        message = StyledLabel(text=f"Le fichier de cette liste est introuvable ou abîmé :\n{error}\n\n"
+                                   "Ses modifications sont gardées jusqu'à son retour.",
+                              font_size=dp(15))
+        message.color = COLORS['white']
+        content.add_widget(message)
+        buttons = BoxLayout(spacing=dp(10), size_hint_y=0.3)
+        keep_btn = SecondaryButton(text='Garder')
+        remove_btn = DangerButton(text='Supprimer la liste')
+        buttons.add_widget(keep_btn)
+        buttons.add_widget(remove_btn)
+        content.add_widget(buttons)
+        popup = Popup(title='Liste indisponible', content=content, size_hint=(0.9, 0.5))
+        keep_btn.bind(on_press=popup.dismiss)
+        remove_btn.bind(on_press=lambda x: self.remove_unavailable(deck_id, popup))
+        popup.open()
+    
+    def remove_unavailable(self, deck_id, popup):
+        popup.dismiss()
+        index = self.manager_ref.deck_index(deck_id)
+        if index is not None:
+            # delete_deck() adds an empty list if this was the last one
+            self.manager_ref.delete_deck(index)
+            self.undo_btn.disabled = False
+            self.redo_btn.disabled = True
+        self.refresh_list()
+    
+    def edit_deck(self, deck_id):
         edit_screen = self.manager.get_screen('edit_deck')
-        edit_screen.deck_index = index
+        edit_screen.deck_id = deck_id
         self.manager.transition = SlideTransition(direction='left')
         self.manager.current = 'edit_deck'
     
-    def delete_deck(self, index):
-        # Don't delete if it's the last deck
-        if len(self.manager_ref.decks) > 1:
+    def delete_deck(self, deck_id):
+        # Don't delete if it's the last deck; only its row goes
+        index = self.manager_ref.deck_index(deck_id)
+        if index is not None and len(self.manager_ref.decks) > 1:
             self.manager_ref.delete_deck(index)
+            self.decks_view.data.pop(index)
+            self.undo_btn.disabled = False
+            self.redo_btn.disabled = True
+    
+    def undo(self, instance):
+        if self.manager_ref.undo():
+            self.refresh_list()
+    
+    def redo(self, instance):
+        if self.manager_ref.redo():
+            self.refresh_list()
+    
+    def set_selecting(self, selecting, refresh=True):
+        self.decks_view.selected = set() if selecting else None
+        old, new = (self.button_layout, self.selection_layout) if selecting else (self.selection_layout, self.button_layout)
+        if old.parent is not None:
+            self.main_layout.remove_widget(old)
+            self.main_layout.add_widget(new)
+        self.update_selection()
+        if refresh:
+            self.decks_view.refresh_from_data()
+    
+    def selected_indices(self):
+        indices = (self.manager_ref.deck_index(deck_id) for deck_id in self.decks_view.selected)
+        return sorted(i for i in indices if i is not None)
+    
+    def update_selection(self):
+        count = len(self.decks_view.selected or ())
+        self.merge_btn.disabled = count < 2
+        # Keep at least one deck
+        self.delete_selected_btn.disabled = not count or count >= len(self.manager_ref.decks)
+        self.delete_selected_btn.text = f'Supprimer ({count})'
+    
+    def merge_selected(self, instance):
+        # Everything goes into the first selected deck in list order
+        if len(self.decks_view.selected or ()) > 1:
+            self.manager_ref.merge_decks(self.selected_indices())
+            self.set_selecting(False, refresh=False)
             self.refresh_list()
     
+    def delete_selected(self, instance):
+        if self.decks_view.selected and len(self.decks_view.selected) < len(self.manager_ref.decks):
+            self.manager_ref.delete_decks(self.selected_indices())
+            self.set_selecting(False, refresh=False)
+            self.refresh_list()
+    
+    def choose_import_file(self, instance):
+        content = BoxLayout(orientation='vertical', spacing=dp(10))
+        chooser = FileChooserListView(
+            path=os.path.expanduser('~'),
+            filters=['*.csv', '*.tsv', '*.txt', '*.bin']
+        )
+        content.add_widget(chooser)
+        
+        popup = Popup(title='Importer des cartes (CSV, TSV, Anki, liste .bin)', content=content, size_hint=(0.95, 0.9))
+        import_btn = PrimaryButton(text='Importer', size_hint=(1, 0.12))
+        import_btn.bind(on_press=lambda x: chooser.selection and self.import_file(chooser.selection[0], popup))
+        content.add_widget(import_btn)
+        popup.open()
+    
+    def import_file(self, path, popup):
+        # Packed .bin lists are mounted in place, read-only
+        if path.endswith('.bin'):
+            try:
+                self.manager_ref.mount_deck(path)
+            except (OSError, ValueError) as e:
+                error_label = StyledLabel(text=f"Erreur : {e}", font_size=dp(16))
+                error_label.color = COLORS['white']
+                popup.content = error_label
+                return
+            popup.dismiss()
+            self.refresh_list()
+            return
+        
+        # The file goes into a new deck named after it
+        name = os.path.splitext(os.path.basename(path))[0]
+        self.manager_ref.add_deck(name)
+        steps = self.manager_ref.import_cards(path, len(self.manager_ref.decks) - 1)
+        
+        progress_label = StyledLabel(text='Importation...', font_size=dp(16))
+        progress_label.color = COLORS['white']
+        popup.content = progress_label
+        popup.title = f'Importation dans « {name} »'
+        # Nothing else may change the decks until the import is done: the
+        # popup stays up and remote changes wait, see run_on_main()
+        popup.auto_dismiss = False
+        App.get_running_app().importing = True
+        Clock.schedule_once(lambda dt: self.import_step(steps, progress_label, popup), 0)
+    
+    def import_step(self, steps, progress_label, popup):
+        # One chunk per frame keeps the UI responsive during long imports
+        try:
+            imported, skipped = next(steps)
+        except StopIteration:
+            self.finish_import(popup)
+            return
+        except (OSError, ValueError, csv.Error) as e:
+            progress_label.text = f"Erreur : {e}"
+            self.finish_import(popup)
+            return
+        progress_label.text = f"Importées : {imported}\nIgnorées : {skipped}"
+        Clock.schedule_once(lambda dt: self.import_step(steps, progress_label, popup), 0)
+    
+    def finish_import(self, popup):
+        popup.auto_dismiss = True
+        App.get_running_app().importing = False
+        self.refresh_list()
+    
+    def show_duplicates(self, instance):
+        if not self.manager_ref.duplicates_ready():
+            # Still being built, see FlashcardApp.finish_startup()
+            message = StyledLabel(text='Recherche des doublons en cours...', font_size=dp(16))
+            message.color = COLORS['white']
+            Popup(title='Doublons', content=message, size_hint=(0.9, 0.3)).open()
+            return
+        groups, near = self.manager_ref.duplicate_report()
+        lines = []
+        if groups:
+            lines.append('Doublons exacts :')
+            for question, decks in groups:
+                where = ', '.join(f"{name} ×{count}" for name, count in decks)
+                lines.append(f"• {question} — {where}")
+        if near:
+            lines.append('Questions similaires :')
+            for question, other, score in near:
+                lines.append(f"• {question}\n   ≈ {other} ({score:.0%})")
+        
+        report_label = StyledLabel(
+            text='\n'.join(lines) or 'Aucun doublon trouvé.',
+            font_size=dp(14),
+            size_hint_y=None,
+            halign='left',
+            valign='top'
+        )
+        report_label.color = COLORS['white']
+        report_label.bind(
+            width=lambda label, width: setattr(label, 'text_size', (width, None)),
+            texture_size=lambda label, size: setattr(label, 'height', size[1])
+        )
+        scroll = ScrollView()
+        scroll.add_widget(report_label)
+        Popup(title='Doublons', content=scroll, size_hint=(0.9, 0.8)).open()
+    
     def go_home(self, instance):
+        if self.decks_view.selected is not None:
+            self.set_selecting(False, refresh=False)
         self.manager.transition = SlideTransition(direction='right')
         self.manager.current = 'home'
 
 
+class LazyScreenManager(ScreenManager):
+    # Screens are built the first time they are looked up, either by
+    # get_screen or by setting current
+    def __init__(self, manager_ref, timeline=None, **kwargs):
+        super().__init__(**kwargs)
+        self.manager_ref = manager_ref
+        self.timeline = timeline
+        self.pending = {}
+    
+    def register(self, name, screen_class):
+        self.pending[name] = screen_class
+    
+    def build_screen(self, name):
+        screen = self.pending.pop(name)(self.manager_ref, name=name)
+        self.add_widget(screen)
+        if self.timeline:
+            self.timeline.mark(f'screen {name}')
+        return screen
+    
+    def get_screen(self, name):
+        if name in self.pending:
+            return self.build_screen(name)
+        return super().get_screen(name)
+    
+    def has_screen(self, name):
+        return name in self.pending or super().has_screen(name)
+
+
 class FlashcardApp(App):
+    # 'json' keeps flashcards.json; 'sqlite' and 'binary' migrate it once
+    # into flashcards.db or flashcards.bin
+    storage_backend = 'json'
+    # Seconds edits are collected before the writer thread persists them
+    save_delay = 0.5
+    # Build the remaining screens one per frame once the first frame is up
+    prewarm_screens = True
+    # '1' prints the startup timeline, anything else is a file to write it to
+    startup_trace = os.environ.get('FLASHCARDS_STARTUP_TRACE')
+    # Sync server to trade changes with, e.g. one started with python -m
+    # flashcards serve; unset keeps the library on this device
+    sync_url = os.environ.get('FLASHCARDS_SYNC_URL')
+    
     def build(self):
         self.title = 'Flashcard Master'
         self.icon = 'icon.png'
-        self.card_manager = FlashCardManager()
-        
-        sm = ScreenManager()
-        sm.add_widget(HomeScreen(self.card_manager, name='home'))
-        sm.add_widget(StudyScreen(self.card_manager, name='study'))
-        sm.add_widget(AddCardScreen(self.card_manager, name='add'))
-        sm.add_widget(ManageCardsScreen(self.card_manager, name='manage'))
-        sm.add_widget(DecksScreen(self.card_manager, name='decks'))
-        sm.add_widget(EditCardScreen(self.card_manager, name='edit_card'))
-        sm.add_widget(EditDeckScreen(self.card_manager, name='edit_deck'))
-        
+        if self.storage_backend == 'sqlite':
+            storage = SqliteStorage()
+        elif self.storage_backend == 'binary':
+            storage = BinaryStorage()
+        else:
+            storage = JsonStorage()
+        self.card_manager = FlashCardManager(WriteBehindStorage(storage, self.save_delay))
+        startup.mark('load_decks')
+        self.sync_client = None
+        self.syncing = False
+        # Set while DecksScreen imports a file, one chunk per frame
+        self.importing = False
+        if self.sync_url:
+            from flashcards.sync import HttpTransport, SyncClient
+            self.sync_client = SyncClient(self.card_manager, HttpTransport(self.sync_url, timeout=10))
+        
+        sm = LazyScreenManager(self.card_manager, timeline=startup)
+        sm.register('home', HomeScreen)
+        sm.register('study', StudyScreen)
+        sm.register('add', AddCardScreen)
+        sm.register('manage', ManageCardsScreen)
+        sm.register('decks', DecksScreen)
+        sm.register('edit_card', EditCardScreen)
+        sm.register('edit_deck', EditDeckScreen)
+        sm.build_screen('home')
+        
+        Window.bind(on_flip=self.on_first_frame)
         return sm
+    
+    def on_first_frame(self, window):
+        window.unbind(on_flip=self.on_first_frame)
+        startup.mark('first frame')
+        if self.prewarm_screens:
+            Clock.schedule_once(self.prewarm_step, 0)
+        else:
+            self.finish_startup()
+    
+    def prewarm_step(self, dt):
+        sm = self.root
+        if sm.pending:
+            sm.build_screen(next(iter(sm.pending)))
+            Clock.schedule_once(self.prewarm_step, 0)
+        else:
+            self.finish_startup()
+    
+    def finish_startup(self):
+        if self.startup_trace == '1':
+            startup.report()
+        elif self.startup_trace:
+            startup.report(self.startup_trace)
+        # Review statistics need numpy, so they load after the first frame
+        from flashcards.analytics import ReviewStats
+        self.card_manager.reviews = ReviewStats()
+        if self.root.current == 'home':
+            self.root.current_screen.update_info()
+        # Reading every deck for the duplicate index would stall the first
+        # save; a worker builds it and reads one deck per frame
+        threading.Thread(target=self.card_manager.build_duplicates, args=(self.run_on_main,), daemon=True).start()
+        self.sync()
+    
+    def sync(self):
+        # Requests run on a worker thread so the UI never waits on the
+        # network; the steps that touch the library come back to this one
+        if self.sync_client is None or self.syncing:
+            return
+        self.syncing = True
+        threading.Thread(target=self.run_sync, daemon=True).start()
+    
+    def run_sync(self):
+        # Without a connection changes just wait for the next sync
+        try:
+            pulled, pushed = self.sync_client.sync(self.run_on_main)
+        except (OSError, ValueError) as e:
+            print(f"Sync failed: {e}")
+            pulled = 0
+        Clock.schedule_once(lambda dt: self.sync_done(pulled))
+    
+    def sync_done(self, pulled):
+        self.syncing = False
+        if pulled:
+            self.root.current_screen.dispatch('on_enter')
+    
+    def run_on_main(self, step):
+        # Calls step on the Kivy thread at its next frame and waits for it
+        done = threading.Event()
+        outcome = {}
+        
+        def call(dt):
+            # Remote changes would move the decks an import is filling
+            if self.importing:
+                Clock.schedule_once(call, 0.1)
+                return
+            try:
+                outcome['result'] = step()
+            except Exception as e:
+                outcome['error'] = e
+            finally:
+                done.set()
+        
+        Clock.schedule_once(call)
+        done.wait()
+        if 'error' in outcome:
+            raise outcome['error']
+        return outcome.get('result')
+    
+    def send_changes(self):
+        try:
+            self.sync_client.send()
+        except (OSError, ValueError) as e:
+            print(f"Sync failed: {e}")
+    
+    def on_pause(self):
+        # Push what changed while the app is in the background; pulling
+        # waits for the app to come back. Only what is still queued is
+        # written: the journal holds every change, so no snapshot is needed
+        if self.sync_client is not None:
+            threading.Thread(target=self.send_changes, daemon=True).start()
+        self.card_manager.flush()
+        if self.card_manager.reviews is not None:
+            self.card_manager.reviews.save()
+        return True
+    
+    def on_resume(self):
+        self.sync()
+    
+    def on_stop(self):
+        self.card_manager.save_decks()
+        self.card_manager.storage.close()
 
 
 if __name__ == '__main__':
-    FlashcardApp().run()
\ No newline at end of file
+    FlashcardApp().run()
@@ -0,0 +1,29 @@
+import os
+
+from flashcards import FlashCardManager, JsonStorage
+from flashcards.__main__ import main
+
+
+def test_export_of_missing_library_fails(tmp_path, capsys):
+    data_file = str(tmp_path / 'nothere.json')
+    output = str(tmp_path / 'out.csv')
+    assert main(['export', output, '--data-file', data_file]) == 1
+    assert main(['stats', '--data-file', data_file, '--reviews', str(tmp_path / 'r')]) == 1
+    assert main(['export', output, '--sqlite', str(tmp_path / 'no.db'), '--data-file', data_file]) == 1
+    assert os.listdir(tmp_path) == []
+    assert 'No library found' in capsys.readouterr().err
+
+
+def test_export_reads_without_writing(tmp_path):
+    data_file = str(tmp_path / 'lib.json')
+    storage = JsonStorage(data_file, str(tmp_path / 'lib.journal'), str(tmp_path / 'lib.index.json'))
+    manager = FlashCardManager(storage)
+    manager.add_card('question', 'answer')
+    manager.add_deck('Vide')
+    # Still only in the journal, which export must not fold in
+    before = sorted(os.listdir(tmp_path))
+    output = str(tmp_path / 'out.jsonl')
+    assert main(['export', output, '--format', 'jsonl', '--data-file', data_file]) == 0
+    assert sorted(os.listdir(tmp_path)) == sorted(before + ['out.jsonl'])
+    with open(output, encoding='utf-8') as f:
+        assert len(f.readlines()) == 1
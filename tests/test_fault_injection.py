@@ -0,0 +1,175 @@
+import os
+import random
+import shutil
+import signal
+import subprocess
+import sys
+import time
+
+import pytest
+
+from flashcards import BinaryStorage, FlashCardManager, JsonStorage
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs of each harness; raise it to hunt for rare interleavings
+RUNS = int(os.environ.get('FLASHCARDS_FAULT_RUNS', '10'))
+
+# Child process editing a library until it is killed; it prints the number
+# of every step once commit() has returned
+WRITER = '''
+import random, sys
+from pathlib import Path
+from flashcards import FlashCardManager
+from tests.test_fault_injection import make_storage, run_step
+path, backend, seed = sys.argv[1:]
+storage = make_storage(Path(path), backend)
+storage.journal_limit = 7
+manager = FlashCardManager(storage)
+rng = random.Random(int(seed))
+step = 0
+while True:
+    run_step(manager, rng, step)
+    print(step, flush=True)
+    step += 1
+'''
+
+
+DATA_FILES = {'json': 'f.json', 'binary': 'f.bin'}
+
+
+def make_storage(path, backend):
+    if backend == 'binary':
+        return BinaryStorage(str(path / 'f.bin'), str(path / 'f.bin.journal'),
+                             str(path / 'f.json'), str(path / 'f.journal'))
+    return JsonStorage(str(path / 'f.json'), str(path / 'f.journal'), str(path / 'f.index.json'))
+
+
+def open_library(path, backend):
+    return FlashCardManager(make_storage(path, backend))
+
+
+def deck_rows(manager):
+    return [[(card.question, card.answer) for card in manager.deck_cards(i)] for i in range(len(manager.decks))]
+
+
+def run_step(manager, rng, step):
+    # The same steps drive the library and the in-memory model below
+    count = len(manager.deck_cards(0))
+    choice = rng.random()
+    if choice < 0.2 or count < 3:
+        manager.add_card(f'q{step}', 'a')
+    elif choice < 0.3:
+        manager.delete_card(rng.randrange(count))
+    else:
+        index = rng.randrange(count)
+        manager.edit_card(index, manager.deck_cards(0)[index].question, f'a{step}')
+
+
+def model_states(seed, steps):
+    # Card rows of deck 0 after each step, replaying run_step on a model
+    class Card:
+        def __init__(self, question, answer):
+            self.question = question
+            self.answer = answer
+    
+    class Model:
+        def __init__(self):
+            self.rows = []
+        
+        def deck_cards(self, index):
+            return [Card(q, a) for q, a in self.rows]
+        
+        def add_card(self, question, answer):
+            self.rows.append((question, answer))
+        
+        def delete_card(self, index):
+            del self.rows[index]
+        
+        def edit_card(self, index, question, answer):
+            self.rows[index] = (question, answer)
+    
+    model = Model()
+    rng = random.Random(seed)
+    states = [list(model.rows)]
+    for step in range(steps):
+        run_step(model, rng, step)
+        states.append(list(model.rows))
+    return states
+
+
+@pytest.mark.skipif(not hasattr(signal, 'SIGKILL'), reason='needs SIGKILL')
+@pytest.mark.parametrize('backend', ['json', 'binary'])
+def test_sigkill_keeps_every_committed_step(tmp_path, backend):
+    rng = random.Random(11)
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    for run in range(RUNS):
+        path = tmp_path / str(run)
+        path.mkdir()
+        seed = rng.randrange(1 << 30)
+        child = subprocess.Popen(
+            [sys.executable, '-c', WRITER, str(path), backend, str(seed)],
+            cwd=str(path), env=env, stdout=subprocess.PIPE, text=True)
+        time.sleep(rng.uniform(0.3, 1.0))
+        child.send_signal(signal.SIGKILL)
+        output, _ = child.communicate()
+        done = len(output.split())
+        
+        # Every step reported as committed survives; the one in flight may
+        # or may not, but nothing in between is torn
+        states = model_states(seed, done + 1)
+        manager = open_library(path, backend)
+        # Only the default deck: the kill came before the first step
+        rows = deck_rows(manager)[0]
+        assert rows in (states[done], states[done + 1]), f'run {run}, seed {seed}, {done} steps'
+
+
+def build_library(path, backend):
+    # Three decks rewritten through several compactions, so backups and
+    # rotated journals exist, plus journal records after the last one
+    rng = random.Random(5)
+    path.mkdir()
+    storage = make_storage(path, backend)
+    storage.journal_limit = 12
+    manager = FlashCardManager(storage)
+    manager.add_deck('B')
+    manager.add_deck('C')
+    for step in range(60):
+        manager.set_current_deck(step % 3)
+        if step < 30 or not manager.cards:
+            manager.add_card(f'q{step}', f'a{step}')
+        else:
+            index = rng.randrange(len(manager.cards))
+            manager.edit_card(index, manager.cards[index].question, f'e{step}')
+    rows = deck_rows(manager)
+    manager.storage.close()
+    return rows
+
+
+def damage(path, backend, rng):
+    # Truncates the snapshot or flips one of its bytes, with or without its
+    # index left in place
+    data_file = path / DATA_FILES[backend]
+    data = bytearray(data_file.read_bytes())
+    if rng.random() < 0.5:
+        del data[rng.randrange(len(data)):]
+    else:
+        data[rng.randrange(len(data))] ^= 1 << rng.randrange(8)
+    data_file.write_bytes(bytes(data))
+    if backend == 'json' and rng.random() < 0.3:
+        os.remove(path / 'f.index.json')
+
+
+@pytest.mark.parametrize('backend', ['json', 'binary'])
+def test_damaged_snapshot_recovers_from_backups(tmp_path, backend):
+    expected = build_library(tmp_path / 'library', backend)
+    rng = random.Random(3)
+    for run in range(RUNS * 3):
+        path = tmp_path / str(run)
+        shutil.copytree(tmp_path / 'library', path)
+        damage(path, backend, rng)
+        for _ in range(2):
+            # The recovered library was saved whole, so it opens cleanly again
+            manager = open_library(path, backend)
+            assert deck_rows(manager) == expected, f'run {run}'
+            manager.storage.close()
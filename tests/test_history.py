@@ -0,0 +1,268 @@
+import os
+import random
+import threading
+
+import pytest
+
+from flashcards import BinaryStorage, FlashCardManager, JsonStorage, SqliteStorage, WriteBehindStorage
+from flashcards.cards import REVIEW_FIELDS, new_id
+from flashcards.sync import LocalTransport, SyncClient, SyncServer
+
+# Steps of each random run; raise it to hunt for rare sequences
+STEPS = int(os.environ.get('FLASHCARDS_HISTORY_STEPS', '300'))
+
+WORDS = ['maison', 'été', 'château', 'forêt', 'cœur', 'élève', 'fenêtre', 'garçon']
+
+
+def make_storage(path, backend):
+    if backend == 'binary':
+        return BinaryStorage(str(path / 'f.bin'), str(path / 'f.bin.journal'),
+                             str(path / 'none.json'), str(path / 'none.journal'))
+    if backend == 'sqlite':
+        return SqliteStorage(str(path / 'f.db'), str(path / 'none.json'), str(path / 'none.journal'))
+    storage = JsonStorage(str(path / 'f.json'), str(path / 'f.journal'), str(path / 'f.index.json'))
+    if backend == 'write-behind':
+        return WriteBehindStorage(storage, delay=0.001)
+    return storage
+
+
+def open_library(path, backend):
+    manager = FlashCardManager(make_storage(path, backend))
+    # Small enough that compactions, and reading back unloaded decks, happen
+    manager.max_loaded_decks = 2
+    inner = getattr(manager.storage, 'storage', manager.storage)
+    if hasattr(inner, 'journal_limit'):
+        inner.journal_limit = 25
+    return manager
+
+
+def state(manager):
+    # Every deck with every card, ids and review state included
+    return [(deck['id'], deck['name'], [tuple(row) for row in manager.deck_cards(i).rows(range(deck['count']))])
+            for i, deck in enumerate(manager.decks)]
+
+
+def text(rng):
+    return ' '.join(rng.choices(WORDS, k=rng.randint(1, 3)))
+
+
+def random_positions(rng, count):
+    return rng.sample(range(count), rng.randint(1, min(count, 6)))
+
+
+def random_op(manager, rng):
+    # One single or bulk change of a random deck, always a valid one
+    decks = manager.decks
+    index = rng.randrange(len(decks))
+    count = decks[index]['count']
+    choice = rng.randrange(13)
+    if choice == 0 or (count == 0 and choice < 8):
+        manager.commit({'op': 'add_card', 'deck': index, 'question': text(rng), 'answer': text(rng), 'id': new_id()})
+    elif choice == 1:
+        rows = [[text(rng), text(rng)] for _ in range(rng.randint(1, 8))]
+        manager.commit({'op': 'add_cards', 'deck': index, 'cards': rows, 'ids': [new_id() for _ in rows]})
+    elif choice == 2:
+        manager.commit({'op': 'edit_card', 'deck': index, 'card': rng.randrange(count),
+                        'question': text(rng), 'answer': text(rng)})
+    elif choice == 3:
+        review = {'due': rng.random() * 1e9, 'interval': rng.random() * 30, 'ease': 2.5, 'reps': rng.randint(0, 9)}
+        manager.commit(dict({'op': 'review_card', 'deck': index, 'card': rng.randrange(count)}, **review))
+    elif choice == 4:
+        manager.commit({'op': 'delete_card', 'deck': index, 'card': rng.randrange(count)})
+    elif choice == 5:
+        manager.delete_many(random_positions(rng, count), index)
+    elif choice == 6 and len(decks) > 1:
+        target = rng.choice([i for i in range(len(decks)) if i != index])
+        manager.move_cards_between_decks(index, random_positions(rng, count), target)
+    elif choice == 7:
+        manager.split_deck(index, random_positions(rng, count), text(rng))
+    elif choice == 8:
+        manager.add_deck(text(rng))
+    elif choice == 9:
+        manager.edit_deck(index, text(rng))
+    elif choice == 10 and len(decks) > 1:
+        manager.merge_decks(rng.sample(range(len(decks)), 2))
+    elif choice == 11:
+        manager.set_current_deck(index)
+    else:
+        manager.delete_deck(index)
+
+
+@pytest.mark.parametrize('backend', ['json', 'binary', 'sqlite', 'write-behind'])
+def test_random_undo_redo_and_reopen(tmp_path, backend):
+    rng = random.Random(backend)
+    manager = open_library(tmp_path, backend)
+    # State before every step still on the undo stack, and after every
+    # step on the redo stack
+    undone = []
+    redone = []
+    for step in range(STEPS):
+        action = rng.random()
+        before = state(manager)
+        if action < 0.6:
+            newest = manager.undo_stack[-1] if manager.undo_stack else None
+            random_op(manager, rng)
+            if manager.undo_stack and manager.undo_stack[-1] is not newest:
+                undone.append(before)
+                redone.clear()
+        elif action < 0.78:
+            assert manager.undo() == bool(undone)
+            if undone:
+                assert state(manager) == undone.pop(), f'undo at step {step}'
+                redone.append(before)
+        elif action < 0.96:
+            assert manager.redo() == bool(redone)
+            if redone:
+                assert state(manager) == redone.pop(), f'redo at step {step}'
+                undone.append(before)
+        else:
+            # History is per session; what was written must read back whole
+            manager.flush()
+            manager.storage.close()
+            current = manager.current_deck['id']
+            manager = open_library(tmp_path, backend)
+            assert state(manager) == before, f'reopen at step {step}'
+            assert manager.current_deck['id'] == current, f'reopen at step {step}'
+            undone.clear()
+            redone.clear()
+        # The oldest steps are dropped once history is full
+        del undone[:len(undone) - len(manager.undo_stack)]
+        del redone[:len(redone) - len(manager.redo_stack)]
+    manager.storage.close()
+
+
+@pytest.mark.parametrize('backend', ['json', 'sqlite'])
+def test_current_deck_follows_its_deck(tmp_path, backend):
+    manager = open_library(tmp_path, backend)
+    for name in 'BCD':
+        manager.add_deck(name)
+    manager.set_current_deck(2)
+    manager.delete_deck(0)
+    assert manager.current_deck['name'] == 'C'
+    manager.undo()
+    assert manager.current_deck['name'] == 'C'
+    # Deleting the current deck selects the next; undo selects it again
+    manager.delete_deck(2)
+    assert manager.current_deck['name'] == 'D'
+    manager.undo()
+    assert manager.current_deck['name'] == 'C'
+    manager.redo()
+    # Merging selects the merged deck in the same step and write
+    writes = []
+    write_many = manager.storage.write_many
+    manager.storage.write_many = lambda records: writes.append(list(records)) or write_many(records)
+    manager.merge_decks([2, 0])
+    assert manager.current_deck['name'] == 'D'
+    assert len(writes) == 1 and writes[0][-1] == {'op': 'select_deck', 'deck': 1}
+    manager.undo()
+    assert [deck['name'] for deck in manager.decks] == ['Mes Cartes', 'B', 'D']
+    assert manager.current_deck['name'] == 'D'
+    manager.redo()
+    manager.storage.close()
+    manager = open_library(tmp_path, backend)
+    assert [deck['name'] for deck in manager.decks] == ['B', 'D']
+    assert manager.current_deck['name'] == 'D'
+
+
+def test_write_behind_snapshots_on_its_worker(tmp_path):
+    inner = make_storage(tmp_path, 'json')
+    inner.journal_limit = 5
+    save = inner.save
+    threads = []
+    saved = threading.Event()
+    
+    def recording_save(decks, current_deck_index):
+        threads.append(threading.current_thread())
+        save(decks, current_deck_index)
+        saved.set()
+    
+    inner.save = recording_save
+    manager = FlashCardManager(WriteBehindStorage(inner, delay=0.001))
+    for i in range(6):
+        manager.add_card(f'q{i}', 'a')
+    # Compaction is due once the journal the worker wrote is long enough
+    manager.flush()
+    manager.add_card('last', 'a')
+    assert saved.wait(5)
+    assert threading.current_thread() not in threads
+    before = state(manager)
+    manager.storage.close()
+    manager = open_library(tmp_path, 'json')
+    assert state(manager) == before
+
+
+def synced_state(manager):
+    # Order-free view of a device: deck names and cards by id
+    decks = {deck['id']: deck['name'] for deck in manager.decks}
+    cards = {}
+    for i, deck in enumerate(manager.decks):
+        for row in manager.deck_cards(i).rows(range(deck['count'])):
+            cards[row[-1]] = (deck['id'],) + tuple(row[:2]) + tuple(row[2:2 + len(REVIEW_FIELDS)])
+    return decks, cards
+
+
+def test_devices_converge(tmp_path):
+    server = SyncServer()
+    rng = random.Random(21)
+    
+    def open_device(n):
+        path = tmp_path / str(n)
+        path.mkdir(exist_ok=True)
+        manager = open_library(path, 'json')
+        client = SyncClient(manager, LocalTransport(server), str(path / 'sync.json'), str(path / 'sync.log'))
+        return manager, client
+    
+    devices = [open_device(n) for n in range(3)]
+    for step in range(STEPS):
+        n = rng.randrange(len(devices))
+        manager, client = devices[n]
+        action = rng.random()
+        if action < 0.6:
+            random_op(manager, rng)
+        elif action < 0.7:
+            manager.undo()
+        elif action < 0.75:
+            manager.redo()
+        elif action < 0.95:
+            client.sync()
+        else:
+            # Changes not yet pushed survive a restart through the sync log
+            manager.flush()
+            manager.storage.close()
+            devices[n] = open_device(n)
+    
+    # Two rounds: the second brings everyone what the last pushed in the first
+    for _ in range(2):
+        for manager, client in devices:
+            client.sync()
+    states = [synced_state(manager) for manager, client in devices]
+    assert states[1] == states[0]
+    assert states[2] == states[0]
+
+
+def test_import_is_one_step_and_follows_its_deck(tmp_path):
+    path = tmp_path / 'cards.csv'
+    path.write_text(''.join(f'q{i},a{i}\n' for i in range(25)), encoding='utf-8')
+    manager = open_library(tmp_path, 'json')
+    manager.add_deck('Other')
+    manager.add_deck('in')
+    before = state(manager)
+    assert list(manager.import_cards(str(path), 2, chunk_size=10))[-1] == (25, 0)
+    manager.undo()
+    assert state(manager) == before
+    manager.redo()
+    assert manager.decks[2]['count'] == 25
+    
+    # A deck before it goes between two chunks, as a sync pull may do
+    steps = manager.import_cards(str(path), 2, chunk_size=10)
+    assert next(steps) == (10, 0)
+    manager.delete_deck(0)
+    assert list(steps)[-1] == (25, 0)
+    assert [deck['count'] for deck in manager.decks] == [0, 50]
+    
+    # Deleting the deck itself stops the import
+    steps = manager.import_cards(str(path), 1, chunk_size=10)
+    next(steps)
+    manager.delete_deck(1)
+    with pytest.raises(ValueError):
+        next(steps)
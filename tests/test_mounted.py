@@ -0,0 +1,82 @@
+import os
+
+import pytest
+
+from flashcards import CardColumns, FlashCardManager, JsonStorage, SqliteStorage
+from flashcards.binary import write_deck_file
+
+
+def make_storage(path, backend):
+    if backend == 'sqlite':
+        return SqliteStorage(str(path / 'f.db'), str(path / 'none.json'), str(path / 'none.journal'))
+    return JsonStorage(str(path / 'f.json'), str(path / 'f.journal'), str(path / 'f.index.json'))
+
+
+def write_reference(path, count=20):
+    cards = CardColumns.from_rows((f'q{i}', f'a{i}', 0.0, 0.0, 2.5, 0) for i in range(count))
+    write_deck_file(str(path), 'Référence', cards)
+
+
+@pytest.mark.parametrize('backend', ['json', 'sqlite'])
+def test_missing_file_leaves_deck_unavailable(tmp_path, backend):
+    reference = tmp_path / 'ref.bin'
+    write_reference(reference)
+    manager = FlashCardManager(make_storage(tmp_path, backend))
+    manager.mount_deck(str(reference))
+    manager.set_current_deck(1)
+    manager.edit_card(3, 'q3', 'edited')
+    manager.save_decks()
+    manager.storage.close()
+    
+    os.rename(reference, tmp_path / 'moved.bin')
+    manager = FlashCardManager(make_storage(tmp_path, backend))
+    assert [deck['name'] for deck in manager.decks] == ['Mes Cartes', 'Référence']
+    assert manager.deck_unavailable(1)
+    assert len(manager.deck_cards(1)) == 0 and manager.decks[1]['count'] == 0
+    with pytest.raises(TypeError):
+        manager.add_card('new', 'card')
+    # Saved again while unavailable, the overlay is kept
+    manager.save_decks()
+    manager.storage.close()
+    
+    os.rename(tmp_path / 'moved.bin', reference)
+    manager = FlashCardManager(make_storage(tmp_path, backend))
+    assert manager.deck_unavailable(1) is None
+    assert len(manager.deck_cards(1)) == 20
+    assert manager.deck_cards(1)[3].answer == 'edited'
+
+
+def test_file_is_checked_once_until_it_changes(tmp_path, monkeypatch):
+    from flashcards import mounted
+    reference = tmp_path / 'ref.bin'
+    write_reference(reference)
+    checks = []
+    checksum_ok = mounted.file_checksum_ok
+    monkeypatch.setattr(mounted, 'file_checksum_ok', lambda path: checks.append(path) or checksum_ok(path))
+    
+    manager = FlashCardManager(make_storage(tmp_path, 'sqlite'))
+    manager.mount_deck(str(reference))
+    assert len(checks) == 1
+    manager.storage.close()
+    for _ in range(2):
+        manager = FlashCardManager(make_storage(tmp_path, 'sqlite'))
+        manager.storage.close()
+    assert len(checks) == 1
+    
+    # Rewritten in place: checked again, and found damaged
+    data = bytearray(reference.read_bytes())
+    data[20] ^= 1
+    reference.write_bytes(bytes(data))
+    manager = FlashCardManager(make_storage(tmp_path, 'sqlite'))
+    assert len(checks) == 2
+    assert 'checksum' in manager.deck_unavailable(1)
+
+
+def test_mount_updates_duplicate_index(tmp_path):
+    reference = tmp_path / 'ref.bin'
+    write_reference(reference)
+    manager = FlashCardManager(make_storage(tmp_path, 'json'))
+    manager.add_card('q5', 'mine')
+    assert manager.find_duplicates('q5')[0] == [('Mes Cartes', 1)]
+    manager.mount_deck(str(reference))
+    assert manager.find_duplicates('q5')[0] == [('Mes Cartes', 1), ('Référence', 1)]
@@ -0,0 +1,58 @@
+from types import SimpleNamespace
+
+import pytest
+
+from flashcards import FlashCardManager, JsonStorage
+
+pytest.importorskip('kivy')
+
+
+def manage_screen(manager):
+    # Just what ManageCardsScreen.refresh_list reads, without a window
+    return SimpleNamespace(
+        manager_ref=manager,
+        cards_view=SimpleNamespace(data=[], cards=None, refresh_from_data=lambda: None),
+        search_input=SimpleNamespace(text=''),
+        filtered=False,
+        show_empty_state=lambda empty: None,
+        undo_btn=SimpleNamespace(disabled=True),
+        redo_btn=SimpleNamespace(disabled=True)
+    )
+
+
+def test_card_rows_follow_a_deck_that_shrinks(tmp_path):
+    from main import ManageCardsScreen
+    manager = FlashCardManager(JsonStorage(str(tmp_path / 'f.json'), str(tmp_path / 'f.journal'),
+                                           str(tmp_path / 'f.index.json')))
+    for i in range(3):
+        manager.add_card(f'q{i}', 'a')
+    screen = manage_screen(manager)
+    ManageCardsScreen.refresh_list(screen)
+    assert len(screen.cards_view.data) == 3
+    
+    # Undo shrinks the same cards object the rows were built for
+    cards = manager.cards
+    manager.undo()
+    assert manager.cards is cards
+    ManageCardsScreen.refresh_list(screen)
+    assert len(screen.cards_view.data) == len(cards) == 2
+    manager.redo()
+    ManageCardsScreen.refresh_list(screen)
+    assert len(screen.cards_view.data) == 3
+
+
+def test_study_card_is_found_again_after_a_remote_delete(tmp_path):
+    from main import StudyScreen
+    manager = FlashCardManager(JsonStorage(str(tmp_path / 'f.json'), str(tmp_path / 'f.journal'),
+                                           str(tmp_path / 'f.index.json')))
+    for i in range(3):
+        manager.add_card(f'q{i}', 'a')
+    manager.current_card_index = 1
+    screen = SimpleNamespace(manager_ref=manager, card_id=manager.get_current_card().id)
+    
+    # As a pulled delete of the card before it would leave things
+    manager.delete_card(0)
+    assert StudyScreen.locate_card(screen).question == 'q1'
+    assert manager.current_card_index == 0
+    manager.delete_card(0)
+    assert StudyScreen.locate_card(screen) is None
@@ -0,0 +1,148 @@
+import random
+import time
+
+from flashcards import FlashCardManager, JsonStorage
+from flashcards.search import search_tokens
+
+WORDS = ['maison', 'été', 'château', 'forêt', 'cœur', 'élève', 'fenêtre', 'garçon', 'hôpital', 'œuvre']
+
+
+def brute_search(cards, query):
+    tokens = search_tokens(query)
+    matches = []
+    for i, card in enumerate(cards):
+        words = search_tokens(card.question) + search_tokens(card.answer)
+        if all(any(word.startswith(token) for word in words) for token in tokens):
+            matches.append(i)
+    return matches
+
+
+def make_manager(tmp_path, count, rng):
+    manager = FlashCardManager(JsonStorage(str(tmp_path / 'f.json'), str(tmp_path / 'f.journal'),
+                                           str(tmp_path / 'f.index.json')))
+    rows = [[' '.join(rng.choices(WORDS, k=3)), ' '.join(rng.choices(WORDS, k=4))] for _ in range(count)]
+    manager.commit({'op': 'add_cards', 'deck': 0, 'cards': rows, 'ids': [rng.getrandbits(63) for _ in rows]})
+    return manager
+
+
+def test_accents_and_ligatures_fold():
+    assert search_tokens('Été, Œuvre!') == ['ete', 'oeuvre']
+
+
+def test_index_follows_card_changes(tmp_path):
+    rng = random.Random(7)
+    manager = make_manager(tmp_path, 300, rng)
+    manager.add_deck('B')
+    manager.clear_history()
+    queries = ['ete', 'chat for', 'oeuv gar', 'zz']
+    # Built before the changes, so every one of them updates it in place
+    manager.search_cards('ete')
+    manager.search_cards('ete', 1)
+    for step in range(200):
+        count = len(manager.cards)
+        choice = rng.randrange(7)
+        if choice == 0:
+            manager.delete_card(rng.randrange(count))
+        elif choice == 1:
+            manager.delete_many(rng.sample(range(count), 3))
+        elif choice == 2:
+            manager.edit_card(rng.randrange(count), 'zz ' + rng.choice(WORDS), rng.choice(WORDS))
+        elif choice == 3:
+            manager.add_card(rng.choice(WORDS), 'zz')
+        elif choice == 4:
+            manager.move_cards_between_decks(0, rng.sample(range(count), 2), 1)
+        elif choice == 5:
+            manager.undo()
+        else:
+            manager.redo()
+        for query in queries:
+            for index in (0, 1):
+                assert manager.search_cards(query, index) == brute_search(manager.deck_cards(index), query)
+    ids = manager.cards.columns['id']
+    assert [manager.card_index(card_id) for card_id in ids] == list(range(len(ids)))
+
+
+def test_delete_keeps_index(tmp_path):
+    manager = make_manager(tmp_path, 50, random.Random(3))
+    manager.search_cards('ete')
+    index = manager.current_deck['search']
+    manager.delete_card(10)
+    manager.delete_many([0, 1, 2])
+    assert manager.current_deck['search'] is index
+    assert manager.search_cards('ete') == brute_search(manager.cards, 'ete')
+
+
+def test_duplicate_report_scales_on_single_words():
+    # Vocabulary decks: short questions leave most MinHash bins empty,
+    # which must not pile them into shared buckets
+    from flashcards.search import DuplicateIndex
+    
+    rng = random.Random(0)
+    index = DuplicateIndex()
+    for _ in range(8000):
+        index.add(1, ''.join(rng.choices('abcdefghijklmnopqrstuvwxyz', k=rng.randint(4, 8))))
+    assert max(len(bucket) for bucket in index.buckets.values()) <= 32
+    start = time.perf_counter()
+    index.report()
+    assert time.perf_counter() - start < 2.0
+
+
+def test_near_duplicates_found():
+    from flashcards.search import DuplicateIndex
+    
+    index = DuplicateIndex()
+    index.add(1, 'Quelle est la capitale du Portugal ?')
+    index.add(2, 'Quelle est la capitale du Portugal')
+    index.add(2, 'Quelle est la capitale de la Portugal')
+    index.add(1, 'chat')
+    index.add(1, 'chien')
+    exact, near = index.report()
+    assert [counts for question, counts in exact] == [{1: 1, 2: 1}]
+    assert [{a, b} for a, b, score in near] == [{'Quelle est la capitale du Portugal ?',
+                                                 'Quelle est la capitale de la Portugal'}]
+
+
+def test_duplicates_built_between_edits(tmp_path):
+    from flashcards.search import DuplicateIndex
+    
+    rng = random.Random(7)
+    manager = make_manager(tmp_path, 40, rng)
+    for name in 'BCD':
+        manager.add_deck(name)
+        manager.set_current_deck(len(manager.decks) - 1)
+        for _ in range(10):
+            manager.add_card(' '.join(rng.choices(WORDS, k=2)), 'a')
+    manager.max_loaded_decks = 2
+    
+    def edit():
+        index = rng.randrange(len(manager.decks))
+        manager.set_current_deck(index)
+        count = len(manager.cards)
+        choice = rng.randrange(6)
+        if choice == 0 or not count:
+            manager.add_card(' '.join(rng.choices(WORDS, k=2)), 'a')
+        elif choice == 1:
+            manager.edit_card(rng.randrange(count), ' '.join(rng.choices(WORDS, k=2)), 'a')
+        elif choice == 2:
+            manager.delete_many(rng.sample(range(count), min(count, 3)))
+        elif choice == 3:
+            manager.move_cards_between_decks(index, [rng.randrange(count)], rng.randrange(len(manager.decks)))
+        elif choice == 4:
+            manager.add_deck('E')
+        elif len(manager.decks) > 1:
+            manager.delete_deck(index)
+    
+    def run(step):
+        # As FlashcardApp.run_on_main, with the user editing between frames
+        for _ in range(rng.randrange(3)):
+            edit()
+        return step()
+    
+    manager.build_duplicates(run)
+    assert manager.duplicates_ready()
+    expected = DuplicateIndex()
+    for index, deck in enumerate(manager.decks):
+        for card in manager.deck_cards(index):
+            expected.add(id(deck), card.question)
+    assert manager.duplicates.decks_by_question == expected.decks_by_question
+    assert manager.duplicates.buckets == expected.buckets
@@ -0,0 +1,169 @@
+import queue
+import threading
+import time
+
+import pytest
+
+from flashcards import FlashCardManager, JsonStorage
+from flashcards.sync import LocalTransport, SyncClient, SyncServer
+
+
+class Offline:
+    def request(self, path, data):
+        raise OSError('network is unreachable')
+
+
+def open_device(path, server):
+    path.mkdir(exist_ok=True)
+    manager = FlashCardManager(JsonStorage(str(path / 'f.json'), str(path / 'f.journal'), str(path / 'f.index.json')))
+    client = SyncClient(manager, LocalTransport(server), str(path / 'sync.json'), str(path / 'sync.log'))
+    return manager, client
+
+
+def library(manager):
+    # Order-free: devices append cards in the order they learn of them
+    return sorted((deck['id'], deck['name'], tuple(sorted(card.question for card in manager.deck_cards(i))))
+                  for i, deck in enumerate(manager.decks))
+
+
+def test_new_devices_share_one_default_deck(tmp_path):
+    server = SyncServer()
+    devices = [open_device(tmp_path / str(n), server) for n in range(3)]
+    # The third was used before its first sync, so its deck is kept
+    devices[2][0].add_card('q', 'a')
+    for _ in range(2):
+        for manager, client in devices:
+            client.sync()
+    names = [[deck['name'] for deck in manager.decks] for manager, client in devices]
+    assert names == [['Mes Cartes', 'Mes Cartes']] * 3
+    assert library(devices[0][0]) == library(devices[1][0]) == library(devices[2][0])
+
+
+def test_held_back_default_deck_survives_restart(tmp_path):
+    # The first sync fails before its pull; the next one still settles the deck
+    server = SyncServer()
+    manager, client = open_device(tmp_path / 'a', server)
+    client.transport = Offline()
+    with pytest.raises(OSError):
+        client.sync()
+    manager, client = open_device(tmp_path / 'a', server)
+    client.sync()
+    other, other_client = open_device(tmp_path / 'b', server)
+    other_client.sync()
+    assert library(other) == library(manager)
+    assert [deck['name'] for deck in other.decks] == ['Mes Cartes']
+
+
+def test_devices_deleting_their_last_deck_keep_one_placeholder(tmp_path):
+    server = SyncServer()
+    a, a_client = open_device(tmp_path / 'a', server)
+    a.add_card('q', 'a')
+    a_client.sync()
+    b, b_client = open_device(tmp_path / 'b', server)
+    b_client.sync()
+    assert library(a) == library(b)
+    
+    # Both delete the shared deck, so each gets an empty one of its own
+    a.delete_deck(0)
+    b.delete_deck(0)
+    for _ in range(2):
+        a_client.sync()
+        b_client.sync()
+    assert [deck['name'] for deck in a.decks] == [deck['name'] for deck in b.decks] == ['Nouvelle Liste']
+    
+    # Once used, the deck is synced and the other device's unused one goes,
+    # after a restart too
+    b.storage.close()
+    b, b_client = open_device(tmp_path / 'b', server)
+    a.add_card('new', 'card')
+    a_client.sync()
+    b_client.sync()
+    assert library(a) == library(b)
+    assert [deck['name'] for deck in b.decks] == ['Nouvelle Liste']
+
+
+def test_study_session_follows_its_decks_through_a_sync(tmp_path):
+    server = SyncServer()
+    a, a_client = open_device(tmp_path / 'a', server)
+    for name in ('x', 'y'):
+        a.add_deck(name)
+    for index in range(3):
+        a.set_current_deck(index)
+        for n in range(2):
+            a.add_card(f'{index} {n}', 'a')
+    a_client.sync()
+    b, b_client = open_device(tmp_path / 'b', server)
+    b_client.sync()
+    
+    # Studied from y while a deletes the first deck, moving x and y up
+    b.set_current_deck([deck['name'] for deck in b.decks].index('y'))
+    now = time.time() + 1
+    session = b.start_session()
+    graded = []
+    for _ in range(2):
+        assert session.next_card(now)
+        graded.append(b.get_current_card().question)
+        session.grade(5, now)
+    a.delete_deck(0)
+    a_client.sync()
+    b_client.sync()
+    while session.next_card(now):
+        graded.append(b.get_current_card().question)
+        session.grade(5, now)
+    b.end_session()
+    
+    assert sorted(q for q in graded if not q.startswith('0')) == ['1 0', '1 1', '2 0', '2 1']
+    assert len(graded) == len(set(graded))
+    assert b.current_deck['name'] == 'y'
+
+
+def test_sync_from_worker_thread_while_editing(tmp_path):
+    server = SyncServer()
+    remote, remote_client = open_device(tmp_path / 'remote', server)
+    for i in range(50):
+        remote.add_card(f'remote {i}', 'a')
+    remote_client.sync()
+    
+    manager, client = open_device(tmp_path / 'local', server)
+    client.batch_size = 7
+    main = threading.current_thread()
+    execute = manager.execute
+    
+    def checked_execute(records):
+        assert threading.current_thread() is main
+        return execute(records)
+    
+    manager.execute = checked_execute
+    steps = queue.Queue()
+    
+    def run(step):
+        # Like FlashcardApp.run_on_main, with the loop below as the UI thread
+        done = threading.Event()
+        outcome = {}
+        
+        def call():
+            try:
+                outcome['result'] = step()
+            finally:
+                done.set()
+        
+        steps.put(call)
+        done.wait()
+        return outcome.get('result')
+    
+    worker = threading.Thread(target=client.sync, args=(run,))
+    worker.start()
+    edits = 0
+    while worker.is_alive() or not steps.empty():
+        try:
+            steps.get(timeout=0.01)()
+        except queue.Empty:
+            pass
+        manager.add_card(f'local {edits}', 'a')
+        edits += 1
+    worker.join()
+    
+    client.sync()
+    remote_client.sync()
+    assert library(remote) == library(manager)
+    assert sum(len(cards) for deck_id, name, cards in library(manager)) == 50 + edits